@@ -0,0 +1,205 @@
+"""AI backends that turn a prompt (and optionally an image) into JSON text.
+
+``AI_PROVIDER`` picks the backend:
+
+- ``gemini``: Google Gemini. ``google.generativeai`` is imported and
+  configured on the first call, not when the app loads, so migrations,
+  management commands, tests and workers that never call the model do not
+  pay for it.
+- ``stub``: a deterministic local backend for tests and load tests. It
+  answers from the prompt alone (using the quick parser where it can),
+  optionally after ``AI_STUB_LATENCY`` seconds, and never touches the
+  network. ``AI_STUB_ERROR_RATE`` makes that share of calls fail with a
+  ``ConnectionError``, to exercise retries and the circuit breaker.
+- a dotted path to any ``AIProvider`` subclass.
+
+Every provider returns the model's raw JSON text; ``services`` parses and
+caches it.
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .quickparse import quick_parse
+
+
+class AIProvider:
+    """Parse a text prompt, or a prompt plus an image, into raw JSON text.
+
+    ``image`` is ``{"mime_type": ..., "data": bytes}``. The sync methods
+    must give up after ``timeout`` seconds (raising ``TimeoutError`` or the
+    client's deadline error); async calls are cancelled by the caller.
+    Subclasses implement the sync methods; the async ones default to running
+    them in a thread.
+    """
+
+    name = None
+
+    def parse_text(self, prompt, timeout=None):
+        raise NotImplementedError
+
+    def parse_image(self, prompt, image, timeout=None):
+        raise NotImplementedError
+
+    async def aparse_text(self, prompt):
+        return await asyncio.to_thread(self.parse_text, prompt)
+
+    async def aparse_image(self, prompt, image):
+        return await asyncio.to_thread(self.parse_image, prompt, image)
+
+
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def load_genai():
+    """Import and configure ``google.generativeai`` once, on first use."""
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+
+            genai.configure(api_key=settings.GEMINI_API_KEY)
+            _genai = genai
+    return _genai
+
+
+class GeminiProvider(AIProvider):
+    name = "gemini"
+    model_name = "gemini-2.5-flash"
+
+    def __init__(self, model=None):
+        # ``model`` replaces the Gemini model (anything with
+        # ``generate_content``/``generate_content_async``), e.g. in tests.
+        self._model = model
+
+    def model(self):
+        if self._model is not None:
+            return self._model
+        genai = load_genai()
+        return genai.GenerativeModel(self.model_name, generation_config={"response_mime_type": "application/json"})
+
+    @staticmethod
+    def _options(timeout):
+        return {"request_options": {"timeout": timeout}} if timeout else {}
+
+    def parse_text(self, prompt, timeout=None):
+        return self.model().generate_content(prompt, **self._options(timeout)).text
+
+    def parse_image(self, prompt, image, timeout=None):
+        return self.model().generate_content([prompt, image], **self._options(timeout)).text
+
+    async def aparse_text(self, prompt):
+        return (await self.model().generate_content_async(prompt)).text
+
+    async def aparse_image(self, prompt, image):
+        return (await self.model().generate_content_async([prompt, image])).text
+
+
+class StubProvider(AIProvider):
+    """Deterministic answers read off the prompts built in ``prompts``."""
+
+    name = "stub"
+
+    def __init__(self, latency=None, error_rate=None):
+        self._latency = latency
+        self._error_rate = error_rate
+
+    @property
+    def latency(self):
+        return settings.AI_STUB_LATENCY if self._latency is None else self._latency
+
+    @property
+    def error_rate(self):
+        return settings.AI_STUB_ERROR_RATE if self._error_rate is None else self._error_rate
+
+    def _maybe_fail(self):
+        if self.error_rate and random.random() < self.error_rate:
+            raise ConnectionError("Injected stub failure")
+
+    @staticmethod
+    def _field(prompt, label):
+        match = re.search(rf"^{label}: (.*)$", prompt, re.MULTILINE)
+        return match.group(1).strip() if match else ""
+
+    def _people(self, prompt):
+        members = re.sub(r" \(\+\d+ more\)$", "", self._field(prompt, "Members"))
+        return [name for name in members.split(", ") if name], self._field(prompt, "Current user")
+
+    @staticmethod
+    def _guess(text, payer):
+        amount = re.search(r"\d+(?:\.\d+)?", text)
+        return {
+            "description": " ".join(re.sub(r"[\d.,]+", " ", text).split()[:4]).capitalize() or "Expense",
+            "amount": float(amount.group()) if amount else 0,
+            "payer_name": payer,
+            "splits": [],
+            "category": "Miscellaneous",
+        }
+
+    def _parse_one(self, text, members, user):
+        return quick_parse(text, members, user).parsed or self._guess(text, user)
+
+    def _answer_text(self, prompt):
+        members, user = self._people(prompt)
+        batch = re.search(r"^Input:\n((?:\d+\. .*(?:\n|$))+)", prompt, re.MULTILINE)
+        if batch:
+            lines = re.findall(r"^(\d+)\. (.*)$", batch.group(1), re.MULTILINE)
+            return json.dumps([{**self._parse_one(text, members, user), "line": int(n)} for n, text in lines])
+        return json.dumps(self._parse_one(self._field(prompt, "Input").strip('"'), members, user))
+
+    def _answer_image(self, prompt, image):
+        members, user = self._people(prompt)
+        context = self._field(prompt, "Additional context")
+        parsed = quick_parse(context, members, user).parsed if context != "None" else None
+        if parsed is None:
+            # Same image, same answer.
+            parsed = self._guess("Receipt", user)
+            parsed["amount"] = 100 + sum(image["data"][:64]) % 900
+        return json.dumps(parsed)
+
+    def _wait(self, timeout):
+        if timeout is not None and self.latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Stub answer takes {self.latency:g}s")
+        time.sleep(self.latency)
+        self._maybe_fail()
+
+    def parse_text(self, prompt, timeout=None):
+        self._wait(timeout)
+        return self._answer_text(prompt)
+
+    def parse_image(self, prompt, image, timeout=None):
+        self._wait(timeout)
+        return self._answer_image(prompt, image)
+
+    async def aparse_text(self, prompt):
+        await asyncio.sleep(self.latency)
+        self._maybe_fail()
+        return self._answer_text(prompt)
+
+    async def aparse_image(self, prompt, image):
+        await asyncio.sleep(self.latency)
+        self._maybe_fail()
+        return self._answer_image(prompt, image)
+
+
+PROVIDERS = {"gemini": GeminiProvider, "stub": StubProvider}
+
+_providers = {}
+
+
+def get_provider(name=None):
+    """The provider instance for ``name`` (default ``AI_PROVIDER``), created once per process."""
+    name = name or settings.AI_PROVIDER
+    provider = _providers.get(name)
+    if provider is None:
+        cls = PROVIDERS.get(name) or import_string(name)
+        provider = _providers[name] = cls()
+    return provider
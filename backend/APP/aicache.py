@@ -0,0 +1,63 @@
+"""Content-addressed cache of AI parse results.
+
+Resubmitting the same text, or retrying a receipt upload after a timeout,
+would otherwise cost a fresh Gemini call. Results are keyed by a hash of
+everything the prompt depends on: the normalised text (or a hash of the
+receipt's bytes), the current user, the group's members and their
+balances. When any of those change, the key changes, so entries never need
+invalidating. They expire after ``AI_CACHE_TTL`` and are evicted
+least-recently-used beyond ``AI_CACHE_SIZE``.
+
+The model's raw JSON is stored, so every hit returns a fresh dict that
+callers may mutate.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+
+from .metrics import Counter, register_collector
+from .ttlcache import TTLCache
+
+parse_cache = TTLCache(maxsize=settings.AI_CACHE_SIZE, ttl=settings.AI_CACHE_TTL)
+
+LOOKUPS = Counter("spendsplit_ai_cache_lookups_total", "AI parse cache lookups by input kind and result.")
+
+
+def normalize_text(text):
+    return " ".join((text or "").lower().split())
+
+
+def _key(*parts):
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+def text_key(text_input, current_user_name, context):
+    return _key("text", normalize_text(text_input), current_user_name, context)
+
+
+def receipt_key(image_digest, text_context, current_user_name, context):
+    return _key("receipt", image_digest, normalize_text(text_context), current_user_name, context)
+
+
+def get(key, kind):
+    raw = parse_cache.get(key)
+    LOOKUPS.inc(kind=kind, result="hit" if raw is not None else "miss")
+    return json.loads(raw) if raw is not None else None
+
+
+def put(key, raw_json):
+    parse_cache.set(key, raw_json)
+
+
+@register_collector
+def _parse_cache_stats():
+    stats = parse_cache.stats()
+    return [
+        "# HELP spendsplit_ai_cache_entries AI parse results currently cached in this process.",
+        "# TYPE spendsplit_ai_cache_entries gauge",
+        f"spendsplit_ai_cache_entries {stats['size']}",
+        "# HELP spendsplit_ai_cache_hit_ratio Share of AI parse cache lookups that hit, since start.",
+        "# TYPE spendsplit_ai_cache_hit_ratio gauge",
+        f"spendsplit_ai_cache_hit_ratio {stats['hit_rate']}",
+    ]
@@ -1,43 +1,37 @@
-from ninja import NinjaAPI, Schema, File, UploadedFile, Form
+from ninja import NinjaAPI, Schema, File, UploadedFile, Form, Query
+from ninja.renderers import JSONRenderer
 from typing import List, Optional
-from django.shortcuts import get_object_or_404
-from .models import Group, Expense, User, GroupMember, GroupLog, ExpenseSplit
-from django.db.models import Sum, Count
-from datetime import datetime
-from functools import wraps
-from django.views.decorators.cache import cache_page
+from django.shortcuts import get_object_or_404, aget_object_or_404
+from asgiref.sync import sync_to_async
+from .models import Group, Expense, User, GroupMember, GroupLog, ExpenseSplit, AIParseJob
+from django.db.models import Sum, Count, Max, Q, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from datetime import date, datetime, timedelta
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.conf import settings
+from django.utils import timezone
+from django.utils.text import slugify
 from django.core.signing import TimestampSigner, SignatureExpired, BadSignature
 from urllib.parse import unquote
+from .pagination import DEFAULT_PAGE_SIZE, InvalidCursor, keyset_page
+from .caching import cache_per_group_version
+from .metrics import timed
+from . import exporter
+import math
 import os
 
 signer = TimestampSigner()
 
-api = NinjaAPI()
 
+class TimedJSONRenderer(JSONRenderer):
+    def render(self, request, data, *, response_status):
+        with timed("render"):
+            return super().render(request, data, response_status=response_status)
 
-def cache_page_per_user(timeout_seconds: int):
-    """Cache a view response per authenticated user.
 
-    NOTE: Using Django's plain @cache_page on auth-protected endpoints can leak data
-    across users because the default cache key does not vary on Authorization.
-    """
-
-    def decorator(view_func):
-        @wraps(view_func)
-        def _wrapped(request, *args, **kwargs):
-            user = getattr(request, "user", None)
-            if not user or not getattr(user, "is_authenticated", False):
-                return view_func(request, *args, **kwargs)
-
-            # URL already contains group_id for analysis endpoints; prefix isolates users.
-            key_prefix = f"user:{user.pk}"
-            return cache_page(timeout_seconds, key_prefix=key_prefix)(view_func)(
-                request, *args, **kwargs
-            )
+api = NinjaAPI(renderer=TimedJSONRenderer())
 
-        return _wrapped
-
-    return decorator
 
 class UserSchema(Schema):
     name: str
@@ -78,42 +72,53 @@ class GroupSchema(Schema):
     def resolve_is_owner(obj, context):
         request = context.get('request')
         if request and request.user:
-            return obj.owner == request.user
+            return obj.owner_id == request.user.pk
         return False
 
+    # The remaining fields are read from annotations added by group_queryset(),
+    # so serializing a list of groups costs no extra queries per group.
     @staticmethod
     def resolve_totalTransactions(obj):
-        return obj.expenses.count()
+        return obj.total_transactions
 
     @staticmethod
     def resolve_approvedTransactions(obj):
-        return obj.expenses.filter(status='APPROVED').count()
+        return obj.approved_transactions
 
     @staticmethod
     def resolve_pendingTransactions(obj):
-        return obj.expenses.filter(status='PENDING').count()
+        return obj.pending_transactions
 
     @staticmethod
     def resolve_netAmount(obj):
         # This is a simplified calculation. 
         # In a real app, this would depend on the user's perspective.
         # For now, returning total expense amount.
-        total = obj.expenses.filter(status='APPROVED').aggregate(Sum('amount'))['amount__sum']
-        return float(total or 0.0)
+        return float(obj.net_amount or 0.0)
 
     @staticmethod
     def resolve_memberCount(obj):
-        return obj.members.count()
+        return obj.member_count
 
     @staticmethod
     def resolve_lastActivity(obj):
-        last_expense = obj.expenses.order_by('-created_at').first()
-        if last_expense:
-            # Return a human readable string or ISO format
-            # For simplicity, returning ISO format, frontend can format it
-            return last_expense.created_at.isoformat()
-        # Return group creation date as fallback
-        return obj.created_at.isoformat()
+        # ISO format, frontend formats it. Falls back to the group creation date.
+        return (obj.last_expense_at or obj.created_at).isoformat()
+
+def group_queryset(user):
+    """Groups of ``user`` annotated with everything GroupSchema needs."""
+    member_count = (
+        GroupMember.objects.filter(group=OuterRef('pk'))
+        .order_by().values('group').annotate(count=Count('*')).values('count')
+    )
+    return Group.objects.filter(members=user).annotate(
+        total_transactions=Count('expenses'),
+        approved_transactions=Count('expenses', filter=Q(expenses__status='APPROVED')),
+        pending_transactions=Count('expenses', filter=Q(expenses__status='PENDING')),
+        net_amount=Sum('expenses__amount', filter=Q(expenses__status='APPROVED')),
+        last_expense_at=Max('expenses__created_at'),
+        member_count=Coalesce(Subquery(member_count), 0),
+    )
 
 class GroupCreateSchema(Schema):
     name: str
@@ -125,17 +130,17 @@ class GroupUpdateSchema(Schema):
     min_floor: Optional[float] = None
 
 @api.get("/groups", response=List[GroupSchema])
-@cache_page_per_user(60 * 5)
+@cache_per_group_version(60 * 60 * 24)
 def list_groups(request):
     # Return groups where the authenticated user is a member
     user = request.user
-    return user.groups.all()
+    return group_queryset(user)
 
 @api.get("/groups/{group_id}", response=GroupSchema)
 def get_group(request, group_id: int):
     # Ensure user has access to this group
     user = request.user
-    return get_object_or_404(Group, id=group_id, members=user)
+    return get_object_or_404(group_queryset(user), id=group_id)
 
 @api.post("/groups", response=GroupSchema)
 def create_group(request, payload: GroupCreateSchema):
@@ -143,7 +148,7 @@ def create_group(request, payload: GroupCreateSchema):
     group = Group.objects.create(owner=user, **payload.dict())
     # Automatically add the creator as a member
     GroupMember.objects.create(group=group, user=user)
-    return group
+    return group_queryset(user).get(pk=group.pk)
 
 @api.put("/groups/{group_id}", response=GroupSchema)
 def update_group(request, group_id: int, payload: GroupUpdateSchema):
@@ -152,7 +157,7 @@ def update_group(request, group_id: int, payload: GroupUpdateSchema):
     for attr, value in payload.dict(exclude_unset=True).items():
         setattr(group, attr, value)
     group.save()
-    return group
+    return group_queryset(user).get(pk=group.pk)
 
 @api.delete("/groups/{group_id}")
 def delete_group(request, group_id: int):
@@ -250,7 +255,7 @@ def join_group(request, payload: JoinGroupSchema):
         else:
             print(f"DEBUG: User {user.name} already a member of {group.name}")
             
-        return group
+        return group_queryset(user).get(pk=group.pk)
         
     except SignatureExpired:
         print("DEBUG: Token expired")
@@ -259,7 +264,7 @@ def join_group(request, payload: JoinGroupSchema):
         print("DEBUG: Invalid token signature")
         return api.create_response(request, {'message': 'Invalid link'}, status=403)
 
-from .models import Group, Expense, User, GroupMember, GroupLog, ExpenseSplit
+from .models import Group, Expense, User, GroupMember, GroupLog, ExpenseSplit, AIParseJob
 
 class ExpenseSchema(Schema):
     id: int
@@ -275,18 +280,35 @@ class ExpenseSchema(Schema):
 class ExpenseResponseSchema(Schema):
     action: str
 
-@api.get("/groups/{group_id}/expenses", response=List[ExpenseSchema])
-def list_group_expenses(request, group_id: int):
+class ExpensePageSchema(Schema):
+    items: List[ExpenseSchema]
+    next_cursor: Optional[str] = None
+
+class GroupLogPageSchema(Schema):
+    items: List[GroupLogSchema]
+    next_cursor: Optional[str] = None
+
+@api.get("/groups/{group_id}/expenses", response=ExpensePageSchema)
+def list_group_expenses(request, group_id: int, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE):
     user = request.user
     # Verify user is a member of this group
     group = get_object_or_404(Group, id=group_id, members=user)
-    expenses = Expense.objects.filter(group=group).order_by('-created_at')
-    
-    for expense in expenses:
-        split = expense.splits.filter(user=user).first()
-        expense.user_approval_status = split.status if split else "NOT_INVOLVED"
-        
-    return expenses
+
+    # The caller's own split status comes from a subquery so the whole list
+    # is a single query regardless of how many expenses the group has.
+    user_split_status = ExpenseSplit.objects.filter(
+        expense=OuterRef('pk'), user=user
+    ).order_by('id').values('status')[:1]
+
+    expenses = (
+        Expense.objects.filter(group=group)
+        .select_related('payer')
+        .annotate(user_approval_status=Coalesce(Subquery(user_split_status), Value("NOT_INVOLVED")))
+    )
+    try:
+        return keyset_page(expenses, cursor, limit)
+    except InvalidCursor as e:
+        return api.create_response(request, {"error": str(e)}, status=400)
 
 @api.post("/expenses/{expense_id}/respond")
 def respond_to_expense(request, expense_id: int, payload: ExpenseResponseSchema):
@@ -347,89 +369,293 @@ def delete_expense(request, expense_id: int):
     expense.delete()
     return {"success": True}
 
-@api.get("/groups/{group_id}/logs", response=List[GroupLogSchema])
-def list_group_logs(request, group_id: int):
+@api.get("/groups/{group_id}/logs", response=GroupLogPageSchema)
+def list_group_logs(request, group_id: int, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE):
     user = request.user
     # Verify user is a member of this group
     group = get_object_or_404(Group, id=group_id, members=user)
-    return GroupLog.objects.filter(group=group).order_by('-created_at')
+    try:
+        return keyset_page(GroupLog.objects.filter(group=group), cursor, limit)
+    except InvalidCursor as e:
+        return api.create_response(request, {"error": str(e)}, status=400)
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", exporter.csv_lines),
+    "ndjson": ("application/x-ndjson", exporter.ndjson_lines),
+}
+
+@api.get("/groups/{group_id}/export")
+def export_group_expenses(request, group_id: int, format: str = "csv", start: Optional[date] = None, end: Optional[date] = None):
+    user = request.user
+    # Verify user is a member of this group
+    group = get_object_or_404(Group, id=group_id, members=user)
+    if format not in EXPORT_FORMATS:
+        return api.create_response(request, {"error": "format must be csv or ndjson"}, status=400)
+
+    # Inclusive dates in the server's time zone -> half-open datetime range
+    def midnight(day):
+        return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+    content_type, render = EXPORT_FORMATS[format]
+    rows = exporter.expense_rows(
+        group.id,
+        start=midnight(start) if start else None,
+        end=midnight(end + timedelta(days=1)) if end else None,
+    )
+    content = exporter.batched(render(rows))
+    if isinstance(request, ASGIRequest):
+        content = exporter.aiterate(content)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{slugify(group.name) or "group"}-expenses.{format}"'
+    return response
 
 class AIExpenseCreateSchema(Schema):
     text_input: str
 
-from .services import parse_expense_with_ai, create_expense_from_parsed_data, parse_receipt_with_ai
+class AIJobSchema(Schema):
+    id: int
+    kind: str
+    status: str
+    error: Optional[str] = None
+    expense: Optional[ExpenseSchema] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+from .services import (
+    AITimeout, AIUnavailable, MAX_BATCH_LINES, aparse_batch_with_ai, aparse_expense_with_ai, aparse_receipt_with_ai,
+    create_expense_from_parsed_data, create_expenses_from_batch, import_expenses, split_batch_lines,
+)
+from .importer import ImportFormatError, read_rows
+from .imaging import ImageTooLarge
+from . import jobs
+
+
+def ai_unavailable(request, error):
+    """503 for an AI outage, with a Retry-After for when the breaker next lets a call through."""
+    response = api.create_response(request, {"error": str(error)}, status=503)
+    response["Retry-After"] = str(math.ceil(settings.AI_BREAKER_RESET_SECONDS))
+    return response
 
-@api.post("/groups/{group_id}/expenses/ai", response=ExpenseSchema)
-def create_expense_ai(request, group_id: int, payload: AIExpenseCreateSchema):
+
+# The AI endpoints are async: under ASGI a request waiting on Gemini holds no
+# thread. Database work runs through sync_to_async; services.agenerate caps
+# concurrent model calls and times them out (504).
+
+@api.post("/groups/{group_id}/expenses/ai", response={200: ExpenseSchema, 202: AIJobSchema})
+async def create_expense_ai(request, group_id: int, payload: AIExpenseCreateSchema, run_async: bool = Query(False, alias="async")):
     user = request.user
     # Verify user is a member of this group
-    group = get_object_or_404(Group, id=group_id, members=user)
+    group = await aget_object_or_404(Group, id=group_id, members=user)
+
+    if run_async:
+        # Queue the parse for run_ai_worker; poll /expenses/jobs/{id} for the result
+        return 202, await sync_to_async(jobs.enqueue_text)(group, user, payload.text_input)
     
     # Use authenticated user's name
-    parsed = parse_expense_with_ai(payload.text_input, group_id, user.name)
+    try:
+        parsed = await aparse_expense_with_ai(payload.text_input, group_id, user.name)
+    except AITimeout as e:
+        return api.create_response(request, {"error": str(e)}, status=504)
+    except AIUnavailable as e:
+        return ai_unavailable(request, e)
     if not parsed:
          return api.create_response(request, {"error": "Failed to parse"}, status=400)
     
     try:
-        expense = create_expense_from_parsed_data(group_id, parsed)
+        expense = await sync_to_async(create_expense_from_parsed_data)(group_id, parsed)
         return expense
     except Exception as e:
         return api.create_response(request, {"error": str(e)}, status=400)
 
-@api.post("/groups/{group_id}/expenses/ocr", response=ExpenseSchema)
-def create_expense_ocr(request, group_id: int, file: UploadedFile = File(...), text_input: str = Form(None)):
+@api.post("/groups/{group_id}/expenses/ocr", response={200: ExpenseSchema, 202: AIJobSchema})
+async def create_expense_ocr(request, group_id: int, file: UploadedFile = File(...), text_input: str = Form(None), run_async: bool = Query(False, alias="async")):
     user = request.user
     # Verify user is a member of this group
-    group = get_object_or_404(Group, id=group_id, members=user)
+    group = await aget_object_or_404(Group, id=group_id, members=user)
+
+    if run_async:
+        try:
+            return 202, await sync_to_async(jobs.enqueue_receipt)(group, user, file, text_context=text_input)
+        except ImageTooLarge as e:
+            return api.create_response(request, {"error": str(e)}, status=413)
     
     # Parse receipt with AI
-    parsed = parse_receipt_with_ai(file.file, group_id, user.name, text_context=text_input)
+    try:
+        parsed = await aparse_receipt_with_ai(file.file, group_id, user.name, text_context=text_input)
+    except AITimeout as e:
+        return api.create_response(request, {"error": str(e)}, status=504)
+    except AIUnavailable as e:
+        return ai_unavailable(request, e)
+    except ImageTooLarge as e:
+        return api.create_response(request, {"error": str(e)}, status=413)
     
     if not parsed:
          return api.create_response(request, {"error": "Failed to parse receipt"}, status=400)
     
     try:
-        expense = create_expense_from_parsed_data(group_id, parsed)
+        expense = await sync_to_async(create_expense_from_parsed_data)(group_id, parsed)
         return expense
     except Exception as e:
         return api.create_response(request, {"error": str(e)}, status=400)
 
+class AIBatchLineSchema(Schema):
+    line: int
+    text: str
+    expense: Optional[ExpenseSchema] = None
+    error: Optional[str] = None
+
+class AIBatchResultSchema(Schema):
+    created: int
+    results: List[AIBatchLineSchema]
+
+@api.post("/groups/{group_id}/expenses/ai/batch", response=AIBatchResultSchema)
+async def create_expenses_ai_batch(request, group_id: int, payload: AIExpenseCreateSchema):
+    user = request.user
+    # Verify user is a member of this group
+    group = await aget_object_or_404(Group, id=group_id, members=user)
+
+    # One expense per line (or ';'); parsed together, created in one transaction
+    lines = split_batch_lines(payload.text_input)
+    if not lines:
+        return api.create_response(request, {"error": "No expenses found"}, status=400)
+    if len(lines) > MAX_BATCH_LINES:
+        return api.create_response(request, {"error": f"At most {MAX_BATCH_LINES} lines per batch"}, status=400)
+
+    parsed = await aparse_batch_with_ai(lines, group_id, user.name)
+    results = await sync_to_async(create_expenses_from_batch)(group_id, lines, parsed)
+    return {"created": sum(1 for r in results if r["expense"] is not None), "results": results}
+
+class ImportErrorSchema(Schema):
+    row: int
+    error: str
+
+class ImportResultSchema(Schema):
+    created: int
+    errors: List[ImportErrorSchema]
+
+@api.post("/groups/{group_id}/expenses/import", response={200: ImportResultSchema, 400: ImportResultSchema, 413: ImportResultSchema})
+def import_group_expenses(request, group_id: int, file: UploadedFile = File(...)):
+    user = request.user
+    # Verify user is a member of this group
+    group = get_object_or_404(Group, id=group_id, members=user)
+
+    # The whole file is parsed in memory, so check its size first (and never
+    # read past the limit, whatever size the upload claims).
+    limit = settings.IMPORT_MAX_UPLOAD_BYTES
+    too_large = {"created": 0, "errors": [{"row": 0, "error": f"Imports are limited to {limit} bytes"}]}
+    if (file.size or 0) > limit:
+        return 413, too_large
+    data = file.read(limit + 1)
+    if len(data) > limit:
+        return 413, too_large
+
+    # CSV or JSON history; nothing is created unless every row is valid
+    try:
+        rows = read_rows(data, file.name or "")
+    except (ImportFormatError, UnicodeDecodeError) as e:
+        return 400, {"created": 0, "errors": [{"row": 0, "error": str(e)}]}
+
+    created, errors = import_expenses(group.id, rows)
+    if errors:
+        return 400, {"created": 0, "errors": errors[:100]}
+    return {"created": created, "errors": []}
+
+@api.get("/groups/{group_id}/expenses/jobs/{job_id}", response=AIJobSchema)
+def get_ai_job(request, group_id: int, job_id: int):
+    user = request.user
+    # Verify user is a member of this group
+    group = get_object_or_404(Group, id=group_id, members=user)
+    return get_object_or_404(AIParseJob.objects.select_related('expense__payer'), id=job_id, group=group)
+
 from .services import get_unified_fairness_analysis
+from .ledger import month_start
+from . import periods, rollups
 
 @api.get("/groups/{group_id}/analysis")
-@cache_page_per_user(60 * 5)
-def get_group_analysis(request, group_id: int):
+@cache_per_group_version(60 * 60 * 24, vary=periods.cache_dates)
+def get_group_analysis(request, group_id: int, period: Optional[str] = None, at: Optional[date] = None,
+                       start: Optional[date] = None, end: Optional[date] = None, tz: Optional[str] = None):
+    """Fairness analysis for a period.
+
+    Without parameters: this calendar month, or the whole trip for SHORT
+    groups. ``period`` is month, week (``at`` picks which, default today),
+    lifetime or range (``start``..``end``); ``tz`` is the user's time zone.
+    """
     user = request.user
     # Verify user is a member of this group
     group = get_object_or_404(Group, id=group_id, members=user)
-    
-    analysis = get_unified_fairness_analysis(group_id)
-    
-    # Enrich with member details for frontend (tx count, etc)
-    # This logic is here to avoid modifying the core fairness service function
-    members = group.members.all()
-    now = datetime.now()
-    
-    member_details = []
-    balances = analysis.get("balances", {})
-    
-    for user in members:
-        # Calculate transaction count for this user in this month
-        # We need to replicate the filter logic from services roughly or just count all for now?
-        # The service uses current month. Let's stick to that.
-        tx_count = Expense.objects.filter(
-            group=group,
-            payer=user,
-            created_at__year=now.year,
-            created_at__month=now.month
-        ).count()
-        
-        member_details.append({
-            "id": user.id,
-            "name": user.name,
-            "balance": balances.get(user.name, 0.0),
-            "transaction_count": tx_count
-        })
-        
-    analysis["member_details"] = member_details
-    return analysis
+    try:
+        chosen = periods.parse_period(group, period, tz=tz, at=at, start=start, end=end)
+    except ValueError as e:
+        return api.create_response(request, {"error": str(e)}, status=400)
+
+    def analyse():
+        analysis = get_unified_fairness_analysis(group.id, chosen)
+
+        # Enrich with member details for frontend (tx count, etc)
+        # This logic is here to avoid modifying the core fairness service function
+        tx_counts = periods.transaction_counts(group.id, chosen)
+        balances = analysis.get("balances", {})
+        analysis["member_details"] = [
+            {
+                "id": member.id,
+                "name": member.name,
+                "balance": balances.get(member.name, 0.0),
+                "transaction_count": tx_counts.get(member.id, 0)
+            }
+            for member in group.members.all()
+        ]
+        return analysis
+
+    return periods.cached("analysis", group.id, chosen, analyse)
+
+MAX_STATS_MONTHS = 120
+
+def parse_month(value):
+    """``YYYY-MM`` (or a full ISO date) -> the first day of that month."""
+    return date.fromisoformat(value + "-01" if len(value) == 7 else value).replace(day=1)
+
+@api.get("/groups/{group_id}/stats")
+@cache_per_group_version(60 * 60 * 24)
+def get_group_stats(request, group_id: int, from_month: Optional[str] = Query(None, alias="from"), to_month: Optional[str] = Query(None, alias="to")):
+    user = request.user
+    # Verify user is a member of this group
+    group = get_object_or_404(Group, id=group_id, members=user)
+
+    try:
+        last = parse_month(to_month) if to_month else month_start(timezone.now())
+        first = parse_month(from_month) if from_month else rollups.add_months(last, -5)
+    except ValueError:
+        return api.create_response(request, {"error": "from and to must be months like 2024-03"}, status=400)
+    if first > last:
+        return api.create_response(request, {"error": "from must not be after to"}, status=400)
+    if len(rollups.months_between(first, last)) > MAX_STATS_MONTHS:
+        return api.create_response(request, {"error": f"at most {MAX_STATS_MONTHS} months at a time"}, status=400)
+
+    return rollups.spend_stats(group, first, last)
+
+from .settlements import simplify_debts
+
+class SettlementSchema(Schema):
+    from_user: UserSchema
+    to_user: UserSchema
+    amount: float
+
+@api.get("/groups/{group_id}/settlements", response=List[SettlementSchema])
+def get_group_settlements(request, group_id: int, period: Optional[str] = None, at: Optional[date] = None,
+                          start: Optional[date] = None, end: Optional[date] = None, tz: Optional[str] = None):
+    """Who pays whom to settle up over the same period ``/analysis`` would use."""
+    user = request.user
+    # Verify user is a member of this group
+    group = get_object_or_404(Group, id=group_id, members=user)
+    try:
+        chosen = periods.parse_period(group, period, tz=tz, at=at, start=start, end=end)
+    except ValueError as e:
+        return api.create_response(request, {"error": str(e)}, status=400)
+
+    financials = periods.period_financials(group.id, chosen)
+    transfers = simplify_debts(financials.get("balances", {}))
+    return [
+        {"from_user": debtor, "to_user": creditor, "amount": cents / 100}
+        for debtor, creditor, cents in transfers
+    ]
@@ -0,0 +1,277 @@
+"""Cache backends shared between worker processes.
+
+``SharedCache`` wraps any Django cache backend (Redis, file, the SQLite
+backend below, or local memory for development) and adds:
+
+- compression of large pickled values (analysis payloads, group lists),
+- per-process hit/miss counters, see ``stats()``.
+
+Namespacing comes from the usual ``KEY_PREFIX``/``VERSION`` settings, which
+are passed through to the wrapped backend. Integers are stored unwrapped so
+``incr`` stays atomic on backends that support it (the group version
+counters rely on this).
+"""
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+MAGIC = b"\x00ssc"
+RAW = b"r"
+COMPRESSED = b"z"
+
+_missing = object()
+
+
+class SharedCache(BaseCache):
+    """Compressing, instrumented wrapper around another cache backend.
+
+    OPTIONS:
+        BACKEND             dotted path of the wrapped backend (required)
+        LOCATION            location passed to the wrapped backend
+        OPTIONS             options passed to the wrapped backend
+        COMPRESS_MIN_BYTES  pickles at least this large are zlib-compressed
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = dict(params.get("OPTIONS") or {})
+        backend = import_string(options.pop("BACKEND"))
+        self.compress_min_bytes = int(options.pop("COMPRESS_MIN_BYTES", 1024))
+
+        inner_params = {
+            key: value for key, value in params.items() if key not in ("BACKEND", "LOCATION", "OPTIONS")
+        }
+        inner_params["OPTIONS"] = options.pop("OPTIONS", {})
+        self.inner = backend(options.pop("LOCATION", location), inner_params)
+
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "compressed": 0, "bytes_in": 0, "bytes_stored": 0}
+
+    # -- encoding -----------------------------------------------------------
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                self._stats[name] += delta
+
+    def encode(self, value):
+        if isinstance(value, int) and not isinstance(value, bool):
+            self._count(sets=1)
+            return value
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        size = len(data)
+        if size >= self.compress_min_bytes:
+            compressed = zlib.compress(data, 6)
+            if len(compressed) < size:
+                self._count(sets=1, compressed=1, bytes_in=size, bytes_stored=len(compressed))
+                return MAGIC + COMPRESSED + compressed
+        self._count(sets=1, bytes_in=size, bytes_stored=size)
+        return MAGIC + RAW + data
+
+    def decode(self, value):
+        if isinstance(value, bytes) and value.startswith(MAGIC):
+            kind, data = value[len(MAGIC):len(MAGIC) + 1], value[len(MAGIC) + 1:]
+            if kind == COMPRESSED:
+                data = zlib.decompress(data)
+            return pickle.loads(data)
+        return value
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    # -- cache API ------------------------------------------------------------
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.inner.add(key, self.encode(value), timeout, version)
+
+    def get(self, key, default=None, version=None):
+        value = self.inner.get(key, _missing, version)
+        if value is _missing:
+            self._count(misses=1)
+            return default
+        self._count(hits=1)
+        return self.decode(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.inner.set(key, self.encode(value), timeout, version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.inner.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        return self.inner.delete(key, version)
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = self.inner.get_many(keys, version)
+        self._count(hits=len(found), misses=len(keys) - len(found))
+        return {key: self.decode(value) for key, value in found.items()}
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.inner.set_many({key: self.encode(value) for key, value in data.items()}, timeout, version)
+
+    def delete_many(self, keys, version=None):
+        return self.inner.delete_many(keys, version)
+
+    def has_key(self, key, version=None):
+        return self.inner.has_key(key, version)
+
+    def incr(self, key, delta=1, version=None):
+        return self.inner.incr(key, delta, version)
+
+    def decr(self, key, delta=1, version=None):
+        return self.inner.decr(key, delta, version)
+
+    def clear(self):
+        return self.inner.clear()
+
+    def close(self, **kwargs):
+        return self.inner.close(**kwargs)
+
+
+class SQLiteCache(BaseCache):
+    """Cache in a standalone SQLite file, shared by every process on one host.
+
+    Uses WAL mode so readers in other workers are not blocked by a writer.
+    ``LOCATION`` is the database file path.
+
+    Like Django's database cache, writes cull the table: expired rows are
+    deleted, and past ``MAX_ENTRIES`` another 1/``CULL_FREQUENCY`` of the
+    rows go, soonest to expire first. Counting rows scans the table, so a
+    cull only runs every ``CULL_EVERY`` writes (per process).
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = location
+        self._local = threading.local()
+        options = params.get("OPTIONS") or {}
+        self._cull_every = max(int(options.get("CULL_EVERY", 100)), 1)
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+
+    @property
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)")
+            self._local.conn = conn
+        return conn
+
+    def _expiry(self, timeout):
+        # Absolute expiry timestamp, or None to never expire.
+        return self.get_backend_timeout(timeout)
+
+    def _dump(self, value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def _live(self, key):
+        return self.connection.execute(
+            "SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)", (key, time.time())
+        ).fetchone()
+
+    def _cull(self):
+        conn = self.connection
+        conn.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+        count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            conn.execute("DELETE FROM cache")
+            return
+        # Rows that never expire (the group version counters) go last.
+        conn.execute(
+            "DELETE FROM cache WHERE key IN "
+            "(SELECT key FROM cache ORDER BY expires IS NULL, expires LIMIT ?)",
+            (count // self._cull_frequency,),
+        )
+
+    def _wrote(self):
+        with self._writes_lock:
+            self._writes += 1
+            due = self._writes % self._cull_every == 0
+        if due:
+            self._cull()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._wrote()
+        conn = self.connection
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self._live(key):
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                (key, self._dump(value), self._expiry(timeout)),
+            )
+            return True
+        finally:
+            conn.execute("COMMIT")
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._live(key)
+        return pickle.loads(row[0]) if row else default
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._wrote()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+            (key, self._dump(value), self._expiry(timeout)),
+        )
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self.connection.execute(
+            "UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (self._expiry(timeout), key, time.time()),
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self.connection.execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._live(key) is not None
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self.connection
+        # The read-modify-write runs under a write lock, so concurrent bumps
+        # from different workers are never lost.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._live(key)
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            conn.execute("UPDATE cache SET value = ? WHERE key = ?", (self._dump(value), key))
+            return value
+        finally:
+            conn.execute("COMMIT")
+
+    def clear(self):
+        self.connection.execute("DELETE FROM cache")
+
+    def close(self, **kwargs):
+        # Connections are per thread and reused across requests.
+        pass
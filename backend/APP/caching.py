@@ -0,0 +1,125 @@
+"""Response caching invalidated by per-group version counters.
+
+Every write that can change what a group's members see (expenses, splits,
+membership, group settings) bumps that group's version. Cached responses are
+keyed by (view, path, user, versions of the groups involved), so a write makes
+the old entries unreachable immediately and they can otherwise live for hours.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.query import QuerySet
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .models import GroupMember
+
+
+def _version_key(group_id):
+    return f"group-version:{group_id}"
+
+
+def group_versions(group_ids):
+    """Current version of each group, initialising any that are missing."""
+    keys = {_version_key(group_id): group_id for group_id in group_ids}
+    found = cache.get_many(keys)
+    versions = {keys[key]: value for key, value in found.items()}
+
+    for key, group_id in keys.items():
+        if group_id not in versions:
+            # Seed from the clock rather than 1 so an evicted counter can never
+            # come back to a value that older cache entries were keyed on.
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[group_id] = cache.get(key)
+    return versions
+
+
+def group_version(group_id):
+    return group_versions([group_id])[group_id]
+
+
+def _bump_on_commit(key):
+    def bump():
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def bump_group_version(group_id):
+    """Invalidate cached responses for ``group_id`` once the transaction commits."""
+    _bump_on_commit(_version_key(group_id))
+
+
+def _history_key(group_id):
+    return f"group-history:{group_id}"
+
+
+def history_version(group_id):
+    """Version of a group's closed periods (see ``APP.periods``).
+
+    Only bumped by writes that can change a period that has already ended:
+    edits to older expenses, backdated imports, membership, names and group
+    settings. New expenses leave it alone.
+    """
+    key = _history_key(group_id)
+    cache.add(key, time.time_ns(), timeout=None)
+    return cache.get(key)
+
+
+def bump_history_version(group_id):
+    _bump_on_commit(_history_key(group_id))
+
+
+def cache_per_group_version(timeout_seconds: int, vary=None):
+    """Cache a view's return value per user and per group version.
+
+    Views with a ``group_id`` argument depend on that group only; other views
+    (the group list) depend on every group the user belongs to. ``vary(request)``
+    adds anything else the answer depends on (such as today's date) to the key.
+    """
+
+    def decorator(view_func):
+        view_name = f"{view_func.__module__}.{view_func.__qualname__}"
+
+        @wraps(view_func)
+        def _wrapped(request, *args, **kwargs):
+            user = getattr(request, "user", None)
+            if user is None or getattr(user, "pk", None) is None:
+                return view_func(request, *args, **kwargs)
+
+            if "group_id" in kwargs:
+                group_ids = [kwargs["group_id"]]
+            else:
+                group_ids = GroupMember.objects.filter(user=user).values_list('group_id', flat=True)
+            versions = sorted(group_versions(list(group_ids)).items())
+
+            # Analysis covers the current month, so the month is part of the key.
+            month = timezone.localtime().strftime("%Y-%m")
+            extra = vary(request) if vary else None
+            digest = hashlib.sha256(
+                repr((request.get_full_path(), user.pk, month, versions, extra)).encode()
+            ).hexdigest()
+            key = f"view:{view_name}:{digest}"
+
+            result = cache.get(key)
+            if result is not None:
+                return result
+
+            result = view_func(request, *args, **kwargs)
+            if isinstance(result, HttpResponse):
+                # Error responses (404s, validation failures) are not cached.
+                return result
+            if isinstance(result, QuerySet):
+                result = list(result)
+            cache.set(key, result, timeout_seconds)
+            return result
+
+        return _wrapped
+
+    return decorator
@@ -0,0 +1,122 @@
+"""Streaming a group's expenses out as CSV or NDJSON.
+
+Expenses are read oldest first through ``.values().iterator()`` (a
+server-side cursor where the database has one), in chunks of
+``chunk_size``; each chunk's splits come from one extra query. Memory use
+is therefore bounded by the chunk size, not the group's history.
+
+The CSV columns are the ones ``importer`` reads, so an export can be
+imported into another group::
+
+    id,date,description,amount,payer,category,status,splits
+    12,2024-03-02T12:00:00+00:00,Groceries,1200.00,Rahul,Food,APPROVED,Rahul:600.00;Amit:600.00
+
+Text cells a spreadsheet would read as a formula (starting ``=``, ``+``,
+``-``, ``@``, tab or carriage return) get a leading ``'``, which the
+importer strips again.
+"""
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+
+from .models import Expense, ExpenseSplit
+
+CSV_COLUMNS = ["id", "date", "description", "amount", "payer", "category", "status", "splits"]
+CATEGORY_LABELS = dict(Expense.CATEGORIES)
+DEFAULT_CHUNK_SIZE = 2000
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def expense_rows(group_id, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield one dict per expense, splits included, oldest first.
+
+    ``start``/``end`` bound ``created_at`` as a half-open range.
+    """
+    expenses = Expense.objects.filter(group_id=group_id)
+    if start is not None:
+        expenses = expenses.filter(created_at__gte=start)
+    if end is not None:
+        expenses = expenses.filter(created_at__lt=end)
+    rows = (
+        expenses.order_by('created_at', 'id')
+        .values('id', 'created_at', 'description', 'amount', 'payer__name', 'category', 'status')
+        .iterator(chunk_size=chunk_size)
+    )
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        splits = {}
+        for expense_id, name, owed in (
+            ExpenseSplit.objects.filter(expense_id__in=[row['id'] for row in chunk])
+            .order_by('expense_id', 'id')
+            .values_list('expense_id', 'user__name', 'owed_amount')
+        ):
+            splits.setdefault(expense_id, []).append({"user_name": name, "amount": str(owed)})
+        for row in chunk:
+            yield {
+                "id": row['id'],
+                "date": row['created_at'].isoformat(),
+                "description": row['description'],
+                "amount": str(row['amount']),
+                "payer": row['payer__name'],
+                "category": CATEGORY_LABELS.get(row['category'], row['category']),
+                "status": row['status'],
+                "splits": splits.get(row['id'], []),
+            }
+
+
+class _Echo:
+    """A file-like object whose ``write`` returns the value instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def escape_cell(value):
+    """``value`` with a leading ``'`` if a spreadsheet would run it as a formula."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for row in rows:
+        splits = ";".join(f"{split['user_name']}:{split['amount']}" for split in row["splits"])
+        yield writer.writerow([escape_cell(row[column]) for column in CSV_COLUMNS[:-1]] + [escape_cell(splits)])
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def batched(lines, size=500):
+    """Join lines into larger strings so each write to the client carries many rows."""
+    lines = iter(lines)
+    while True:
+        chunk = "".join(islice(lines, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+async def aiterate(iterator):
+    """Drive a sync iterator from async code.
+
+    Under ASGI, Django would otherwise buffer a sync ``StreamingHttpResponse``
+    iterator into a list before sending it. Every step runs in the same
+    thread, so the database cursor stays on one connection.
+    """
+    iterator = iter(iterator)
+    step = sync_to_async(lambda: next(iterator, None), thread_sensitive=True)
+    while True:
+        chunk = await step()
+        if chunk is None:
+            return
+        yield chunk
@@ -0,0 +1,155 @@
+"""Reading historical expenses from CSV or JSON exports.
+
+Both formats produce the same dicts ``prepare_expense`` takes from the AI,
+plus an optional ``created_at``.
+
+CSV columns (header names are case-insensitive; only amount and payer are
+required)::
+
+    date,description,amount,payer,category,status,splits
+    2024-03-02,Groceries,1200,Rahul,Food,APPROVED,Rahul:600;Amit:600
+    2024-03-05T19:30,Cab,300,Amit,Transportation,,
+
+An empty ``splits`` column splits the expense equally among all members;
+an empty ``status`` means APPROVED. A ``'`` that ``exporter`` put in front
+of a formula-like cell is removed.
+
+JSON is a list of objects with the same fields (``payer`` or
+``payer_name``; ``splits`` as ``[{"user_name": ..., "amount": ...}]``), or
+one such object per line (NDJSON, as ``exporter`` writes it).
+"""
+import csv
+import io
+import json
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .exporter import FORMULA_PREFIXES
+from .models import Expense
+
+MAX_IMPORT_ROWS = 20000
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def parse_when(value):
+    """A timezone-aware datetime from an ISO date or datetime string."""
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"Invalid date {value!r}, expected an ISO date string")
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+        # Noon, so a bare date stays on the same day in any nearby timezone.
+        moment = datetime.combine(day, time(12)) if day else parse_datetime(value)
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise ValueError(f"Invalid date '{value}'")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_splits(value):
+    """``"Rahul:600;Amit:600"`` (``|`` also separates) -> split dicts."""
+    splits = []
+    for part in (value or "").replace("|", ";").split(";"):
+        if not part.strip():
+            continue
+        name, sep, amount = part.rpartition(":")
+        if not sep or not name.strip():
+            raise ValueError(f"Invalid split '{part.strip()}', expected Name:amount")
+        splits.append({"user_name": name.strip(), "amount": amount.strip()})
+    return splits
+
+
+def unescape_cell(value):
+    """Undo ``exporter.escape_cell``."""
+    if isinstance(value, str) and value.startswith("'") and value[1:].startswith(FORMULA_PREFIXES):
+        return value[1:]
+    return value
+
+
+def parse_status(value):
+    """An ``Expense`` status, or None for the default."""
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"Invalid status {value!r}")
+    value = (value or "").strip().upper()
+    if not value:
+        return None
+    if value not in dict(Expense.STATUS_CHOICES):
+        raise ValueError(f"Invalid status '{value}', expected one of {', '.join(dict(Expense.STATUS_CHOICES))}")
+    return value
+
+
+def _row(record):
+    record = {str(key).strip().lower(): value for key, value in record.items() if key is not None}
+    splits = record.get("splits")
+    if isinstance(splits, str) or splits is None:
+        splits = parse_splits(splits)
+    elif not isinstance(splits, list) or not all(isinstance(split, dict) for split in splits):
+        raise ValueError('Invalid splits, expected a list of {"user_name": ..., "amount": ...} objects')
+    return {
+        "description": record.get("description"),
+        "amount": record.get("amount"),
+        "payer_name": record.get("payer_name") or record.get("payer"),
+        "category": record.get("category"),
+        "splits": splits,
+        "created_at": parse_when(record.get("date") or record.get("created_at")),
+        "status": parse_status(record.get("status")),
+    }
+
+
+def _ndjson(text):
+    records = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if line.strip():
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                raise ImportFormatError(f"Invalid JSON on line {number}: {e}")
+    return records
+
+
+def read_rows(data, filename=""):
+    """Parse an upload into ``[(row_number, parsed dict or ValueError)]``."""
+    text = data.decode("utf-8-sig") if isinstance(data, bytes) else data.lstrip("\ufeff")
+    if filename.lower().endswith((".ndjson", ".jsonl")):
+        records = _ndjson(text)
+        first_row = 1
+    elif filename.lower().endswith(".json") or text.lstrip().startswith(("[", "{")):
+        try:
+            records = json.loads(text)
+        except json.JSONDecodeError as e:
+            if not text.lstrip().startswith("{"):
+                raise ImportFormatError(f"Invalid JSON: {e}")
+            records = _ndjson(text)
+        if isinstance(records, dict):
+            records = records.get("expenses", [])
+        if not isinstance(records, list):
+            raise ImportFormatError("Expected a list of expenses")
+        first_row = 1
+    else:
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames or not {"amount", "payer"} & {f.strip().lower() for f in reader.fieldnames}:
+            raise ImportFormatError("CSV needs a header row with at least amount and payer columns")
+        records = ({key: unescape_cell(value) for key, value in record.items()} for record in reader)
+        first_row = 2  # line 1 is the header
+
+    rows = []
+    for number, record in enumerate(records, first_row):
+        if len(rows) >= MAX_IMPORT_ROWS:
+            raise ImportFormatError(f"At most {MAX_IMPORT_ROWS} expenses per import")
+        try:
+            if not isinstance(record, dict):
+                raise ValueError("Expected an object")
+            rows.append((number, _row(record)))
+        except ValueError as e:
+            rows.append((number, e))
+    return rows
@@ -0,0 +1,162 @@
+"""Database-backed queue for AI expense parsing.
+
+The AI endpoints can enqueue an ``AIParseJob`` instead of calling Gemini
+inline, so a slow model round trip no longer holds a web worker. Jobs are
+claimed with a conditional UPDATE, which is safe with any number of worker
+processes on any database, and run on a bounded thread pool by
+``manage.py run_ai_worker``.
+
+The parse functions are passed in (defaulting to the Gemini ones in
+``APP.services``) so the queue can be exercised with a stub.
+"""
+import io
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .imaging import ImageTooLarge
+from .models import AIParseJob
+
+MAX_ATTEMPTS = 3
+STALE_AFTER = timedelta(minutes=5)
+
+
+def enqueue_text(group, user, text_input):
+    return AIParseJob.objects.create(group=group, requested_by=user, kind='TEXT', text_input=text_input)
+
+
+def enqueue_receipt(group, user, image_file, text_context=None):
+    """Queue a receipt; raises ``ImageTooLarge`` past ``RECEIPT_MAX_UPLOAD_BYTES``.
+
+    The image is stored on the job until it finishes (``process_job`` clears it).
+    """
+    limit = settings.RECEIPT_MAX_UPLOAD_BYTES
+    too_large = ImageTooLarge(f"Receipt uploads are limited to {limit} bytes")
+    if (getattr(image_file, 'size', None) or 0) > limit:
+        raise too_large
+    # Never read more than the limit, whatever the file claims its size is.
+    image = image_file.read(limit + 1)
+    if len(image) > limit:
+        raise too_large
+    return AIParseJob.objects.create(
+        group=group, requested_by=user, kind='RECEIPT', text_input=text_context, image=image
+    )
+
+
+def claim_next():
+    """Mark the oldest pending job as running and return it, or None."""
+    while True:
+        job_id = (
+            AIParseJob.objects.filter(status='PENDING')
+            .order_by('created_at', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        # Only one worker's UPDATE can match while the row is still PENDING.
+        claimed = AIParseJob.objects.filter(id=job_id, status='PENDING').update(
+            status='RUNNING', started_at=timezone.now(), attempts=F('attempts') + 1
+        )
+        if claimed:
+            return AIParseJob.objects.select_related('requested_by').get(id=job_id)
+
+
+def requeue_stale(older_than=STALE_AFTER):
+    """Return jobs left RUNNING by a crashed worker to the queue.
+
+    Jobs that already used ``MAX_ATTEMPTS`` are failed instead.
+    """
+    cutoff = timezone.now() - older_than
+    stale = AIParseJob.objects.filter(status='RUNNING', started_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status='FAILED', error='Worker did not finish the job', image=None, finished_at=timezone.now()
+    )
+    requeued = stale.update(status='PENDING', started_at=None)
+    return requeued, failed
+
+
+def process_job(job, parse_text=None, parse_receipt=None):
+    """Run one claimed job and store its expense or error."""
+    from .services import create_expense_from_parsed_data, parse_expense_with_ai, parse_receipt_with_ai
+
+    parse_text = parse_text or parse_expense_with_ai
+    parse_receipt = parse_receipt or parse_receipt_with_ai
+    user_name = job.requested_by.name
+
+    try:
+        if job.kind == 'RECEIPT':
+            parsed = parse_receipt(io.BytesIO(bytes(job.image)), job.group_id, user_name, text_context=job.text_input)
+            if not parsed:
+                raise ValueError("Failed to parse receipt")
+        else:
+            parsed = parse_text(job.text_input, job.group_id, user_name)
+            if not parsed:
+                raise ValueError("Failed to parse")
+
+        with transaction.atomic():
+            job.expense = create_expense_from_parsed_data(job.group_id, parsed)
+            job.status = 'DONE'
+            job.error = None
+    except Exception as e:
+        job.status = 'FAILED'
+        job.error = str(e)
+
+    job.image = None
+    job.finished_at = timezone.now()
+    job.save(update_fields=['expense', 'status', 'error', 'image', 'finished_at'])
+    return job
+
+
+def _run_in_thread(job, parse_text, parse_receipt):
+    try:
+        return process_job(job, parse_text, parse_receipt)
+    finally:
+        # Each pool thread has its own connection; don't leak it.
+        connection.close()
+
+
+def drain(concurrency=1, limit=None, parse_text=None, parse_receipt=None):
+    """Process pending jobs until the queue is empty (or ``limit`` are done).
+
+    With ``concurrency`` 1 jobs run in the calling thread; otherwise at most
+    ``concurrency`` run at once on a thread pool. Returns the jobs processed.
+    """
+    done = []
+    if concurrency <= 1:
+        while limit is None or len(done) < limit:
+            job = claim_next()
+            if job is None:
+                break
+            done.append(process_job(job, parse_text, parse_receipt))
+        return done
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='ai-worker') as pool:
+        running = set()
+        claimed = 0
+        while True:
+            while len(running) < concurrency and (limit is None or claimed < limit):
+                job = claim_next()
+                if job is None:
+                    break
+                claimed += 1
+                running.add(pool.submit(_run_in_thread, job, parse_text, parse_receipt))
+            if not running:
+                break
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            done.extend(future.result() for future in finished)
+    return done
+
+
+def run_worker(concurrency=4, poll_interval=1.0, parse_text=None, parse_receipt=None, stop=None):
+    """Drain the queue forever, sleeping ``poll_interval`` when it is empty."""
+    while stop is None or not stop():
+        close_old_connections()
+        requeue_stale()
+        if not drain(concurrency, parse_text=parse_text, parse_receipt=parse_receipt):
+            time.sleep(poll_interval)
@@ -0,0 +1,244 @@
+"""Incrementally maintained monthly balance ledger.
+
+Every counted expense adds its amount to the payer's ``paid`` and every split
+of a counted expense adds its owed amount to the user's ``consumed`` for the
+(group, month) the expense was created in. The signal handlers in
+``APP.signals`` call into this module whenever expenses or splits change;
+code paths that bypass signals (``bulk_create``) call ``record_expense`` or
+``record_expenses`` directly.
+"""
+import logging
+import threading
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import DateField, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Expense, ExpenseSplit, Group, MemberMonthlyBalance
+
+CENT = Decimal('0.01')
+
+logger = logging.getLogger(__name__)
+
+# Expense ids currently being deleted on this thread. Their splits are
+# cascaded away after the expense already reversed them from the ledger.
+_state = threading.local()
+
+
+def deleting_expense_ids():
+    if not hasattr(_state, "expense_ids"):
+        _state.expense_ids = set()
+    return _state.expense_ids
+
+
+def month_start(dt):
+    """First day of the month ``dt`` falls in, in the current time zone."""
+    return timezone.localtime(dt).date().replace(day=1)
+
+
+def to_money(value):
+    return Expense._meta.get_field('amount').to_python(value).quantize(CENT)
+
+
+def is_counted(status):
+    return status in Expense.COUNTED_STATUSES
+
+
+def apply_delta(group_id, user_id, month, paid=0, consumed=0):
+    paid, consumed = to_money(paid), to_money(consumed)
+    if not paid and not consumed:
+        return
+
+    rows = MemberMonthlyBalance.objects.filter(group_id=group_id, user_id=user_id, month=month)
+    if rows.update(paid=F('paid') + paid, consumed=F('consumed') + consumed):
+        return
+
+    # Deleting a group or user cascades to its ledger rows only after the
+    # expense signals have run, so a missing row means the ledger had drifted
+    # (or was never filled in). Say so rather than invent a negative row.
+    if paid < 0 or consumed < 0:
+        logger.warning(
+            "Ledger row missing for group=%s user=%s month=%s (paid %s, consumed %s); "
+            "run manage.py rebuild_ledger --group %s",
+            group_id, user_id, month, paid, consumed, group_id,
+        )
+        return
+
+    try:
+        with transaction.atomic():
+            MemberMonthlyBalance.objects.create(
+                group_id=group_id, user_id=user_id, month=month, paid=paid, consumed=consumed
+            )
+    except IntegrityError:
+        rows.update(paid=F('paid') + paid, consumed=F('consumed') + consumed)
+
+
+def record_expense(expense, splits=None, sign=1):
+    """Add (``sign=1``) or remove (``sign=-1``) a counted expense and its splits."""
+    if not is_counted(expense.status):
+        return
+
+    month = month_start(expense.created_at)
+    if splits is None:
+        splits = ExpenseSplit.objects.filter(expense_id=expense.pk).values_list('user_id', 'owed_amount')
+    else:
+        splits = [(s.user_id, s.owed_amount) for s in splits]
+
+    consumed = defaultdict(Decimal)
+    for user_id, owed in splits:
+        consumed[user_id] += to_money(owed)
+
+    apply_delta(expense.group_id, expense.payer_id, month, paid=sign * to_money(expense.amount))
+    for user_id, owed in consumed.items():
+        apply_delta(expense.group_id, user_id, month, consumed=sign * owed)
+
+
+def record_expenses(items):
+    """Add many new ``(expense, splits)`` pairs with one ledger update per cell.
+
+    For bulk inserts: thirty expenses by the same few people in the same
+    month touch a handful of rows, not thirty times as many.
+    """
+    deltas = defaultdict(lambda: [Decimal(0), Decimal(0)])
+    for expense, splits in items:
+        if not is_counted(expense.status):
+            continue
+        month = month_start(expense.created_at)
+        deltas[(expense.group_id, expense.payer_id, month)][0] += to_money(expense.amount)
+        for split in splits:
+            deltas[(expense.group_id, split.user_id, month)][1] += to_money(split.owed_amount)
+
+    for (group_id, user_id, month), (paid, consumed) in deltas.items():
+        apply_delta(group_id, user_id, month, paid=paid, consumed=consumed)
+
+
+def expense_changed(expense, previous):
+    """Reconcile an updated expense with the values it had before saving."""
+    was_counted = is_counted(previous['status'])
+    now_counted = is_counted(expense.status)
+    old_month = month_start(previous['created_at'])
+    new_month = month_start(expense.created_at)
+    moved = previous['group_id'] != expense.group_id or old_month != new_month
+
+    if was_counted:
+        apply_delta(previous['group_id'], previous['payer_id'], old_month, paid=-to_money(previous['amount']))
+    if now_counted:
+        apply_delta(expense.group_id, expense.payer_id, new_month, paid=to_money(expense.amount))
+
+    if was_counted == now_counted and not moved:
+        return
+
+    for user_id, owed in ExpenseSplit.objects.filter(expense_id=expense.pk).values_list('user_id', 'owed_amount'):
+        if was_counted:
+            apply_delta(previous['group_id'], user_id, old_month, consumed=-owed)
+        if now_counted:
+            apply_delta(expense.group_id, user_id, new_month, consumed=owed)
+
+
+def record_split(expense_id, user_id, owed_amount, sign=1, expense=None):
+    if expense is None or expense.pk != expense_id:
+        expense = Expense.objects.filter(pk=expense_id).only('group_id', 'status', 'created_at').first()
+    if expense is None or not is_counted(expense.status):
+        return
+    apply_delta(expense.group_id, user_id, month_start(expense.created_at), consumed=sign * to_money(owed_amount))
+
+
+def get_ledger_financials(group_id, month=None):
+    """Same structure as ``services.get_monthly_financials``, read from the ledger."""
+    try:
+        group = Group.objects.get(id=group_id)
+    except Group.DoesNotExist:
+        return {"total_spend": 0, "balances": {}}
+
+    month = month or month_start(timezone.now())
+    members = list(group.members.all())
+    member_count = len(members)
+    rows = {
+        row.user_id: row
+        for row in MemberMonthlyBalance.objects.filter(group=group, month=month)
+    }
+
+    raw_balances = {}
+    paid_totals = {}
+    consumed_totals = {}
+    for user in members:
+        row = rows.get(user.id)
+        paid = row.paid if row else 0
+        consumed = row.consumed if row else 0
+        raw_balances[user] = paid if member_count == 1 else paid - consumed
+        paid_totals[user] = paid
+        consumed_totals[user] = consumed
+
+    return {
+        "total_spend": float(sum((row.paid for row in rows.values()), 0)),
+        "balances": raw_balances,
+        "paid": paid_totals,
+        "consumed": consumed_totals,
+        "group": group,
+        "member_count": member_count
+    }
+
+
+def compute_ledger(group_ids=None):
+    """Recompute ledger cells from raw expenses: {(group, user, month): [paid, consumed]}."""
+    expenses = Expense.objects.filter(status__in=Expense.COUNTED_STATUSES)
+    splits = ExpenseSplit.objects.filter(expense__status__in=Expense.COUNTED_STATUSES)
+    if group_ids is not None:
+        expenses = expenses.filter(group_id__in=group_ids)
+        splits = splits.filter(expense__group_id__in=group_ids)
+
+    cells = defaultdict(lambda: [Decimal('0.00'), Decimal('0.00')])
+    paid_rows = (
+        expenses.annotate(month=TruncMonth('created_at', output_field=DateField()))
+        .values('group_id', 'payer_id', 'month')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+    for row in paid_rows:
+        cells[(row['group_id'], row['payer_id'], row['month'])][0] += to_money(row['total'])
+
+    consumed_rows = (
+        splits.annotate(month=TruncMonth('expense__created_at', output_field=DateField()))
+        .values('expense__group_id', 'user_id', 'month')
+        .annotate(total=Sum('owed_amount'))
+        .order_by()
+    )
+    for row in consumed_rows:
+        cells[(row['expense__group_id'], row['user_id'], row['month'])][1] += to_money(row['total'])
+
+    return cells
+
+
+def rebuild_ledger(group_ids=None):
+    """Replace ledger rows with freshly computed ones. Returns the row count."""
+    cells = compute_ledger(group_ids)
+    with transaction.atomic():
+        existing = MemberMonthlyBalance.objects.all()
+        if group_ids is not None:
+            existing = existing.filter(group_id__in=group_ids)
+        existing.delete()
+        MemberMonthlyBalance.objects.bulk_create([
+            MemberMonthlyBalance(group_id=g, user_id=u, month=m, paid=paid, consumed=consumed)
+            for (g, u, m), (paid, consumed) in cells.items()
+        ], batch_size=500)
+    return len(cells)
+
+
+def verify_ledger(group_ids=None):
+    """List cells where the stored ledger disagrees with the raw expenses."""
+    expected = compute_ledger(group_ids)
+    stored = MemberMonthlyBalance.objects.all()
+    if group_ids is not None:
+        stored = stored.filter(group_id__in=group_ids)
+
+    actual = {(row.group_id, row.user_id, row.month): [row.paid, row.consumed] for row in stored}
+    mismatches = []
+    for key in expected.keys() | actual.keys():
+        want = expected.get(key, [0, 0])
+        have = actual.get(key, [0, 0])
+        if want[0] != have[0] or want[1] != have[1]:
+            mismatches.append({"cell": key, "expected": want, "stored": have})
+    return mismatches
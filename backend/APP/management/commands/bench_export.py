@@ -0,0 +1,106 @@
+import random
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from APP import exporter
+from APP.models import Expense, ExpenseSplit, Group, GroupMember, User
+
+
+class Rollback(Exception):
+    pass
+
+
+def build_group(rng, expenses, members):
+    """A throwaway group with ``expenses`` expenses over the last few years, split among everyone."""
+    users = User.objects.bulk_create(
+        [User(name=f"Bench User {i}", clerk_user_id=f"bench-export-{i}-{rng.random()}") for i in range(members)]
+    )
+    group = Group.objects.create(name="Export bench", type="LONG", owner=users[0])
+    GroupMember.objects.bulk_create([GroupMember(group=group, user=user) for user in users])
+
+    categories = [value for value, _ in Expense.CATEGORIES]
+    now = timezone.now()
+    for offset in range(0, expenses, 5000):
+        batch = Expense.objects.bulk_create([
+            Expense(group=group, payer=rng.choice(users), amount=members * rng.randint(1, 2000),
+                    description=f"Expense {offset + i}", category=rng.choice(categories))
+            for i in range(min(5000, expenses - offset))
+        ])
+        for expense in batch:
+            expense.created_at = now - timedelta(minutes=rng.randint(0, 3 * 365 * 24 * 60))
+        Expense.objects.bulk_update(batch, ['created_at'])
+        ExpenseSplit.objects.bulk_create([
+            ExpenseSplit(expense=expense, user=user, owed_amount=expense.amount / members)
+            for expense in batch for user in users
+        ])
+    return group
+
+
+def naive_export(group_id):
+    """Baseline: load every expense and split, then serialise."""
+    expenses = list(
+        Expense.objects.filter(group_id=group_id).select_related('payer').prefetch_related('splits__user')
+        .order_by('created_at', 'id')
+    )
+    rows = (
+        {
+            "id": e.id, "date": e.created_at.isoformat(), "description": e.description, "amount": str(e.amount),
+            "payer": e.payer.name, "category": e.category, "status": e.status,
+            "splits": [{"user_name": s.user.name, "amount": str(s.owed_amount)} for s in e.splits.all()],
+        }
+        for e in expenses
+    )
+    return "".join(exporter.ndjson_lines(rows))
+
+
+class Command(BaseCommand):
+    help = 'Measures streaming CSV/NDJSON export time, memory and queries on a large synthetic group'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expenses', type=int, default=100_000)
+        parser.add_argument('--members', type=int, default=4)
+        parser.add_argument('--chunk-size', type=int, default=exporter.DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--skip-naive', action='store_true', help='Skip the load-everything baseline')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def measure(self, label, produce):
+        tracemalloc.start()
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            size = produce()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f"{label:>14}: {elapsed:6.2f} s, {size / 1024 / 1024:7.1f} MB out, "
+            f"{peak / 1024 / 1024:7.1f} MB peak Python memory, {len(queries)} queries"
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        try:
+            with transaction.atomic():
+                start = time.perf_counter()
+                group = build_group(rng, options['expenses'], options['members'])
+                self.stdout.write(
+                    f"Built {options['expenses']} expenses x {options['members']} splits "
+                    f"in {time.perf_counter() - start:.1f} s"
+                )
+
+                for fmt, render in (('csv', exporter.csv_lines), ('ndjson', exporter.ndjson_lines)):
+                    rows = lambda: exporter.expense_rows(group.id, chunk_size=options['chunk_size'])
+                    self.measure(
+                        f"stream {fmt}", lambda: sum(len(chunk) for chunk in exporter.batched(render(rows())))
+                    )
+                if not options['skip_naive']:
+                    self.measure("load-all json", lambda: len(naive_export(group.id)))
+                self.stdout.write("(times include tracemalloc overhead)")
+                raise Rollback
+        except Rollback:
+            pass
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from APP.quickparse import CORPUS_PATH, evaluate, load_corpus
+
+
+class Command(BaseCommand):
+    help = 'Measures coverage, accuracy and latency of the local expense parser on a labelled corpus'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=str(CORPUS_PATH))
+        parser.add_argument('--min-confidence', type=float, default=None)
+        parser.add_argument('--repeat', type=int, default=200, help='Passes over the corpus for the latency figure')
+        parser.add_argument('--verbose', action='store_true', help='List misparsed and missed inputs')
+
+    def handle(self, *args, **options):
+        cases = load_corpus(options['corpus'])
+        min_confidence = options['min_confidence']
+        if min_confidence is None:
+            min_confidence = settings.QUICKPARSE_MIN_CONFIDENCE
+
+        report = evaluate(cases, min_confidence)
+        seconds = sum(evaluate(cases, min_confidence)['seconds'] for _ in range(options['repeat']))
+
+        self.stdout.write(f"cases:      {report['cases']} ({sum(1 for c in cases if c['expected'])} simple)")
+        self.stdout.write(f"coverage:   {report['coverage']:.1%} parsed locally")
+        self.stdout.write(f"recall:     {report['recall']:.1%} of simple inputs parsed locally and correctly")
+        self.stdout.write(f"precision:  {report['precision']:.1%} of local parses correct")
+        self.stdout.write(f"latency:    {seconds / (options['repeat'] * len(cases)) * 1e6:.1f} us/input")
+
+        if options['verbose']:
+            for text, parsed in report['wrong']:
+                self.stdout.write(self.style.ERROR(f"wrong:  {text!r} -> {parsed}"))
+            for text, reason in report['missed']:
+                self.stdout.write(f"missed: {text!r} ({reason})")
+
+        if report['wrong']:
+            self.stdout.write(self.style.ERROR(f"{len(report['wrong'])} inputs were parsed locally but wrongly"))
+        else:
+            self.stdout.write(self.style.SUCCESS('No local misparses'))
@@ -0,0 +1,76 @@
+import io
+import random
+import time
+from pathlib import Path
+
+import PIL.Image
+from django.core.management.base import BaseCommand, CommandError
+from APP.imaging import preprocess_receipt
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.webp', '.heic', '.bmp', '.tif', '.tiff'}
+
+
+def synthetic_receipt(rng, width=3024, height=4032):
+    """A phone-photo-sized JPEG: noisy paper with dark text-like bars."""
+    image = PIL.Image.effect_noise((width, height), 24).convert('RGB')
+    image = PIL.Image.blend(image, PIL.Image.new('RGB', (width, height), (225, 220, 205)), 0.7)
+    for _ in range(120):
+        x, y = rng.randrange(width // 8, width // 2), rng.randrange(0, height - 40)
+        image.paste((30, 30, 30), (x, y, x + rng.randrange(200, width // 2), y + 28))
+    out = io.BytesIO()
+    image.save(out, format='JPEG', quality=92)
+    return out.getvalue()
+
+
+class Command(BaseCommand):
+    help = 'Reports bytes saved and latency of receipt preprocessing per image'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='Image files or directories (default: synthetic 12MP photos)')
+        parser.add_argument('--synthetic', type=int, default=3, help='Synthetic images to generate when no paths are given')
+        parser.add_argument('--max-edge', type=int)
+        parser.add_argument('--format', choices=['JPEG', 'WEBP'])
+        parser.add_argument('--quality', type=int)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def images(self, options):
+        if not options['paths']:
+            rng = random.Random(options['seed'])
+            for i in range(options['synthetic']):
+                yield f'synthetic-{i}.jpg', synthetic_receipt(rng)
+            return
+        for path in map(Path, options['paths']):
+            files = sorted(p for p in path.rglob('*') if p.suffix.lower() in IMAGE_SUFFIXES) if path.is_dir() else [path]
+            for file in files:
+                if not file.exists():
+                    raise CommandError(f'{file} does not exist')
+                yield str(file), file.read_bytes()
+
+    def handle(self, *args, **options):
+        total_in = total_out = 0
+        total_time = 0.0
+        count = 0
+
+        for name, data in self.images(options):
+            start = time.perf_counter()
+            prepared = preprocess_receipt(
+                io.BytesIO(data), max_edge=options['max_edge'], image_format=options['format'], quality=options['quality']
+            )
+            elapsed = time.perf_counter() - start
+
+            count += 1
+            total_in += len(data)
+            total_out += len(prepared.data)
+            total_time += elapsed
+            self.stdout.write(
+                f"{name}: {len(data) / 1024:8.0f} KB -> {len(prepared.data) / 1024:6.0f} KB "
+                f"({1 - len(prepared.data) / len(data):6.1%} saved), "
+                f"{prepared.width}x{prepared.height}, {elapsed * 1000:7.1f} ms"
+            )
+
+        if not count:
+            raise CommandError('No images found')
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} images: {total_in / 1024:.0f} KB -> {total_out / 1024:.0f} KB "
+            f"({1 - total_out / total_in:.1%} saved), {total_time / count * 1000:.1f} ms/image"
+        ))
@@ -0,0 +1,54 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from APP.settlements import simplify_debts
+
+
+def pairwise_settlements(balances):
+    """Naive baseline: every debtor pays every creditor its proportional share."""
+    creditors = {k: v for k, v in balances.items() if v > 0}
+    total_credit = sum(creditors.values())
+    transfers = []
+    for debtor, amount in balances.items():
+        if amount >= 0:
+            continue
+        for creditor, credit in creditors.items():
+            share = round(-amount * credit / total_credit)
+            if share:
+                transfers.append((debtor, creditor, share))
+    return transfers
+
+
+def random_balances(rng, members):
+    """Random net balances in cents that sum to zero, like a real group."""
+    balances = {i: rng.randint(-500000, 500000) for i in range(members - 1)}
+    balances[members - 1] = -sum(balances.values())
+    return balances
+
+
+class Command(BaseCommand):
+    help = 'Compares greedy debt simplification against naive pairwise settlement'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=32)
+        parser.add_argument('--runs', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        samples = [random_balances(rng, options['members']) for _ in range(options['runs'])]
+
+        for name, settle in (('greedy', lambda b: simplify_debts({k: v / 100 for k, v in b.items()})),
+                             ('pairwise', pairwise_settlements)):
+            transfers = 0
+            elapsed = 0.0
+            for balances in samples:
+                start = time.perf_counter()
+                result = settle(balances)
+                elapsed += time.perf_counter() - start
+                transfers += len(result)
+
+            self.stdout.write(
+                f"{name:>8}: {transfers / len(samples):7.1f} transfers/group, "
+                f"{elapsed / len(samples) * 1e6:8.1f} us/group"
+            )
@@ -0,0 +1,81 @@
+import json
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Run in a fresh interpreter: set Django up, load the URLconf (and with it the
+# API and services), then report wall time, peak RSS and what got imported.
+PROBE = """
+import json, os, resource, sys, time
+start = time.perf_counter()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", {settings_module!r})
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+for name in {extra!r}:
+    __import__(name)
+print(json.dumps({{
+    "seconds": time.perf_counter() - start,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules),
+    "loaded": [name for name in {watch!r} if name in sys.modules],
+}}))
+"""
+
+# What services.py used to import when the app loaded.
+EAGER_IMPORTS = ["google.generativeai", "PIL.Image", "PIL.ImageOps"]
+WATCH = ["google.generativeai", "PIL"]
+
+
+def parse_importtime(stderr):
+    """Cumulative microseconds per top-level import from ``-X importtime`` output."""
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented under the module that imported them.
+        if cumulative.strip().isdigit() and not name[1:].startswith(" "):
+            totals[name.strip()] = totals.get(name.strip(), 0) + int(cumulative)
+    return totals
+
+
+class Command(BaseCommand):
+    help = 'Measures cold-start time, peak RSS and slowest imports of the app (python -X importtime)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--top', type=int, default=8, help='Slowest top-level imports to list')
+
+    def probe(self, extra):
+        code = PROBE.format(settings_module=settings.SETTINGS_MODULE, extra=extra, watch=WATCH)
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        )
+        return json.loads(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+    def measure(self, label, extra, runs, top):
+        samples = [self.probe(extra) for _ in range(runs)]
+        seconds = statistics.median(s['seconds'] for s, _ in samples)
+        rss = statistics.median(s['rss_mb'] for s, _ in samples)
+        stats, imports = samples[-1]
+        self.stdout.write(
+            f"{label}: {seconds * 1000:.0f} ms, {rss:.0f} MB peak RSS, {stats['modules']} modules "
+            f"(loaded: {', '.join(stats['loaded']) or 'none of ' + ', '.join(WATCH)})"
+        )
+        for name, us in sorted(imports.items(), key=lambda item: -item[1])[:top]:
+            self.stdout.write(f"    {us / 1000:8.1f} ms  {name}")
+        return seconds, rss
+
+    def handle(self, *args, **options):
+        lazy = self.measure('lazy (current)', [], options['runs'], options['top'])
+        eager = self.measure('eager (Gemini SDK and Pillow at load)', EAGER_IMPORTS, options['runs'], options['top'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Lazy loading saves {(eager[0] - lazy[0]) * 1000:.0f} ms ({1 - lazy[0] / eager[0]:.0%}) "
+            f"and {eager[1] - lazy[1]:.0f} MB per process"
+        ))
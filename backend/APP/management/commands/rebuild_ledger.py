@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from APP.ledger import rebuild_ledger, verify_ledger
+
+class Command(BaseCommand):
+    help = 'Rebuilds (or, with --verify, checks) the monthly balance ledger from raw expenses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=int, action='append', dest='groups', help='Limit to this group id (repeatable)')
+        parser.add_argument('--verify', action='store_true', help='Only report cells that differ from the raw expenses')
+
+    def handle(self, *args, **options):
+        group_ids = options['groups']
+
+        if options['verify']:
+            mismatches = verify_ledger(group_ids)
+            for mismatch in mismatches:
+                group_id, user_id, month = mismatch['cell']
+                self.stdout.write(
+                    f"group={group_id} user={user_id} month={month:%Y-%m} "
+                    f"expected paid/consumed={mismatch['expected']} stored={mismatch['stored']}"
+                )
+            if mismatches:
+                raise CommandError(f'{len(mismatches)} ledger cells are out of date')
+            self.stdout.write(self.style.SUCCESS('Ledger matches raw expenses'))
+            return
+
+        count = rebuild_ledger(group_ids)
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt {count} ledger rows'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from APP.rollups import rebuild_rollups, verify_rollups
+
+class Command(BaseCommand):
+    help = 'Rebuilds (or, with --verify, checks) the monthly category spend rollups from raw expenses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=int, action='append', dest='groups', help='Limit to this group id (repeatable)')
+        parser.add_argument('--verify', action='store_true', help='Only report rows that differ from the raw expenses')
+
+    def handle(self, *args, **options):
+        group_ids = options['groups']
+
+        if options['verify']:
+            mismatches = verify_rollups(group_ids)
+            for mismatch in mismatches:
+                group_id, month, category, payer_id, status = mismatch['cell']
+                self.stdout.write(
+                    f"group={group_id} month={month:%Y-%m} category={category} payer={payer_id} status={status} "
+                    f"expected count/total={mismatch['expected']} stored={mismatch['stored']}"
+                )
+            if mismatches:
+                raise CommandError(f'{len(mismatches)} rollup rows are out of date')
+            self.stdout.write(self.style.SUCCESS('Rollups match raw expenses'))
+            return
+
+        count = rebuild_rollups(group_ids)
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt {count} rollup rows'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from APP.jobs import drain, requeue_stale, run_worker
+
+class Command(BaseCommand):
+    help = 'Processes queued AI expense parse jobs (the ?async=true mode of the AI endpoints)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Maximum jobs parsed at the same time')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            requeue_stale()
+            processed = drain(options['concurrency'])
+            failed = sum(1 for job in processed if job.status == 'FAILED')
+            self.stdout.write(self.style.SUCCESS(f'Processed {len(processed)} jobs ({failed} failed)'))
+            return
+
+        self.stdout.write(f"Waiting for AI parse jobs (concurrency {options['concurrency']})...")
+        try:
+            run_worker(options['concurrency'], options['poll'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,78 @@
+"""Resolving the names an AI (or an import file) uses to group members."""
+from bisect import bisect_left
+
+
+def _fold(name):
+    return " ".join((name or "").casefold().split())
+
+
+class MemberIndex:
+    """Name lookup over a group's members, built once per request.
+
+    ``find(name)`` tries, in order, and stops at the first level with a
+    single match:
+
+    1. the exact name
+    2. the case- and whitespace-insensitive name
+    3. a whole word of a name ("rahul" for "Rahul Mehta")
+    4. a prefix of a name or of one of its words ("rah")
+    5. any substring of a name (the old behaviour)
+
+    A level with several matches (two Rahuls) resolves to nothing rather
+    than to an arbitrary member.
+    """
+
+    def __init__(self, members):
+        self.members = list(members)
+        self.exact = {}
+        self.folded = {}
+        self.tokens = {}
+        keys = {}
+        for member in self.members:
+            if not member.name:
+                continue
+            folded = _fold(member.name)
+            self.exact.setdefault(member.name, []).append(member)
+            self.folded.setdefault(folded, []).append(member)
+            keys.setdefault(folded, []).append(member)
+            for token in set(folded.split()):
+                self.tokens.setdefault(token, []).append(member)
+                keys.setdefault(token, []).append(member)
+        self._prefix_keys = sorted(keys)
+        self._prefix_members = keys
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def __len__(self):
+        return len(self.members)
+
+    def _prefixed(self, prefix):
+        found = []
+        i = bisect_left(self._prefix_keys, prefix)
+        while i < len(self._prefix_keys) and self._prefix_keys[i].startswith(prefix):
+            for member in self._prefix_members[self._prefix_keys[i]]:
+                if member not in found:
+                    found.append(member)
+            i += 1
+        return found
+
+    def find(self, name):
+        if not name or not str(name).strip():
+            return None
+        name = str(name)
+        folded = _fold(name)
+        levels = (
+            lambda: self.exact.get(name, []),
+            lambda: self.folded.get(folded, []),
+            lambda: self.tokens.get(folded, []),
+            lambda: self._prefixed(folded),
+            lambda: [m for m in self.members if m.name and folded in _fold(m.name)],
+        )
+        for level in levels:
+            candidates = level()
+            if len(candidates) == 1:
+                return candidates[0]
+            if candidates:
+                return None
+        return None
@@ -0,0 +1,227 @@
+"""Per-request stage timings and in-process Prometheus-style metrics.
+
+``ServerTimingMiddleware`` (in ``APP.middleware``) opens a timing scope for
+each request; code anywhere below it wraps work in ``timed("stage")``. At the
+end of the request the stages are written to the ``Server-Timing`` header and
+folded into histograms labelled by route, which ``/metrics`` exposes in the
+Prometheus text format.
+
+Metrics are per process: with several workers, scrape each one (or sum them
+in Prometheus).
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Stage name -> [seconds, count] for the request being handled, or None.
+_stages = ContextVar("request_stages", default=None)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in sorted(labels.items()):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(sorted(labels.items()))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(dict(key), value))
+        return lines
+
+    def _samples(self, labels, value):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels))
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ((0,) * len(self.buckets), 0.0, 0))
+            counts = tuple(c + 1 if value <= bound else c for c, bound in zip(counts, self.buckets))
+            self._values[key] = (counts, total + value, count + 1)
+
+    def count(self, **labels):
+        item = self._values.get(self._key(labels))
+        return item[2] if item else 0
+
+    def _samples(self, labels, value):
+        counts, total, count = value
+        lines = [
+            f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(float(bound))})} {c}"
+            for bound, c in zip(self.buckets, counts)
+        ]
+        lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {count}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(float(total))}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+REGISTRY = []
+_collectors = []
+
+
+def register_collector(collect):
+    """Register ``collect() -> iterable of lines`` for state kept elsewhere (cache stats)."""
+    _collectors.append(collect)
+    return collect
+
+
+def render_prometheus():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        lines.extend(collect())
+    return "\n".join(lines) + "\n"
+
+
+@register_collector
+def _cache_stats():
+    from django.core.cache import cache
+
+    if not hasattr(cache, "stats"):
+        return []
+    stats = cache.stats()
+    lines = [
+        "# HELP spendsplit_cache_operations_total Shared cache lookups and writes in this process.",
+        "# TYPE spendsplit_cache_operations_total counter",
+    ]
+    for result in ("hits", "misses", "sets", "compressed"):
+        lines.append(f'spendsplit_cache_operations_total{{result="{result}"}} {stats[result]}')
+    lines += [
+        "# HELP spendsplit_cache_bytes_total Pickled bytes written to the shared cache before and after compression.",
+        "# TYPE spendsplit_cache_bytes_total counter",
+        f'spendsplit_cache_bytes_total{{kind="in"}} {stats["bytes_in"]}',
+        f'spendsplit_cache_bytes_total{{kind="stored"}} {stats["bytes_stored"]}',
+    ]
+    return lines
+
+
+# ---------------------------------------------------------------------------
+# Request stage timing
+# ---------------------------------------------------------------------------
+STAGE_SECONDS = Histogram(
+    "spendsplit_request_stage_seconds",
+    "Time spent in each stage of a request (auth, clerk, user_sync, db, ai, render, total).",
+)
+DB_QUERIES = Histogram(
+    "spendsplit_request_db_queries",
+    "Database queries executed per request.",
+    buckets=COUNT_BUCKETS,
+)
+
+
+def record(stage, seconds, count=1):
+    stages = _stages.get()
+    if stages is None:
+        return
+    entry = stages.setdefault(stage, [0.0, 0])
+    entry[0] += seconds
+    entry[1] += count
+
+
+@contextmanager
+def timed(stage):
+    """Add the time spent in the block to ``stage`` for the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def start_request():
+    return _stages.set({})
+
+
+def finish_request(token, route, total):
+    """Close the request scope, observe histograms and return its stages."""
+    stages = _stages.get() or {}
+    _stages.reset(token)
+    stages["total"] = [total, 1]
+
+    for stage, (seconds, _) in stages.items():
+        STAGE_SECONDS.observe(seconds, route=route, stage=stage)
+    DB_QUERIES.observe(stages.get("db", [0.0, 0])[1], route=route)
+    return stages
+
+
+def server_timing_header(stages):
+    parts = []
+    for stage, (seconds, count) in stages.items():
+        part = f"{stage};dur={seconds * 1000:.1f}"
+        if stage == "db":
+            part += f';desc="{count} queries"'
+        parts.append(part)
+    return ", ".join(parts)
+
+
+def db_timing_wrapper(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record("db", time.perf_counter() - start)
@@ -1,51 +1,202 @@
+import hashlib
+import threading
+import time
+from collections import namedtuple
+
 import jwt
+import requests
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.http import JsonResponse, HttpResponse
 from django.conf import settings
 from clerk_backend_api import Clerk
 from .models import User
+from .ttlcache import TTLCache
+from .metrics import finish_request, server_timing_header, start_request, timed
+
+# Local user row and the Clerk profile it was last synced from.
+CachedProfile = namedtuple("CachedProfile", ["user", "fingerprint", "profile_version"])
+
+
+class JWKSUnavailable(Exception):
+    """The signing keys could not be fetched, so the token cannot be checked locally."""
+
+
+class UnknownSigningKey(jwt.InvalidTokenError):
+    """The token names a key id that is not in the (freshly refreshed) JWKS."""
+
+
+class JWKSCache:
+    """In-memory JSON Web Key Set with a TTL and refresh-on-unknown-kid.
+
+    Unknown key ids trigger at most one refetch per ``min_refresh_interval``
+    so tokens with made-up ``kid`` headers cannot hammer the JWKS endpoint.
+    A failed refresh keeps the keys already held and is not retried for
+    ``min_refresh_interval`` either, so an outage at the issuer does not
+    make every request wait on the fetch timeout. ``JWKSUnavailable`` is
+    only raised when there are no keys at all.
+    """
+
+    def __init__(self, url, headers=None, ttl=3600, min_refresh_interval=30, fetch=None):
+        self.url = url
+        self.headers = headers or {}
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.fetch = fetch or self._fetch
+        self._keys = {}
+        self._fetched_at = None
+        self._failed_at = None
+        self._error = None
+        self._lock = threading.Lock()
+
+    def _fetch(self):
+        response = requests.get(self.url, headers=self.headers, timeout=5)
+        response.raise_for_status()
+        return response.json()
+
+    def refresh(self):
+        try:
+            jwks = self.fetch()
+            keys = {jwk["kid"]: jwt.PyJWK(jwk).key for jwk in jwks.get("keys", []) if "kid" in jwk}
+        except Exception as e:
+            self._failed_at = time.monotonic()
+            self._error = JWKSUnavailable(str(e))
+            raise self._error from e
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+        self._failed_at = self._error = None
+
+    def get_key(self, kid):
+        with self._lock:
+            now = time.monotonic()
+            if self._fetched_at is None or now - self._fetched_at >= self.ttl:
+                due = True
+            else:
+                # Key rotation: the issuer may have published a new key.
+                due = kid not in self._keys and now - self._fetched_at >= self.min_refresh_interval
+            backing_off = self._failed_at is not None and now - self._failed_at < self.min_refresh_interval
+
+            if due and not backing_off:
+                try:
+                    self.refresh()
+                except JWKSUnavailable:
+                    if not self._keys:
+                        raise
+                    print(f"JWKS refresh failed, using cached keys: {self._error}")
+            elif not self._keys and self._error is not None:
+                raise self._error
+            return self._keys.get(kid)
+
+
+def verify_session_token(token, jwks, issuer=None, authorized_parties=None, leeway=5):
+    """Verify a Clerk session JWT locally and return its claims."""
+    header = jwt.get_unverified_header(token)
+    key = jwks.get_key(header.get("kid"))
+    if key is None:
+        raise UnknownSigningKey(f"Unknown signing key: {header.get('kid')}")
+
+    claims = jwt.decode(
+        token,
+        key=key,
+        algorithms=["RS256"],
+        issuer=issuer,
+        leeway=leeway,
+        options={"require": ["exp", "iat", "sub"], "verify_aud": False, "verify_iss": bool(issuer)},
+    )
+
+    # Clerk puts the requesting origin in `azp`; reject tokens minted for other sites.
+    if authorized_parties and claims.get("azp") and claims["azp"] not in authorized_parties:
+        raise jwt.InvalidTokenError(f"Unauthorized party: {claims['azp']}")
+    return claims
+
+
+class ServerTimingMiddleware:
+    """Times each request by stage and reports it in a ``Server-Timing`` header.
+
+    Must sit above ``ClerkAuthenticationMiddleware`` so auth time is included.
+    """
+    sync_capable = True
+    async_capable = True
 
-class ClerkAuthenticationMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
-        self.clerk = Clerk(bearer_auth=settings.CLERK_SECRET_KEY)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def finish(self, request, token, start, response):
+        match = getattr(request, "resolver_match", None)
+        # Route patterns, not raw paths, keep label cardinality bounded.
+        route = f"/{match.route}" if match and match.route else "unresolved"
+        stages = finish_request(token, route, time.perf_counter() - start)
+        if response is not None:
+            response["Server-Timing"] = server_timing_header(stages)
+        return response
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = start_request()
+        start = time.perf_counter()
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            self.finish(request, token, start, response)
+        return response
 
-        # Allow CORS preflight through without auth.
-        # Browsers do not include Authorization on OPTIONS requests.
-        if request.method == "OPTIONS":
-            return HttpResponse(status=200)
+    async def __acall__(self, request):
+        token = start_request()
+        start = time.perf_counter()
+        response = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.finish(request, token, start, response)
+        return response
 
-        # Skip admin & static routes
-        if request.path.startswith(("/admin", "/static", "/media")):
-            return self.get_response(request)
 
-        auth_header = request.headers.get("Authorization", "")
+class ClerkAuthenticationMiddleware:
+    sync_capable = True
+    async_capable = True
 
-        if not auth_header.startswith("Bearer "):
-            request.user = None
-            return JsonResponse({"error": "Authorization header missing"}, status=401)
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.clerk = Clerk(bearer_auth=settings.CLERK_SECRET_KEY)
+        self.profiles = TTLCache(
+            maxsize=settings.CLERK_PROFILE_CACHE_SIZE,
+            ttl=settings.CLERK_PROFILE_CACHE_TTL,
+        )
+        self.jwks = JWKSCache(
+            settings.CLERK_JWKS_URL,
+            headers={"Authorization": f"Bearer {settings.CLERK_SECRET_KEY}"},
+            ttl=settings.CLERK_JWKS_TTL,
+        )
 
-        token = auth_header.split(" ")[1]
+    def verify_locally(self, token):
+        return verify_session_token(
+            token,
+            self.jwks,
+            issuer=settings.CLERK_JWT_ISSUER,
+            authorized_parties=settings.CLERK_AUTHORIZED_PARTIES,
+        )
 
-        # STEP 1 — Verify Clerk session token
-        try:
-            from clerk_backend_api import AuthenticateRequestOptions
-            options = AuthenticateRequestOptions(secret_key=settings.CLERK_SECRET_KEY)
-            # print(f"DEBUG: Authenticating request {request.path}")
-            request_state = self.clerk.authenticate_request(request, options)
-            
-            if not request_state.is_signed_in:
-                 print(f"DEBUG: Auth failed for {request.path}. Token: {token[:10]}...")
-                 return JsonResponse({"error": "Invalid or expired token"}, status=401)
-                 
-            clerk_user_id = request_state.payload['sub']
-        except Exception as e:
-            return JsonResponse({"error": f"Authentication failed: {str(e)}"}, status=401)
+    def verify_remotely(self, request):
+        from clerk_backend_api import AuthenticateRequestOptions
+        options = AuthenticateRequestOptions(secret_key=settings.CLERK_SECRET_KEY)
+        request_state = self.clerk.authenticate_request(request, options)
+        if not request_state.is_signed_in:
+            return None
+        return request_state.payload
 
+    def sync_user(self, clerk_user_id, cached, profile_version):
+        """Fetch the Clerk profile and mirror it into the local User table."""
         # STEP 2 — Fetch Clerk user safely
         try:
-            clerk_user = self.clerk.users.get(user_id=clerk_user_id)
+            with timed("clerk"):
+                clerk_user = self.clerk.users.get(user_id=clerk_user_id)
         except Exception as e:
             print(f"Error fetching Clerk user: {e}")
             import traceback
@@ -65,47 +216,109 @@ class ClerkAuthenticationMiddleware:
         if clerk_user.email_addresses and len(clerk_user.email_addresses) > 0:
             email = clerk_user.email_addresses[0].email_address
 
-        # STEP 5 — Sync user into your database
-        user, created = User.objects.get_or_create(
-            clerk_user_id=clerk_user_id,
-            defaults={
-                "first_name": first_name,
-                "last_name": last_name,
-                "name": full_name,
-                "email": email,
-                "profile_image_url": clerk_user.profile_image_url,
-            }
-        )
+        profile = {
+            "first_name": first_name,
+            "last_name": last_name,
+            "name": full_name,
+            "email": email,
+            "profile_image_url": clerk_user.profile_image_url,
+        }
+        fingerprint = hashlib.sha256(repr(sorted(profile.items())).encode()).hexdigest()
+
+        if cached and cached.fingerprint == fingerprint:
+            # Profile unchanged since we last synced it; the row is current.
+            user = cached.user
+        else:
+            with timed("user_sync"):
+                # STEP 5 — Sync user into your database
+                user, created = User.objects.get_or_create(clerk_user_id=clerk_user_id, defaults=profile)
+
+                # STEP 6 — Update user if data changed (no duplicate saves)
+                if not created:
+                    changed = [field for field, value in profile.items() if getattr(user, field) != value]
+                    for field in changed:
+                        setattr(user, field, profile[field])
+                    if changed:
+                        user.save()
+
+        self.profiles.set(clerk_user_id, CachedProfile(user, fingerprint, profile_version))
+        return user
+
+    def authenticate(self, request, token):
+        """Return the token claims, or None if the token is not valid."""
+        if settings.CLERK_AUTH_MODE == "local":
+            try:
+                return self.verify_locally(token)
+            except (JWKSUnavailable, UnknownSigningKey):
+                # The local path could not decide; let Clerk decide if allowed.
+                if not settings.CLERK_AUTH_REMOTE_FALLBACK:
+                    return None
+            except jwt.InvalidTokenError:
+                return None
+        return self.verify_remotely(request)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.process_request(request)
+        if response is not None:
+            return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        # Token checks, Clerk calls and the user sync are blocking; run them in
+        # a thread so async views (the AI endpoints) keep the event loop free.
+        response = await sync_to_async(self.process_request)(request)
+        if response is not None:
+            return response
+        return await self.get_response(request)
 
-        # STEP 6 — Update user if data changed (no duplicate saves)
-        updated = False
+    def process_request(self, request):
+        """Attach the authenticated user, or return the response to send instead."""
 
-        if not created:
-            if user.first_name != first_name:
-                user.first_name = first_name
-                updated = True
+        # Allow CORS preflight through without auth.
+        # Browsers do not include Authorization on OPTIONS requests.
+        if request.method == "OPTIONS":
+            return HttpResponse(status=200)
 
-            if user.last_name != last_name:
-                user.last_name = last_name
-                updated = True
+        # Skip admin, static & metrics routes
+        if request.path.startswith(("/admin", "/static", "/media", "/metrics")):
+            return None
 
-            if user.name != full_name:
-                user.name = full_name
-                updated = True
+        auth_header = request.headers.get("Authorization", "")
 
-            if user.email != email:
-                user.email = email
-                updated = True
+        if not auth_header.startswith("Bearer "):
+            request.user = None
+            return JsonResponse({"error": "Authorization header missing"}, status=401)
 
-            if user.profile_image_url != clerk_user.profile_image_url:
-                user.profile_image_url = clerk_user.profile_image_url
-                updated = True
+        token = auth_header.split(" ")[1]
 
-            if updated:
-                user.save()
+        # STEP 1 — Verify Clerk session token (locally against the cached JWKS,
+        # or through Clerk's API when configured / as a fallback)
+        try:
+            with timed("auth"):
+                claims = self.authenticate(request, token)
+
+            if not claims:
+                 print(f"DEBUG: Auth failed for {request.path}. Token: {token[:10]}...")
+                 return JsonResponse({"error": "Invalid or expired token"}, status=401)
+
+            clerk_user_id = claims['sub']
+        except Exception as e:
+            return JsonResponse({"error": f"Authentication failed: {str(e)}"}, status=401)
+
+        # Warm path: a cached profile that is still fresh and, when the token
+        # carries `updated_at`, matches it — no Clerk call, no user-sync query.
+        cached = self.profiles.get(clerk_user_id)
+        profile_version = claims.get("updated_at")
+        if cached and (profile_version is None or cached.profile_version == profile_version):
+            user = cached.user
+        else:
+            user = self.sync_user(clerk_user_id, cached, profile_version)
+            if isinstance(user, HttpResponse):
+                return user
 
         # STEP 7 — Attach user to request
         request.user = user
         request.clerk_user_id = clerk_user_id
-
-        return self.get_response(request)
+        return None
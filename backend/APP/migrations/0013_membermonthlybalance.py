@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:47
+
+from collections import defaultdict
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import DateField, Sum
+from django.db.models.functions import TruncMonth
+
+# Frozen copy of APP.ledger.compute_ledger/rebuild_ledger as of this
+# migration, so later changes to that module cannot change what it does.
+COUNTED_STATUSES = ('APPROVED', 'DISPUTED')
+CENT = Decimal('0.01')
+
+
+def backfill_ledger(apps, schema_editor):
+    # Fill the ledger from the expenses that already exist.
+    Expense = apps.get_model('APP', 'Expense')
+    ExpenseSplit = apps.get_model('APP', 'ExpenseSplit')
+    MemberMonthlyBalance = apps.get_model('APP', 'MemberMonthlyBalance')
+
+    cells = defaultdict(lambda: [Decimal('0.00'), Decimal('0.00')])
+    paid_rows = (
+        Expense.objects.filter(status__in=COUNTED_STATUSES)
+        .annotate(month=TruncMonth('created_at', output_field=DateField()))
+        .values('group_id', 'payer_id', 'month')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+    for row in paid_rows:
+        cells[(row['group_id'], row['payer_id'], row['month'])][0] += Decimal(row['total']).quantize(CENT)
+
+    consumed_rows = (
+        ExpenseSplit.objects.filter(expense__status__in=COUNTED_STATUSES)
+        .annotate(month=TruncMonth('expense__created_at', output_field=DateField()))
+        .values('expense__group_id', 'user_id', 'month')
+        .annotate(total=Sum('owed_amount'))
+        .order_by()
+    )
+    for row in consumed_rows:
+        cells[(row['expense__group_id'], row['user_id'], row['month'])][1] += Decimal(row['total']).quantize(CENT)
+
+    MemberMonthlyBalance.objects.all().delete()
+    MemberMonthlyBalance.objects.bulk_create([
+        MemberMonthlyBalance(group_id=g, user_id=u, month=m, paid=paid, consumed=consumed)
+        for (g, u, m), (paid, consumed) in cells.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APP', '0012_expense_dispute_reason_alter_expense_status_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberMonthlyBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month the expenses were created in')),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('consumed', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_balances', to='APP.group')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_balances', to='APP.user')),
+            ],
+            options={
+                'unique_together': {('group', 'user', 'month')},
+            },
+        ),
+        migrations.RunPython(backfill_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APP', '0013_membermonthlybalance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['group', 'status', 'created_at'], name='expense_group_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='expensesplit',
+            index=models.Index(fields=['user', 'expense'], name='split_user_expense'),
+        ),
+        migrations.AddIndex(
+            model_name='grouplog',
+            index=models.Index(fields=['group', 'created_at'], name='grouplog_group_created'),
+        ),
+    ]
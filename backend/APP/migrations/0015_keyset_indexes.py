@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APP', '0014_expense_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['group', 'created_at', 'id'], name='expense_group_created_id'),
+        ),
+    ]
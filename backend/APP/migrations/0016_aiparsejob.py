@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APP', '0015_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIParseJob',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('TEXT', 'Text'), ('RECEIPT', 'Receipt')], max_length=10)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('text_input', models.TextField(blank=True, help_text='Expense text, or extra context for a receipt', null=True)),
+                ('image', models.BinaryField(blank=True, help_text='Receipt upload; cleared once the job finishes', null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('expense', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='APP.expense')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ai_jobs', to='APP.group')),
+                ('requested_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ai_jobs', to='APP.user')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='aijob_status_created')],
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:29
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncMonth
+
+# Frozen copy of APP.rollups.compute_rollups/rebuild_rollups as of this
+# migration, so later changes to that module cannot change what it does.
+CENT = Decimal('0.01')
+
+
+def backfill_rollups(apps, schema_editor):
+    # Fill the rollups from the expenses that already exist.
+    Expense = apps.get_model('APP', 'Expense')
+    MonthlyCategorySpend = apps.get_model('APP', 'MonthlyCategorySpend')
+
+    rows = (
+        Expense.objects.annotate(month=TruncMonth('created_at', output_field=DateField()))
+        .values('group_id', 'month', 'category', 'payer_id', 'status')
+        .annotate(count=Count('id'), total=Sum('amount'))
+        .order_by()
+    )
+    MonthlyCategorySpend.objects.all().delete()
+    MonthlyCategorySpend.objects.bulk_create([
+        MonthlyCategorySpend(
+            group_id=row['group_id'], month=row['month'], category=row['category'], payer_id=row['payer_id'],
+            status=row['status'], count=row['count'], total=Decimal(row['total']).quantize(CENT),
+        )
+        for row in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APP', '0016_aiparsejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyCategorySpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month the expenses were created in')),
+                ('category', models.CharField(max_length=50)),
+                ('status', models.CharField(max_length=10)),
+                ('count', models.IntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_spend', to='APP.group')),
+                ('payer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_spend', to='APP.user')),
+            ],
+            options={
+                'unique_together': {('group', 'month', 'category', 'payer', 'status')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
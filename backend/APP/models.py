@@ -89,6 +89,10 @@ class Expense(models.Model):
         ('BILLS', 'Bills')
     ]
 
+    # Statuses that count towards balances. Disputed expenses keep counting
+    # (benefit of the doubt) until they are rejected or deleted.
+    COUNTED_STATUSES = ('APPROVED', 'DISPUTED')
+
     id = models.AutoField(primary_key=True)
     group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='expenses')
     payer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='expenses_paid')
@@ -99,6 +103,12 @@ class Expense(models.Model):
     dispute_reason = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', 'status', 'created_at'], name='expense_group_status_created'),
+            models.Index(fields=['group', 'created_at', 'id'], name='expense_group_created_id'),
+        ]
+
     def __str__(self):
         return f"{self.description} - {self.amount} ({self.status})"
 
@@ -117,6 +127,11 @@ class ExpenseSplit(models.Model):
     owed_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='ACCEPTED')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'expense'], name='split_user_expense'),
+        ]
+
     def __str__(self):
         return f"{self.user} owes {self.owed_amount} ({self.status})"
 
@@ -134,5 +149,94 @@ class GroupLog(models.Model):
     details = models.TextField(help_text="Details about the action (e.g., user name, old/new group name)")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', 'created_at'], name='grouplog_group_created'),
+        ]
+
     def __str__(self):
         return f"[{self.group.name}] {self.action} - {self.created_at}"
+
+
+class MemberMonthlyBalance(models.Model):
+    """Materialized per-member balance for one group and calendar month.
+
+    Kept up to date incrementally by the expense/split signals in
+    ``APP.signals``; ``manage.py rebuild_ledger`` recomputes it from scratch.
+    """
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='monthly_balances')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='monthly_balances')
+    month = models.DateField(help_text="First day of the month the expenses were created in")
+    paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    consumed = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('group', 'user', 'month')
+
+    @property
+    def net(self):
+        return self.paid - self.consumed
+
+    def __str__(self):
+        return f"{self.user} in {self.group} ({self.month:%Y-%m}): {self.net}"
+
+
+class MonthlyCategorySpend(models.Model):
+    """Expense count and total for one group, month, category, payer and status.
+
+    Maintained incrementally like ``MemberMonthlyBalance`` (see
+    ``APP.rollups``); ``manage.py rebuild_rollups`` recomputes it.
+    """
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='category_spend')
+    month = models.DateField(help_text="First day of the month the expenses were created in")
+    category = models.CharField(max_length=50)
+    payer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='category_spend')
+    status = models.CharField(max_length=10)
+    count = models.IntegerField(default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('group', 'month', 'category', 'payer', 'status')
+
+    def __str__(self):
+        return f"{self.group} {self.month:%Y-%m} {self.category} by {self.payer}: {self.count} / {self.total}"
+
+
+class AIParseJob(models.Model):
+    """A queued AI parse of a text description or receipt image.
+
+    Created by the ``?async=true`` mode of the AI expense endpoints and drained
+    by ``manage.py run_ai_worker`` (see ``APP.jobs``).
+    """
+    KIND_CHOICES = [
+        ('TEXT', 'Text'),
+        ('RECEIPT', 'Receipt'),
+    ]
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    id = models.AutoField(primary_key=True)
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='ai_jobs')
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ai_jobs')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    text_input = models.TextField(null=True, blank=True, help_text="Expense text, or extra context for a receipt")
+    image = models.BinaryField(null=True, blank=True, help_text="Receipt upload; cleared once the job finishes")
+    expense = models.ForeignKey(Expense, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    error = models.TextField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='aijob_status_created'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} job {self.id} ({self.status})"
@@ -0,0 +1,284 @@
+"""Periods a group's balances can be analysed over.
+
+A ``Period`` is a calendar month, an ISO week (Monday to Sunday), the
+group's whole lifetime, or an explicit range of days, laid out in a time
+zone (the requesting user's, or ``TIME_ZONE``). Its bounds are a half-open
+``[start, end)`` pair of aware datetimes; the lifetime period has neither.
+
+Totals come from the cheapest source that is exact for the period:
+
+* the monthly ledger when both bounds are month starts in the server's
+  time zone (this month, a run of months, the lifetime);
+* otherwise grouped aggregates over expenses and splits with range
+  predicates on ``created_at``, which use the composite indexes.
+
+Once a period has ended its numbers only change if someone edits older
+expenses, so results for closed periods are cached without a timeout,
+keyed on the group's history version (``caching.history_version``).
+"""
+import zoneinfo
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .caching import history_version
+from .ledger import to_money
+from .metrics import Counter
+from .models import Expense, ExpenseSplit, Group, MemberMonthlyBalance, MonthlyCategorySpend
+
+KINDS = ("month", "week", "lifetime", "range")
+
+# A period counts as closed this long after it ends, so an expense stamped
+# just before the end but committed just after still lands in it first.
+CLOSE_GRACE = timedelta(minutes=5)
+
+CLOSED_LOOKUPS = Counter("spendsplit_period_cache_total", "Closed-period cache lookups by result.")
+
+
+class Period(namedtuple("Period", "kind start end tz")):
+    __slots__ = ()
+
+    @property
+    def label(self):
+        if self.kind == "month":
+            return f"{self.start:%B %Y}"
+        if self.kind == "week":
+            year, week, _ = self.start.isocalendar()
+            return f"Week {week}, {year}"
+        if self.kind == "lifetime":
+            return "All time"
+        last = (self.end - timedelta(days=1)).date()
+        return f"{self.start:%d %b %Y} - {last:%d %b %Y}"
+
+    @property
+    def key(self):
+        bounds = "" if self.start is None else f"{self.start.isoformat()}/{self.end.isoformat()}"
+        return f"{self.kind}:{self.tz}:{bounds}"
+
+    def is_closed(self, now=None):
+        return self.end is not None and self.end <= (now or timezone.now()) - CLOSE_GRACE
+
+    def describe(self):
+        return {
+            "kind": self.kind,
+            "label": self.label,
+            "start": self.start.isoformat() if self.start else None,
+            "end": self.end.isoformat() if self.end else None,
+            "timezone": str(self.tz),
+            "closed": self.is_closed(),
+        }
+
+
+def get_timezone(name=None):
+    if not name:
+        return timezone.get_default_timezone()
+    try:
+        return zoneinfo.ZoneInfo(name)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown time zone {name!r}")
+
+
+def today(tz):
+    return timezone.localtime(timezone.now(), tz).date()
+
+
+def _midnight(day, tz):
+    return datetime.combine(day, time(), tzinfo=tz)
+
+
+def calendar_month(day, tz):
+    first = day.replace(day=1)
+    following = (first + timedelta(days=32)).replace(day=1)
+    return Period("month", _midnight(first, tz), _midnight(following, tz), tz)
+
+
+def iso_week(day, tz):
+    monday = day - timedelta(days=day.weekday())
+    return Period("week", _midnight(monday, tz), _midnight(monday + timedelta(days=7), tz), tz)
+
+
+def lifetime(tz):
+    return Period("lifetime", None, None, tz)
+
+
+def date_range(first, last, tz):
+    """The days ``first`` to ``last``, both included."""
+    if last < first:
+        raise ValueError("start must not be after end")
+    return Period("range", _midnight(first, tz), _midnight(last + timedelta(days=1), tz), tz)
+
+
+def current_month(tz=None):
+    tz = tz or get_timezone()
+    return calendar_month(today(tz), tz)
+
+
+def default_period(group, tz=None):
+    """Trips (SHORT groups) are analysed as a whole, households month by month."""
+    tz = tz or get_timezone()
+    if group.type == "SHORT":
+        return lifetime(tz)
+    return calendar_month(today(tz), tz)
+
+
+def parse_period(group, kind=None, tz=None, at=None, start=None, end=None):
+    """The period an API request asks for; raises ``ValueError`` if it makes no sense.
+
+    ``at`` picks the month or week containing that day (default today);
+    ``start``/``end`` are the inclusive days of a range (``end`` defaults to today).
+    """
+    tz = get_timezone(tz)
+    if kind is None:
+        if start is None and end is None:
+            return default_period(group, tz)
+        kind = "range"
+
+    if kind == "month":
+        return calendar_month(at or today(tz), tz)
+    if kind == "week":
+        return iso_week(at or today(tz), tz)
+    if kind == "lifetime":
+        return lifetime(tz)
+    if kind == "range":
+        if start is None:
+            raise ValueError("A range needs a start date")
+        return date_range(start, end or today(tz), tz)
+    raise ValueError(f"period must be one of {', '.join(KINDS)}")
+
+
+def cache_dates(request):
+    """The local dates an analysis for ``request`` depends on, for response cache keys.
+
+    Which week, month or open range a request means, and whether it has
+    closed yet, follow from the query string and these two dates.
+    """
+    try:
+        tz = get_timezone(request.GET.get("tz"))
+    except ValueError:
+        tz = get_timezone()
+    now = timezone.now()
+    return timezone.localtime(now, tz).date(), timezone.localtime(now - CLOSE_GRACE, tz).date()
+
+
+def touches_closed(*moments):
+    """Whether an expense dated at any of ``moments`` may fall in a closed period."""
+    cutoff = timezone.now() - CLOSE_GRACE
+    return any(moment is not None and moment < cutoff for moment in moments)
+
+
+def _ledger_months(period):
+    """``(first, end)`` ledger months exactly covering ``period``, or None.
+
+    The ledger files expenses by month in the current (server) time zone, so
+    it only covers periods whose bounds are month starts in that zone.
+    """
+    bounds = []
+    for moment in (period.start, period.end):
+        local = timezone.localtime(moment)
+        if local.day != 1 or local.time() != time():
+            return None
+        bounds.append(local.date())
+    return bounds
+
+
+def range_totals(group_id, start, end):
+    """Paid and consumed per user for counted expenses in ``[start, end)``: two grouped queries."""
+    expenses = Expense.objects.filter(
+        group_id=group_id,
+        status__in=Expense.COUNTED_STATUSES,
+        created_at__gte=start,
+        created_at__lt=end
+    )
+    paid_by_user = {
+        row['payer']: row['paid']
+        for row in expenses.values('payer').annotate(paid=Sum('amount')).order_by()
+    }
+    consumed_by_user = {
+        row['user']: row['consumed']
+        for row in ExpenseSplit.objects.filter(expense__in=expenses)
+            .values('user').annotate(consumed=Sum('owed_amount')).order_by()
+    }
+    return paid_by_user, consumed_by_user
+
+
+def ledger_totals(group_id, months=None):
+    """Paid and consumed per user summed over ledger months ``[first, end)`` (all if None)."""
+    rows = MemberMonthlyBalance.objects.filter(group_id=group_id)
+    if months is not None:
+        rows = rows.filter(month__gte=months[0], month__lt=months[1])
+    paid_by_user, consumed_by_user = {}, {}
+    for row in rows.values('user_id').annotate(paid=Sum('paid'), consumed=Sum('consumed')).order_by():
+        paid_by_user[row['user_id']] = to_money(row['paid'])
+        consumed_by_user[row['user_id']] = to_money(row['consumed'])
+    return paid_by_user, consumed_by_user
+
+
+def summarize(group, paid_by_user, consumed_by_user):
+    """The financials dict (see ``services.get_monthly_financials``) from per-user totals."""
+    members = list(group.members.all())
+    member_count = len(members)
+
+    raw_balances = {}
+    paid_totals = {}
+    consumed_totals = {}
+    for user in members:
+        paid = paid_by_user.get(user.id, 0)
+        consumed = consumed_by_user.get(user.id, 0)
+        raw_balances[user] = paid if member_count == 1 else paid - consumed
+        paid_totals[user] = paid
+        consumed_totals[user] = consumed
+
+    return {
+        # Total includes expenses paid by people who have since left the group.
+        "total_spend": float(sum(paid_by_user.values(), 0)),
+        "balances": raw_balances,
+        "paid": paid_totals,
+        "consumed": consumed_totals,
+        "group": group,
+        "member_count": member_count
+    }
+
+
+def period_financials(group_id, period):
+    try:
+        group = Group.objects.get(id=group_id)
+    except Group.DoesNotExist:
+        return {"total_spend": 0, "balances": {}}
+
+    if period.start is None:
+        totals = ledger_totals(group.id)
+    else:
+        months = _ledger_months(period)
+        totals = ledger_totals(group.id, months) if months else range_totals(group.id, period.start, period.end)
+    return summarize(group, *totals)
+
+
+def transaction_counts(group_id, period):
+    """Expenses each member paid for in ``period``, whatever their status: {user_id: count}."""
+    months = None if period.start is None else _ledger_months(period)
+    if period.start is not None and months is None:
+        rows = Expense.objects.filter(group_id=group_id, created_at__gte=period.start, created_at__lt=period.end)
+        return dict(rows.values('payer').annotate(n=Count('id')).order_by().values_list('payer', 'n'))
+
+    rows = MonthlyCategorySpend.objects.filter(group_id=group_id)
+    if months is not None:
+        rows = rows.filter(month__gte=months[0], month__lt=months[1])
+    return dict(rows.values('payer_id').annotate(n=Sum('count')).order_by().values_list('payer_id', 'n'))
+
+
+def cached(name, group_id, period, compute):
+    """``compute()``, kept indefinitely once ``period`` has closed."""
+    if not period.is_closed():
+        return compute()
+    key = f"period:{name}:{group_id}:{history_version(group_id)}:{period.key}"
+    result = cache.get(key)
+    if result is not None:
+        CLOSED_LOOKUPS.inc(result="hit")
+        return result
+    CLOSED_LOOKUPS.inc(result="miss")
+    result = compute()
+    cache.set(key, result, timeout=None)
+    return result
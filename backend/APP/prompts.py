@@ -0,0 +1,163 @@
+"""Prompts sent to Gemini, built from a cached, compact group context.
+
+Every prompt is laid out as::
+
+    instructions for the task      fixed text, identical on every call
+    members and balances           changes only when the group changes
+    current user and input         different on every call
+
+so calls for the same group share a long identical prefix, which providers
+that cache prompt prefixes can reuse. The members and balances are fetched
+once per group version (see ``caching``) and month, instead of on every
+call.
+
+Prompts are kept under ``AI_PROMPT_TOKEN_BUDGET`` estimated tokens: the
+input is capped at half the budget, and the context is trimmed to what is
+left (largest balances and the current user first). The token count and
+build time of every prompt are recorded as metrics.
+"""
+import math
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .caching import group_version
+from .ledger import get_ledger_financials
+from .metrics import Counter, Histogram, timed
+
+TOKEN_BUCKETS = (100, 200, 500, 1000, 2000, 4000, 8000, 16000)
+
+PROMPT_TOKENS = Histogram(
+    "spendsplit_ai_prompt_tokens", "Estimated tokens per AI prompt, by prompt kind.", buckets=TOKEN_BUCKETS
+)
+PROMPT_BUILD = Histogram("spendsplit_ai_prompt_build_seconds", "Time to build an AI prompt, by prompt kind.")
+CONTEXT_LOOKUPS = Counter("spendsplit_ai_context_lookups_total", "Prompt group context lookups by result.")
+
+# Members in the group's order; balances as (name, "+12.50") sorted largest
+# first, without zeros.
+GroupContext = namedtuple("GroupContext", ["members", "balances"])
+
+CATEGORY_LIST = "Food, Transportation, Entertainment, Miscellaneous, Supplies, Bills"
+EXPENSE_JSON = (
+    '{"description": str, "amount": number, "payer_name": str, '
+    '"splits": [{"user_name": str, "amount": number}], "category": str}'
+)
+
+EXPENSE_INSTRUCTIONS = f"""You are an expense parser for a group that shares expenses.
+Translate the input to English if needed. Identify the payer, amount, description, splits and one category from: {CATEGORY_LIST}.
+Balances: positive = owed to them, negative = they owe.
+If the current user says they paid back all their debts: when their balance is negative, the amount is its absolute value and the splits go to members with positive balances (proportionally, or in full if it matches); otherwise the amount is 0.
+Output JSON: {EXPENSE_JSON}"""
+
+RECEIPT_INSTRUCTIONS = f"""You are a receipt parser for a group that shares expenses.
+Read the receipt image and any additional context. Identify the payer, amount, description, splits and one category from: {CATEGORY_LIST}.
+Rules:
+1. If specific items are visible, use them to choose the category.
+2. If the context says who shared it ("Dinner for me and Bob"), split between those members.
+3. Otherwise split equally among all members.
+4. The payer is the current user unless the receipt or context says otherwise.
+Output JSON: {EXPENSE_JSON}"""
+
+BATCH_INSTRUCTIONS = f"""You are an expense parser for a group that shares expenses. Each numbered line of the input is a separate expense.
+For every line: translate to English if needed, identify the payer, amount, description, splits and one category from: {CATEGORY_LIST}.
+If a line has no splits, split it equally among all members. If a line is not an expense, return its number with an "error" explaining why.
+Balances: positive = owed to them, negative = they owe.
+Output JSON: a list of {EXPENSE_JSON[:-1]}, "line": number}}"""
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English text)."""
+    return math.ceil(len(text) / 4)
+
+
+def _truncate(text, max_tokens):
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[: max(max_tokens * 4 - 1, 0)] + "…"
+
+
+def group_context(group_id):
+    """Members and this month's balances of a group, cached per group version."""
+    month = timezone.localtime().strftime("%Y-%m")
+    key = f"prompt-context:{group_id}:{group_version(group_id)}:{month}"
+    context = cache.get(key)
+    if context is not None:
+        CONTEXT_LOOKUPS.inc(result="hit")
+        return context
+
+    CONTEXT_LOOKUPS.inc(result="miss")
+    balances = get_ledger_financials(group_id).get("balances", {})
+    context = GroupContext(
+        members=tuple(user.name for user in balances),
+        balances=tuple(
+            (user.name, f"{amount:+.2f}")
+            for user, amount in sorted(balances.items(), key=lambda item: (-abs(item[1]), item[0].name))
+            if amount
+        ),
+    )
+    cache.set(key, context, settings.AI_CACHE_TTL)
+    return context
+
+
+def _fit(names, current_user_name, render, budget):
+    """The longest prefix of ``names`` (always keeping the current user) that renders within ``budget``."""
+    names = list(names)
+    if estimate_tokens(render(names, 0)) <= budget:
+        return render(names, 0)
+    kept = [n for n in names if n == current_user_name]
+    rest = [n for n in names if n != current_user_name]
+    while rest and estimate_tokens(render(kept + rest[:1], len(rest) - 1)) <= budget:
+        kept.append(rest.pop(0))
+    return render(kept, len(rest))
+
+
+def render_context(context, current_user_name, budget):
+    """The members/balances block, trimmed to ``budget`` estimated tokens."""
+    def members_line(names, hidden):
+        return "Members: " + ", ".join(names) + (f" (+{hidden} more)" if hidden else "")
+
+    amounts = dict(context.balances)
+
+    def balances_line(names, hidden):
+        shown = ", ".join(f"{name} {amounts[name]}" for name in names) or "all settled"
+        return "Balances: " + shown + (f" (+{hidden} smaller)" if hidden else "")
+
+    members = _fit(context.members, current_user_name, members_line, budget // 2)
+    balances = _fit(
+        [name for name, _ in context.balances], current_user_name, balances_line,
+        budget - estimate_tokens(members),
+    )
+    return f"{members}\n{balances}"
+
+
+def build_prompt(kind, instructions, context, current_user_name, input_text):
+    start = time.perf_counter()
+    with timed("prompt"):
+        budget = settings.AI_PROMPT_TOKEN_BUDGET
+        input_text = _truncate(input_text, budget // 2)
+        user_line = f"Current user: {current_user_name}"
+        fixed = estimate_tokens(instructions) + estimate_tokens(user_line) + estimate_tokens(input_text)
+        context_text = render_context(context, current_user_name, max(budget - fixed, 0))
+        prompt = f"{instructions}\n\n{context_text}\n{user_line}\n\n{input_text}"
+    PROMPT_BUILD.observe(time.perf_counter() - start, kind=kind)
+    PROMPT_TOKENS.observe(estimate_tokens(prompt), kind=kind)
+    return prompt
+
+
+def expense_prompt(text_input, current_user_name, context):
+    return build_prompt("text", EXPENSE_INSTRUCTIONS, context, current_user_name, f'Input: "{text_input}"')
+
+
+def receipt_prompt(current_user_name, context, text_context=None):
+    return build_prompt(
+        "receipt", RECEIPT_INSTRUCTIONS, context, current_user_name,
+        f"Additional context: {text_context or 'None'}",
+    )
+
+
+def batch_prompt(numbered_lines, current_user_name, context):
+    lines = "\n".join(f"{n}. {line}" for n, line in numbered_lines)
+    return build_prompt("batch", BATCH_INSTRUCTIONS, context, current_user_name, f"Input:\n{lines}")
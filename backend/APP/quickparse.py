@@ -0,0 +1,352 @@
+"""Deterministic fast path for simple expense texts.
+
+Most inputs look like "I paid 450 for pizza split with Rahul and Amit". A
+few regular expressions handle them in microseconds, where Gemini takes
+seconds. ``quick_parse`` returns the same JSON shape as the model, plus a
+confidence score. Anything it is unsure about goes to Gemini, for example:
+
+- settling debts
+- percentages or per-head amounts
+- several competing amounts
+- names that are not group members
+- non-English text
+
+Confidence starts at 1 and is multiplied down for every field that had to
+be defaulted. ``QUICKPARSE_MIN_CONFIDENCE`` decides when it is trusted.
+``manage.py bench_quickparse`` measures coverage and accuracy on the
+labelled corpus in ``APP/corpora/quickparse.jsonl``.
+"""
+import json
+import re
+import time
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+QuickParse = namedtuple("QuickParse", ["parsed", "confidence", "reason"])
+
+CATEGORY_KEYWORDS = {
+    "Food": (
+        "food", "pizza", "burger", "dinner", "lunch", "breakfast", "brunch", "snacks", "snack", "chai", "tea",
+        "coffee", "cafe", "restaurant", "biryani", "dosa", "swiggy", "zomato", "groceries", "grocery", "drinks",
+        "beer", "juice", "icecream", "dessert", "cake", "meal", "meals", "momos", "maggi", "fruits", "vegetables",
+    ),
+    "Transportation": (
+        "uber", "ola", "rapido", "cab", "taxi", "auto", "rickshaw", "bus", "train", "metro", "flight", "flights",
+        "fuel", "petrol", "diesel", "toll", "parking", "ride", "tickets to", "travel",
+    ),
+    "Entertainment": (
+        "movie", "movies", "cinema", "netflix", "concert", "game", "games", "bowling", "party", "club", "show",
+        "spotify", "prime", "hotstar", "outing", "trip",
+    ),
+    "Bills": (
+        "rent", "electricity", "wifi", "internet", "bill", "bills", "recharge", "water", "gas", "maintenance",
+        "subscription", "emi",
+    ),
+    "Supplies": (
+        "supplies", "toiletries", "detergent", "soap", "shampoo", "stationery", "cleaning", "utensils",
+        "toilet paper", "tissues", "dustbin", "bulb", "household",
+    ),
+}
+DEFAULT_CATEGORY = "Miscellaneous"
+
+# Anything about settling up, uneven shares or exclusions needs the model.
+HARD = re.compile(
+    r"%|\b(back|debts?|owe[sd]?|owing|settle[sd]?|settling|return(?:ed)?|repaid|refund(?:ed)?|except|excluding|"
+    r"without|but not|not|each|per|head|half|twice|thrice|times|ratio|rest|remaining|extra|more|less|we|"
+    r"they|someone|somebody|split it later|yesterday's)\b",
+    re.IGNORECASE,
+)
+
+AMOUNT = re.compile(
+    r"(?P<pre>₹|rs\.?|inr|\$|€)?\s*(?P<num>\d[\d,]*(?:\.\d+)?)\s*(?P<k>k\b)?\s*(?P<post>rs\b|rupees|bucks|inr\b|/-)?",
+    re.IGNORECASE,
+)
+SELF_PAID = re.compile(
+    r"^\s*(?:paid|spent|bought|ordered|booked)\b(?!\s+by\b)|\bi\s+(?:just\s+|have\s+|had\s+)?"
+    r"(?:paid|spent|bought|covered|ordered|booked|got)\b|\bpaid\s+by\s+me\b|\bmy\s+treat\b|\bon\s+me\b",
+    re.IGNORECASE,
+)
+PAID_VERBS = r"(?:paid|spent|bought|covered|ordered|booked)"
+# The word before a paying verb, and the word after "paid by": who paid.
+PAYER_WORD = re.compile(
+    r"\b(?P<subject>[a-z]+)\s+(?:just\s+|has\s+|had\s+)?" + PAID_VERBS + r"\b|\bpaid\s+by\s+(?P<agent>[a-z]+)",
+    re.IGNORECASE,
+)
+# Words in those places that are not a person outside the group.
+NOT_PAYERS = {
+    "i", "me", "myself", "just", "has", "had", "have", "already", "also", "was", "is", "been", "and", "then",
+    "who", "which", "that", "it", "my", "the", "rs", "inr", "rupees", "bucks", "k",
+    "card", "cash", "upi", "gpay", "paytm", "phonepe", "credit", "debit", "netbanking",
+}
+SPLIT_START = re.compile(r"\b(?:split|splitting|shared?|divided?|with|among|amongst|between)\b", re.IGNORECASE)
+ALL_MEMBERS = re.compile(
+    r"\b(?:all|everyone|everybody|every\s*one|the\s+group|the\s+gang|whole\s+group|all\s+of\s+us|equally|evenly)\b",
+    re.IGNORECASE,
+)
+SELF_MENTION = re.compile(r"\b(?:me|myself|us|i)\b", re.IGNORECASE)
+FOR_CLAUSE = re.compile(r"\b(?:for|on)\s+(?P<what>[a-z][a-z '&-]*)", re.IGNORECASE)
+
+# Words allowed in the split clause besides member names.
+SPLIT_FILLER = {
+    "split", "splitting", "share", "shared", "divide", "divided", "with", "among", "amongst", "between", "and",
+    "me", "myself", "us", "i", "all", "everyone", "everybody", "every", "one", "the", "group", "gang", "whole",
+    "of", "equally", "evenly", "it", "this", "that", "too", "also", "both", "three", "four", "guys", "please",
+    "pls", "plz", "bill", "amount", "cost",
+}
+DESCRIPTION_STOP = {
+    "split", "splitting", "shared", "share", "with", "among", "between", "and", "divided", "paid", "by", "me", "us", "myself",
+}
+
+
+def _money(text):
+    try:
+        return Decimal(text)
+    except InvalidOperation:
+        return None
+
+
+def _amount(text):
+    """(amount, confidence factor) or (None, reason)."""
+    candidates = []
+    for match in AMOUNT.finditer(text):
+        value = _money(match.group("num").replace(",", ""))
+        if value is None or value <= 0:
+            continue
+        if match.group("k"):
+            value *= 1000
+        candidates.append((value, bool(match.group("pre") or match.group("post") or match.group("k"))))
+
+    values = {value for value, _ in candidates}
+    if not values:
+        return None, "no amount"
+    if len(values) == 1:
+        return values.pop(), 1.0
+    marked = {value for value, has_currency in candidates if has_currency}
+    if len(marked) == 1:
+        return marked.pop(), 0.9
+    return None, "several amounts"
+
+
+def _name_patterns(members):
+    """Regex per member: the full name, plus the first name when it is unique."""
+    first_names = {}
+    for name in members:
+        first_names.setdefault(name.split()[0].lower(), []).append(name)
+
+    patterns = {}
+    for name in members:
+        options = [re.escape(name.lower())]
+        first = name.split()[0].lower()
+        if len(first_names[first]) == 1 and first != name.lower():
+            options.append(re.escape(first))
+        patterns[name] = re.compile(r"\b(?:" + "|".join(options) + r")\b", re.IGNORECASE)
+    return patterns
+
+
+def _category(text):
+    lowered = text.lower()
+    found = []
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        for keyword in keywords:
+            match = re.search(r"\b" + re.escape(keyword) + r"\b", lowered)
+            if match:
+                found.append((match.start(), category, keyword))
+                break
+    if not found:
+        return DEFAULT_CATEGORY, None, 0.85
+    found.sort()
+    confidence = 1.0 if len({category for _, category, _ in found}) == 1 else 0.9
+    return found[0][1], found[0][2], confidence
+
+
+def _description(text, split_at, keyword):
+    head = text[:split_at]
+    match = FOR_CLAUSE.search(head)
+    if match:
+        words = []
+        for word in match.group("what").split():
+            if word.lower() in DESCRIPTION_STOP:
+                break
+            words.append(word)
+        if words:
+            description = " ".join(words).strip(" '-&")
+            return description[:1].upper() + description[1:], 1.0
+    if keyword:
+        return keyword[:1].upper() + keyword[1:], 1.0
+    return "Expense", 0.9
+
+
+def _equal_splits(amount, names):
+    cents = int((amount * 100).to_integral_value())
+    share, remainder = divmod(cents, len(names))
+    # Leftover cents go to the first people (the payer first), so the splits
+    # always add up to the amount exactly.
+    return [
+        {"user_name": name, "amount": float(Decimal(share + (1 if i < remainder else 0)) / 100)}
+        for i, name in enumerate(names)
+    ]
+
+
+def _unknown_payer(text, members):
+    """A name that paid (``"Karan paid"``, ``"paid by Karan"``) but is not a member, or None."""
+    member_words = {word.lower() for name in members for word in name.split()}
+    for match in PAYER_WORD.finditer(text):
+        word = (match.group("subject") or match.group("agent")).lower()
+        if word not in member_words and word not in NOT_PAYERS:
+            return word
+    return None
+
+
+def quick_parse(text, members, current_user_name):
+    """Parse ``text`` locally. ``members`` are the group's member names."""
+    members = [name for name in members if name]
+    if not text or not text.strip():
+        return QuickParse(None, 0.0, "empty")
+    if any(ch.isalpha() and ord(ch) > 127 for ch in text):
+        return QuickParse(None, 0.0, "non-English text")
+    if HARD.search(text):
+        return QuickParse(None, 0.0, "needs judgement")
+    if current_user_name not in members:
+        return QuickParse(None, 0.0, "current user is not a member")
+
+    confidence = 1.0
+    amount, factor = _amount(text)
+    if amount is None:
+        return QuickParse(None, 0.0, factor)
+    confidence *= factor
+
+    patterns = _name_patterns(members)
+    mentions = {name: list(pattern.finditer(text)) for name, pattern in patterns.items()}
+    mentions = {name: found for name, found in mentions.items() if found}
+
+    # Payer. Someone outside the group must not default to the current user.
+    if _unknown_payer(text, members):
+        return QuickParse(None, 0.0, "unknown payer")
+    payer = None
+    payer_span = None
+    for name in mentions:
+        match = re.search(
+            patterns[name].pattern + r"\s+(?:just\s+|has\s+|had\s+)?" + PAID_VERBS + r"\b|\bpaid\s+by\s+" + patterns[name].pattern,
+            text,
+            re.IGNORECASE,
+        )
+        if match:
+            if payer is not None:
+                return QuickParse(None, 0.0, "several payers")
+            payer, payer_span = name, match.span()
+    if SELF_PAID.search(text):
+        if payer is not None and payer != current_user_name:
+            return QuickParse(None, 0.0, "conflicting payers")
+        payer = current_user_name
+    if payer is None:
+        payer = current_user_name
+        confidence *= 0.9
+
+    # Participants
+    split_match = SPLIT_START.search(text)
+    split_at = split_match.start() if split_match else len(text)
+    clause = text[split_at:]
+
+    unexplained = [
+        name for name, found in mentions.items()
+        if not any(m.start() >= split_at or (payer_span and payer_span[0] <= m.start() < payer_span[1]) for m in found)
+    ]
+    if unexplained:
+        return QuickParse(None, 0.0, f"unclear role for {unexplained[0]}")
+
+    everyone = [payer] + [name for name in members if name != payer]
+    if split_match is None:
+        participants = everyone
+        confidence *= 0.9
+    elif ALL_MEMBERS.search(clause):
+        participants = everyone
+    else:
+        leftover = clause
+        for name in mentions:
+            leftover = patterns[name].sub(" ", leftover)
+        words = re.findall(r"[a-z]+", leftover.lower())
+        unknown = [word for word in words if word not in SPLIT_FILLER]
+        if unknown:
+            return QuickParse(None, 0.0, f"unknown word '{unknown[0]}' in split")
+        named = [name for name in members if name in mentions and any(m.start() >= split_at for m in mentions[name])]
+        if SELF_MENTION.search(clause) and current_user_name not in named:
+            named.append(current_user_name)
+        if not named:
+            return QuickParse(None, 0.0, "split without names")
+        participants = [payer] + [name for name in named if name != payer]
+
+    category, keyword, factor = _category(text)
+    confidence *= factor
+    description, factor = _description(text, split_at, keyword)
+    confidence *= factor
+
+    parsed = {
+        "description": description,
+        "amount": float(amount),
+        "payer_name": payer,
+        "splits": _equal_splits(amount, participants),
+        "category": category,
+    }
+    return QuickParse(parsed, round(confidence, 4), "ok")
+
+
+# ---------------------------------------------------------------------------
+# Labelled corpus
+# ---------------------------------------------------------------------------
+CORPUS_PATH = Path(__file__).resolve().parent / "corpora" / "quickparse.jsonl"
+
+
+def load_corpus(path=CORPUS_PATH):
+    """Cases from a JSONL corpus; a first line ``{"defaults": {...}}`` fills in members/user.
+
+    Each case has ``text`` and ``expected``: amount, payer_name, participants
+    and category, or null when the input should be left to the model.
+    """
+    cases = []
+    defaults = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            case = json.loads(line)
+            if "defaults" in case:
+                defaults = case["defaults"]
+                continue
+            cases.append({**defaults, **case})
+    return cases
+
+
+def matches(parsed, expected):
+    return (
+        Decimal(str(parsed["amount"])) == Decimal(str(expected["amount"]))
+        and parsed["payer_name"] == expected["payer_name"]
+        and {split["user_name"] for split in parsed["splits"]} == set(expected["participants"])
+        and parsed["category"] == expected["category"]
+    )
+
+
+def evaluate(cases, min_confidence):
+    """Coverage and accuracy of ``quick_parse`` on labelled cases."""
+    report = {"cases": len(cases), "local": 0, "correct": 0, "wrong": [], "missed": [], "seconds": 0.0}
+    for case in cases:
+        start = time.perf_counter()
+        result = quick_parse(case["text"], case["members"], case["user"])
+        report["seconds"] += time.perf_counter() - start
+
+        local = result.parsed is not None and result.confidence >= min_confidence
+        expected = case["expected"]
+        if local:
+            report["local"] += 1
+            if expected is not None and matches(result.parsed, expected):
+                report["correct"] += 1
+            else:
+                report["wrong"].append((case["text"], result.parsed))
+        elif expected is not None:
+            report["missed"].append((case["text"], result.reason))
+
+    simple = sum(1 for case in cases if case["expected"] is not None)
+    report["coverage"] = report["local"] / len(cases) if cases else 0.0
+    report["recall"] = report["correct"] / simple if simple else 0.0
+    report["precision"] = report["correct"] / report["local"] if report["local"] else 1.0
+    return report
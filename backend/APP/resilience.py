@@ -0,0 +1,225 @@
+"""Deadlines, retries and a circuit breaker around AI provider calls.
+
+Every call has a total deadline of ``AI_TIMEOUT_SECONDS``, shared by all of
+its attempts. Transient failures (timeouts, dropped connections, 429 and
+5xx responses) are retried up to ``AI_RETRIES`` times with full-jitter
+exponential backoff, as long as time remains. A call that still fails
+raises ``AITimeout`` or, for other transient errors, ``AIUnavailable``;
+anything else (a rejected request, say) is raised unchanged.
+
+Each provider has a ``CircuitBreaker``. It opens when at least
+``AI_BREAKER_THRESHOLD`` of the last ``AI_BREAKER_WINDOW`` attempts failed
+(once ``AI_BREAKER_MIN_CALLS`` have been made). While it is open, calls fail
+at once with ``AIUnavailable`` instead of waiting on a degraded endpoint.
+After ``AI_BREAKER_RESET_SECONDS`` one trial call is let through: success
+closes the breaker, failure opens it again.
+"""
+import asyncio
+import random
+import threading
+import time
+import weakref
+from collections import deque
+
+from django.conf import settings
+
+from .metrics import Counter, Histogram, register_collector
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CALLS = Counter("spendsplit_ai_calls_total", "AI provider call attempts by outcome.")
+CALL_SECONDS = Histogram("spendsplit_ai_call_seconds", "AI provider call attempt latency by outcome.")
+
+# Exception class names (anywhere in the MRO) worth retrying; matched by
+# name so google.api_core need not be imported.
+TRANSIENT_NAMES = {
+    "ServiceUnavailable", "TooManyRequests", "ResourceExhausted", "InternalServerError", "BadGateway",
+    "GatewayTimeout", "DeadlineExceeded", "Aborted", "RetryError",
+}
+TRANSIENT_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class AITimeout(TimeoutError):
+    pass
+
+
+class AIUnavailable(Exception):
+    pass
+
+
+def is_timeout(exc):
+    return isinstance(exc, TimeoutError) or any(cls.__name__ == "DeadlineExceeded" for cls in type(exc).__mro__)
+
+
+def is_transient(exc):
+    if is_timeout(exc) or isinstance(exc, ConnectionError):
+        return True
+    if any(cls.__name__ in TRANSIENT_NAMES for cls in type(exc).__mro__):
+        return True
+    return getattr(exc, "code", None) in TRANSIENT_CODES
+
+
+def backoff(attempt):
+    """Full jitter: a random delay up to ``AI_RETRY_BACKOFF * 2**attempt`` seconds."""
+    return random.uniform(0, settings.AI_RETRY_BACKOFF * 2 ** attempt)
+
+
+class CircuitBreaker:
+    def __init__(self, name, threshold=None, min_calls=None, window=None, reset_after=None, clock=time.monotonic):
+        self.name = name
+        self.threshold = settings.AI_BREAKER_THRESHOLD if threshold is None else threshold
+        self.min_calls = settings.AI_BREAKER_MIN_CALLS if min_calls is None else min_calls
+        self.reset_after = settings.AI_BREAKER_RESET_SECONDS if reset_after is None else reset_after
+        self.clock = clock
+        self._outcomes = deque(maxlen=settings.AI_BREAKER_WINDOW if window is None else window)
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _state(self):
+        if self._opened_at is None:
+            return CLOSED
+        if self.clock() - self._opened_at >= self.reset_after:
+            return HALF_OPEN
+        return OPEN
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def before_call(self):
+        """Raise ``AIUnavailable`` unless a call may go ahead now.
+
+        Returns True for the half-open trial call; pass it back to ``record``.
+        """
+        with self._lock:
+            state = self._state()
+            if state == CLOSED:
+                return False
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+        CALLS.inc(breaker=self.name, outcome="rejected")
+        raise AIUnavailable("The AI service is temporarily unavailable; try again shortly")
+
+    def record(self, ok, probe=False):
+        """Count a finished call; ``ok=None`` for a call abandoned without an outcome."""
+        with self._lock:
+            if probe:
+                self._probing = False
+                if ok:
+                    self._opened_at = None
+                    self._outcomes.clear()
+                elif ok is not None:
+                    self._opened_at = self.clock()
+            elif self._opened_at is not None or ok is None:
+                # Started before the breaker opened; the trial call decides.
+                pass
+            else:
+                self._outcomes.append(ok)
+                failures = self._outcomes.count(False)
+                if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.threshold:
+                    self._opened_at = self.clock()
+
+
+_breakers = weakref.WeakKeyDictionary()
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(provider):
+    """The circuit breaker of a provider instance."""
+    with _breakers_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = _breakers[provider] = CircuitBreaker(provider.name or type(provider).__name__)
+        return breaker
+
+
+@register_collector
+def _breaker_states():
+    lines = [
+        "# HELP spendsplit_ai_breaker_state AI circuit breaker state: 0 closed, 1 half-open, 2 open.",
+        "# TYPE spendsplit_ai_breaker_state gauge",
+    ]
+    states = {}
+    for breaker in list(_breakers.values()):
+        states[breaker.name] = max(states.get(breaker.name, 0), STATE_VALUES[breaker.state])
+    lines += [f'spendsplit_ai_breaker_state{{breaker="{name}"}} {value}' for name, value in sorted(states.items())]
+    return lines
+
+
+def _observe(breaker, outcome, started):
+    CALLS.inc(breaker=breaker.name, outcome=outcome)
+    CALL_SECONDS.observe(time.perf_counter() - started, breaker=breaker.name, outcome=outcome)
+
+
+def _timed_out():
+    return AITimeout(f"AI request timed out after {settings.AI_TIMEOUT_SECONDS:g}s")
+
+
+def _give_up(exc):
+    if is_timeout(exc):
+        raise _timed_out() from exc
+    if is_transient(exc):
+        raise AIUnavailable(f"The AI service is unavailable ({type(exc).__name__}); try again shortly") from exc
+    raise exc
+
+
+def call(attempt, breaker):
+    """Run ``attempt(timeout)`` with the deadline, retries and ``breaker``.
+
+    ``attempt`` gets the seconds left before the deadline and must enforce
+    them itself (the Gemini client takes a request timeout).
+    """
+    deadline = time.monotonic() + settings.AI_TIMEOUT_SECONDS
+    for n in range(settings.AI_RETRIES + 1):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise _timed_out()
+        probe = breaker.before_call()
+        started = time.perf_counter()
+        try:
+            result = attempt(remaining)
+        except Exception as e:
+            _observe(breaker, "timeout" if is_timeout(e) else "error", started)
+            breaker.record(False, probe)
+            delay = backoff(n)
+            if not is_transient(e) or n == settings.AI_RETRIES or time.monotonic() + delay >= deadline:
+                _give_up(e)
+            CALLS.inc(breaker=breaker.name, outcome="retry")
+            time.sleep(delay)
+        else:
+            _observe(breaker, "ok", started)
+            breaker.record(True, probe)
+            return result
+
+
+async def acall(attempt, breaker):
+    """Async ``call``: ``attempt()`` is a coroutine function, cancelled at the deadline."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.AI_TIMEOUT_SECONDS
+    for n in range(settings.AI_RETRIES + 1):
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise _timed_out()
+        probe = breaker.before_call()
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(attempt(), remaining)
+        except asyncio.CancelledError:
+            breaker.record(None, probe)
+            raise
+        except Exception as e:
+            _observe(breaker, "timeout" if is_timeout(e) else "error", started)
+            breaker.record(False, probe)
+            delay = backoff(n)
+            if not is_transient(e) or n == settings.AI_RETRIES or loop.time() + delay >= deadline:
+                _give_up(e)
+            CALLS.inc(breaker=breaker.name, outcome="retry")
+            await asyncio.sleep(delay)
+        else:
+            _observe(breaker, "ok", started)
+            breaker.record(True, probe)
+            return result
@@ -0,0 +1,216 @@
+"""Monthly spend rollups: (group, month, category, payer, status) -> count and total.
+
+Maintained the same way as the balance ledger: the expense signal handlers
+in ``APP.signals`` move an expense's count and amount between rollup rows as
+it is created, edited or deleted, and ``save_expenses`` calls
+``record_expenses`` for bulk inserts. ``manage.py rebuild_rollups``
+recomputes the table from raw expenses.
+
+``spend_stats`` answers multi-month category and member breakdowns from the
+rollups alone, so its cost grows with months x categories, not with the
+number of expenses.
+"""
+import logging
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import TruncMonth
+
+from .ledger import month_start, to_money
+from .models import Expense, MonthlyCategorySpend
+
+CATEGORY_LABELS = dict(Expense.CATEGORIES)
+
+logger = logging.getLogger(__name__)
+
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def months_between(start, end):
+    """Every first-of-month from ``start`` to ``end`` inclusive."""
+    count = (end.year - start.year) * 12 + end.month - start.month + 1
+    return [add_months(start, n) for n in range(max(count, 0))]
+
+
+def _key(values):
+    return (values['group_id'], month_start(values['created_at']), values['category'],
+            values['payer_id'], values['status'])
+
+
+def _values(expense):
+    return {field: getattr(expense, field) for field in
+            ('group_id', 'payer_id', 'amount', 'status', 'category', 'created_at')}
+
+
+def apply_delta(key, count, total):
+    total = to_money(total)
+    if not count and not total:
+        return
+
+    group_id, month, category, payer_id, status = key
+    rows = MonthlyCategorySpend.objects.filter(
+        group_id=group_id, month=month, category=category, payer_id=payer_id, status=status
+    )
+    if rows.update(count=F('count') + count, total=F('total') + total):
+        return
+
+    # As in the ledger, a missing row being reduced means the rollups drifted.
+    if count < 0 or total < 0:
+        logger.warning(
+            "Rollup row missing for %s (count %s, total %s); run manage.py rebuild_rollups --group %s",
+            key, count, total, group_id,
+        )
+        return
+
+    try:
+        with transaction.atomic():
+            MonthlyCategorySpend.objects.create(
+                group_id=group_id, month=month, category=category, payer_id=payer_id, status=status,
+                count=count, total=total,
+            )
+    except IntegrityError:
+        rows.update(count=F('count') + count, total=F('total') + total)
+
+
+def record_expense(expense, sign=1):
+    """Add (``sign=1``) or remove (``sign=-1``) one expense."""
+    apply_delta(_key(_values(expense)), sign, sign * to_money(expense.amount))
+
+
+def record_expenses(expenses):
+    """Add many new expenses with one update per rollup row."""
+    deltas = defaultdict(lambda: [0, Decimal(0)])
+    for expense in expenses:
+        cell = deltas[_key(_values(expense))]
+        cell[0] += 1
+        cell[1] += to_money(expense.amount)
+
+    for key, (count, total) in deltas.items():
+        apply_delta(key, count, total)
+
+
+def expense_changed(expense, previous):
+    """Move an updated expense from the row it was in before saving."""
+    current = _values(expense)
+    old_key, new_key = _key(previous), _key(current)
+    old_total, new_total = to_money(previous['amount']), to_money(current['amount'])
+    if old_key == new_key:
+        apply_delta(new_key, 0, new_total - old_total)
+        return
+    apply_delta(old_key, -1, -old_total)
+    apply_delta(new_key, 1, new_total)
+
+
+def compute_rollups(group_ids=None):
+    """Recompute rollup rows from raw expenses: {key: [count, total]}."""
+    expenses = Expense.objects.all()
+    if group_ids is not None:
+        expenses = expenses.filter(group_id__in=group_ids)
+
+    rows = (
+        expenses.annotate(month=TruncMonth('created_at', output_field=DateField()))
+        .values('group_id', 'month', 'category', 'payer_id', 'status')
+        .annotate(count=Count('id'), total=Sum('amount'))
+        .order_by()
+    )
+    return {
+        (row['group_id'], row['month'], row['category'], row['payer_id'], row['status']):
+            [row['count'], to_money(row['total'])]
+        for row in rows
+    }
+
+
+def rebuild_rollups(group_ids=None):
+    """Replace rollup rows with freshly computed ones. Returns the row count."""
+    cells = compute_rollups(group_ids)
+    with transaction.atomic():
+        existing = MonthlyCategorySpend.objects.all()
+        if group_ids is not None:
+            existing = existing.filter(group_id__in=group_ids)
+        existing.delete()
+        MonthlyCategorySpend.objects.bulk_create([
+            MonthlyCategorySpend(group_id=g, month=m, category=c, payer_id=p, status=s, count=count, total=total)
+            for (g, m, c, p, s), (count, total) in cells.items()
+        ], batch_size=500)
+    return len(cells)
+
+
+def verify_rollups(group_ids=None):
+    """List rows where the stored rollups disagree with the raw expenses."""
+    expected = compute_rollups(group_ids)
+    stored = MonthlyCategorySpend.objects.all()
+    if group_ids is not None:
+        stored = stored.filter(group_id__in=group_ids)
+
+    actual = {
+        (row.group_id, row.month, row.category, row.payer_id, row.status): [row.count, row.total]
+        for row in stored
+    }
+    mismatches = []
+    for key in expected.keys() | actual.keys():
+        want = expected.get(key, [0, 0])
+        have = actual.get(key, [0, 0])
+        if want[0] != have[0] or want[1] != have[1]:
+            mismatches.append({"cell": key, "expected": want, "stored": have})
+    return mismatches
+
+
+def spend_stats(group, first, last):
+    """Counted spend per month and category, and per member, for ``first``..``last`` (month starts)."""
+    rows = MonthlyCategorySpend.objects.filter(
+        group=group, month__gte=first, month__lte=last, status__in=Expense.COUNTED_STATUSES
+    )
+    by_category = (
+        rows.values('month', 'category').annotate(n=Sum('count'), spent=Sum('total')).order_by()
+    )
+    by_payer = rows.values('payer_id').annotate(n=Sum('count'), spent=Sum('total')).order_by()
+
+    months = {month: defaultdict(lambda: [0, Decimal(0)]) for month in months_between(first, last)}
+    categories = defaultdict(lambda: [0, Decimal(0)])
+    for row in by_category:
+        # Expenses store either the category code or its label.
+        label = CATEGORY_LABELS.get(row['category'], row['category'])
+        for cell in (months[row['month']][label], categories[label]):
+            cell[0] += row['n']
+            cell[1] += to_money(row['spent'])
+
+    grand_total = sum((total for _, total in categories.values()), Decimal(0))
+    payers = {row['payer_id']: (row['n'], to_money(row['spent'])) for row in by_payer}
+
+    def share(total):
+        return round(float(total / grand_total), 4) if grand_total else 0.0
+
+    month_list = []
+    previous = None
+    for month, cells in months.items():
+        total = sum((t for _, t in cells.values()), Decimal(0))
+        month_list.append({
+            "month": f"{month:%Y-%m}",
+            "count": sum(n for n, _ in cells.values()),
+            "total": float(total),
+            "change": None if previous is None else float(total - previous),
+            "categories": {label: {"count": n, "total": float(t)} for label, (n, t) in sorted(cells.items())},
+        })
+        previous = total
+
+    return {
+        "from": f"{first:%Y-%m}",
+        "to": f"{last:%Y-%m}",
+        "total": float(grand_total),
+        "months": month_list,
+        "categories": [
+            {"category": label, "count": n, "total": float(t), "share": share(t)}
+            for label, (n, t) in sorted(categories.items(), key=lambda item: (-item[1][1], item[0]))
+        ],
+        "members": [
+            {"id": user.id, "name": user.name, "count": n, "total": float(t), "share": share(t)}
+            for user in group.members.all().order_by('name', 'id')
+            for n, t in [payers.get(user.id, (0, Decimal(0)))]
+        ],
+    }
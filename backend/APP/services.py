@@ -1,141 +1,233 @@
-from django.db.models import Sum
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from .models import Group, Expense, ExpenseSplit
-import google.generativeai as genai
+from . import ledger, periods, rollups
+from .caching import bump_group_version, bump_history_version
+from .metrics import Counter, timed
+from . import aicache
+from .imaging import ImageTooLarge, file_digest, preprocess_receipt
+from .quickparse import quick_parse
+from .members import MemberIndex
+from .ai_providers import get_provider
+from . import resilience
+from .resilience import AITimeout, AIUnavailable
+from .prompts import batch_prompt, expense_prompt, group_context, receipt_prompt
+import asyncio
 import json
-import os
-import PIL.Image
+import re
 import io
+import weakref
 
-genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
+def month_range(moment=None):
+    """Half-open [start, end) datetime range of the month ``moment`` falls in.
+
+    Range predicates on ``created_at`` can use the composite indexes, unlike
+    ``created_at__year``/``__month`` lookups which wrap the column in a function.
+    """
+    moment = timezone.localtime(moment or timezone.now())
+    start = moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
 
 def get_monthly_financials(group_id):
+    """Paid, consumed and net balance for every member this month.
+
+    Runs a constant number of queries regardless of member count: one grouped
+    aggregate over expenses (by payer) and one over splits (by user).
+    """
     try:
         group = Group.objects.get(id=group_id)
     except Group.DoesNotExist:
         return {"total_spend": 0, "balances": {}}
 
-    members = group.members.all()
-    member_count = members.count()
-    raw_balances = {}
+    start, end = month_range()
+    return periods.summarize(group, *periods.range_totals(group.id, start, end))
 
-    now = timezone.now()
-    monthly_expenses = Expense.objects.filter(
-        group=group,
-        created_at__year=now.year,
-        created_at__month=now.month,
-        status='APPROVED'
-    )
+_limiters = weakref.WeakKeyDictionary()
 
-    val = monthly_expenses.aggregate(Sum('amount'))['amount__sum'] or 0
-    total_monthly_spend = float(val)
-
-    for user in members:
-        paid = monthly_expenses.filter(payer=user).aggregate(Sum('amount'))['amount__sum'] or 0
-        consumed = ExpenseSplit.objects.filter(
-            expense__group=group,
-            user=user,
-            expense__created_at__year=now.year,
-            expense__created_at__month=now.month,
-            expense__status='APPROVED'
-        ).aggregate(Sum('owed_amount'))['owed_amount__sum'] or 0
-
-        if member_count == 1:
-            net_balance = paid
-        else:
-            net_balance = paid - consumed
-            
-        raw_balances[user] = net_balance
+def ai_limiter():
+    """Semaphore capping in-flight async Gemini calls on the running event loop."""
+    loop = asyncio.get_running_loop()
+    limiter = _limiters.get(loop)
+    if limiter is None:
+        limiter = _limiters[loop] = asyncio.Semaphore(settings.AI_MAX_CONCURRENCY)
+    return limiter
 
-    return {
-        "total_spend": total_monthly_spend,
-        "balances": raw_balances,
-        "group": group,
-        "member_count": member_count
-    }
+def generate(prompt, image=None):
+    """Raw JSON text from the configured AI provider for ``prompt`` (and ``image``).
+
+    Retried and deadline-bound by ``resilience``; raises ``AITimeout`` or
+    ``AIUnavailable`` (circuit open).
+    """
+    provider = get_provider()
+
+    def attempt(timeout):
+        with timed("ai"):
+            if image:
+                return provider.parse_image(prompt, image, timeout=timeout)
+            return provider.parse_text(prompt, timeout=timeout)
+
+    return resilience.call(attempt, resilience.breaker_for(provider))
+
+async def agenerate(prompt, image=None):
+    provider = get_provider()
+
+    async def attempt():
+        async with ai_limiter():
+            with timed("ai"):
+                if image:
+                    return await provider.aparse_image(prompt, image)
+                return await provider.aparse_text(prompt)
+
+    return await resilience.acall(attempt, resilience.breaker_for(provider))
+
+QUICK_PARSES = Counter("spendsplit_quickparse_total", "Text inputs parsed locally vs. sent on to Gemini.")
+
+def try_quick_parse(text_input, group_id, current_user_name, names=None):
+    """The local rule-based parse, if it is confident enough; otherwise None."""
+    if not settings.QUICKPARSE_ENABLED:
+        return None
+    if names is None:
+        names = group_context(group_id).members
+    result = quick_parse(text_input, names, current_user_name)
+    if result.parsed is not None and result.confidence >= settings.QUICKPARSE_MIN_CONFIDENCE:
+        QUICK_PARSES.inc(result="local")
+        return result.parsed
+    QUICK_PARSES.inc(result="fallback")
+    return None
+
+def local_fallback(text_input, group_id, current_user_name, names=None):
+    """The local parse for when the model is unavailable, if confident enough; or None.
+
+    Fallback expenses are created APPROVED like any other, so this holds them
+    to the same ``QUICKPARSE_MIN_CONFIDENCE`` as the fast path; below it the
+    caller reports the outage (503) and the user retries.
+    """
+    if not settings.QUICKPARSE_ENABLED or not text_input:
+        return None
+    if names is None:
+        names = group_context(group_id).members
+    result = quick_parse(text_input, names, current_user_name)
+    if result.parsed is None or result.confidence < settings.QUICKPARSE_MIN_CONFIDENCE:
+        QUICK_PARSES.inc(result="declined")
+        return None
+    QUICK_PARSES.inc(result="degraded")
+    return result.parsed
 
 def parse_expense_with_ai(text_input, group_id, current_user_name):
     try:
-        group = Group.objects.get(id=group_id)
-        member_names = ", ".join([u.name for u in group.members.all()])
-        
-        # Get current financial context
-        financials = get_monthly_financials(group_id)
-        balances = financials.get("balances", {})
-        
-        # Format balances for context
-        balance_context = ", ".join([f"{u.name}: {amt:.2f}" for u, amt in balances.items()])
-        
-        model = genai.GenerativeModel("gemini-2.5-flash", generation_config={"response_mime_type": "application/json"})
-        prompt = f"""
-        You are an expense parser.
-        Context: 
-        - Members: [{member_names}]
-        - Current Balances (Positive = Owed to them, Negative = They owe): [{balance_context}]
-        - Current User: {current_user_name}
-        
-        Input: "{text_input}"
-        
-        Task: Translate if not in English, Identify Payer, Amount, Splits, Categorize according to the list [Food, Transportation, Entertainment, Miscellaneous, Supplies, Bills.]
-        
-        Special Logic:
-        - If the user says "I paid back all my debts" or similar:
-            1. Identify the current user's balance.
-            2. If their balance is negative (e.g., -500), the 'amount' is the absolute value (500).
-            3. Create 'splits' for users with POSITIVE balances. 
-            4. Distribute the payment to those positive balance users proportionally or fully if it matches.
-            5. If their balance is positive or zero, return amount 0.
-        
-        Output JSON: {{ "description": "str", "amount": num, "payer_name": "str", "splits": [{{ "user_name": "str", "amount": num }}], category: choose one from [Food, Transportation, Entertainment, Miscellaneous, Supplies, Bills.] }}
-        """
-        response = model.generate_content(prompt)
-        return json.loads(response.text)
-    except:
+        parsed = try_quick_parse(text_input, group_id, current_user_name)
+        if parsed is not None:
+            return parsed
+        context = group_context(group_id)
+        key = aicache.text_key(text_input, current_user_name, context)
+        parsed = aicache.get(key, "text")
+        if parsed is None:
+            raw = generate(expense_prompt(text_input, current_user_name, context))
+            parsed = json.loads(raw)
+            aicache.put(key, raw)
+        return parsed
+    except (AITimeout, AIUnavailable) as e:
+        print(f"Error parsing expense: {e}")
+        return local_fallback(text_input, group_id, current_user_name)
+    except Exception as e:
+        print(f"Error parsing expense: {e}")
+        return None
+
+async def aparse_expense_with_ai(text_input, group_id, current_user_name):
+    """Async ``parse_expense_with_ai``.
+
+    When the model times out or its circuit is open, falls back to the local
+    parser, and raises ``AITimeout``/``AIUnavailable`` only if that fails too.
+    """
+    try:
+        parsed = await sync_to_async(try_quick_parse)(text_input, group_id, current_user_name)
+        if parsed is not None:
+            return parsed
+        context = await sync_to_async(group_context)(group_id)
+        key = aicache.text_key(text_input, current_user_name, context)
+        parsed = aicache.get(key, "text")
+        if parsed is None:
+            raw = await agenerate(expense_prompt(text_input, current_user_name, context))
+            parsed = json.loads(raw)
+            aicache.put(key, raw)
+        return parsed
+    except (AITimeout, AIUnavailable):
+        parsed = await sync_to_async(local_fallback)(text_input, group_id, current_user_name)
+        if parsed is None:
+            raise
+        return parsed
+    except Exception:
         return None
 
+def receipt_blob(image_file):
+    prepared = preprocess_receipt(image_file)
+    return {"mime_type": prepared.mime_type, "data": prepared.data}
+
 def parse_receipt_with_ai(image_file, group_id, current_user_name, text_context=None):
+    """Parse a receipt; raises ``ImageTooLarge`` for images over the pixel cap."""
     try:
-        group = Group.objects.get(id=group_id)
-        member_names = ", ".join([u.name for u in group.members.all()])
-        
-        # Get current financial context
-        financials = get_monthly_financials(group_id)
-        balances = financials.get("balances", {})
-        
-        # Format balances for context
-        balance_context = ", ".join([f"{u.name}: {amt:.2f}" for u, amt in balances.items()])
-        
-        model = genai.GenerativeModel("gemini-2.5-flash", generation_config={"response_mime_type": "application/json"})
-        
-        prompt_text = f"""
-        You are a receipt parser. 
-        Context: 
-        - Members: [{member_names}]
-        - Current Balances: [{balance_context}]
-        - Current User: {current_user_name}
-        - Additional Context: {text_context if text_context else "None"}
-        
-        Task: Analyze the receipt image and the additional context to identify Payer, Amount, Description, and Splits Categorize according to the list [Food, Transportation, Entertainment, Miscellaneous, Supplies, Bills.].
-        
-        Rules:
-        1. If specific items are visible, try to categorize them.
-        2. If the user provides context like "Dinner for me and Bob", use that to determine splits.
-        3. If no specific split info is found, default to equal splits among all members.
-        4. Payer is likely the Current User unless the receipt or context suggests otherwise.
-        
-        Output JSON: {{ "description": "str", "amount": num, "payer_name": "str", "splits": [{{ "user_name": "str", "amount": num }}], category: "str" }}
-        """
-        
-        image = PIL.Image.open(image_file)
-        
-        response = model.generate_content([prompt_text, image])
-        return json.loads(response.text)
+        context = group_context(group_id)
+        key = aicache.receipt_key(file_digest(image_file), text_context, current_user_name, context)
+        parsed = aicache.get(key, "receipt")
+        if parsed is None:
+            prompt_text = receipt_prompt(current_user_name, context, text_context)
+            raw = generate(prompt_text, receipt_blob(image_file))
+            parsed = json.loads(raw)
+            aicache.put(key, raw)
+        return parsed
+    except ImageTooLarge:
+        raise
+    except (AITimeout, AIUnavailable) as e:
+        print(f"Error parsing receipt: {e}")
+        return local_fallback(text_context, group_id, current_user_name)
     except Exception as e:
         print(f"Error parsing receipt: {e}")
         return None
 
-def get_unified_fairness_analysis(group_id):
-    financials = get_monthly_financials(group_id)
+async def aparse_receipt_with_ai(image_file, group_id, current_user_name, text_context=None):
+    """Async ``parse_receipt_with_ai``; like ``aparse_expense_with_ai``, the
+    local fallback (from the text context alone) is tried before raising
+    ``AITimeout``/``AIUnavailable``."""
+    try:
+        context = await sync_to_async(group_context)(group_id)
+        # Hashing and image processing are CPU/disk work; keep them off the event loop.
+        digest = await sync_to_async(file_digest, thread_sensitive=False)(image_file)
+        key = aicache.receipt_key(digest, text_context, current_user_name, context)
+        parsed = aicache.get(key, "receipt")
+        if parsed is None:
+            prompt_text = receipt_prompt(current_user_name, context, text_context)
+            blob = await sync_to_async(receipt_blob, thread_sensitive=False)(image_file)
+            raw = await agenerate(prompt_text, blob)
+            parsed = json.loads(raw)
+            aicache.put(key, raw)
+        return parsed
+    except ImageTooLarge:
+        raise
+    except (AITimeout, AIUnavailable):
+        parsed = await sync_to_async(local_fallback)(text_context, group_id, current_user_name)
+        if parsed is None:
+            raise
+        return parsed
+    except Exception as e:
+        print(f"Error parsing receipt: {e}")
+        return None
+
+# How alerts refer to each kind of period: (when, limit).
+PERIOD_WORDING = {
+    "month": ("this month", "the monthly limit"),
+    "week": ("this week", "the weekly limit"),
+    "lifetime": ("overall", "the limit"),
+    "range": ("in this period", "the limit"),
+}
+
+def get_unified_fairness_analysis(group_id, period=None):
+    """Balances and lagging-member alerts for ``period`` (default: this calendar month)."""
+    period = period or periods.current_month()
+    financials = periods.period_financials(group_id, period)
     if not financials.get("group"):
         return {"alerts": [], "balances": {}}
         
@@ -143,12 +235,11 @@ def get_unified_fairness_analysis(group_id):
     total_monthly_spend = financials["total_spend"]
     raw_balances = financials["balances"]
     member_count = financials["member_count"]
+    when, limit_name = PERIOD_WORDING[period.kind]
     
     alerts = []
     
-    # 1. GET MONTHLY VOLUME (Financial Temperature)
-    now = timezone.now()
-
+    # 1. GET PERIOD VOLUME (Financial Temperature)
     if member_count > 0:
         fair_share = total_monthly_spend / member_count
     else:
@@ -174,19 +265,20 @@ def get_unified_fairness_analysis(group_id):
             elif soft_limit <= debt < hard_limit:
                 alerts.append({
                     "level": "WARNING",
-                    "message": f"🟡 **{user.name}** is lagging (₹{debt:.0f}) this month."
+                    "message": f"🟡 **{user.name}** is lagging (₹{debt:.0f}) {when}."
                 })
             else:
                 alerts.append({
                     "level": "CRITICAL",
-                    "message": f"🔴 **{user.name}** hit the monthly limit (₹{debt:.0f}). Settle Up."
+                    "message": f"🔴 **{user.name}** hit {limit_name} (₹{debt:.0f}). Settle Up."
                 })
 
     return {
         "alerts": alerts,
         "balances": {u.name: float(amt) for u, amt in raw_balances.items()},
+        "period": period.describe(),
         "stats": {
-            "month": now.strftime("%B"),
+            "month": period.label,
             "total_spend": float(total_monthly_spend),
             "floor_setting": MIN_FLOOR,
             "dynamic_hard_limit": float(hard_limit)
@@ -195,51 +287,202 @@ def get_unified_fairness_analysis(group_id):
 
 def create_expense_from_parsed_data(group_id, parsed_data):
     group = Group.objects.get(id=group_id)
-    members = group.members.all()
-    
-    def find_user(name):
-        for m in members:
-            if m.name.lower() == name.lower():
-                return m
-        for m in members:
-            if name.lower() in m.name.lower():
-                return m
-        return None
+    members = MemberIndex(group.members.all())
+    expense, splits = prepare_expense(group, members, parsed_data, strict=False)
+    save_expenses(group_id, [(expense, splits)])
+    return expense
+
+# ---------------------------------------------------------------------------
+# Batch parsing: many pasted lines, one model call, one transaction
+# ---------------------------------------------------------------------------
+MAX_BATCH_LINES = 50
+BULK_BATCH_SIZE = 500
+
+CATEGORY_LABELS = {}
+for value, label in Expense.CATEGORIES:
+    CATEGORY_LABELS[value.lower()] = CATEGORY_LABELS[label.lower()] = label
+
+def split_batch_lines(text_input):
+    """Non-empty lines of a pasted list, without bullets or numbering."""
+    lines = []
+    for line in re.split(r"[\r\n;]+", text_input or ""):
+        line = re.sub(r"^\s*(?:[-*\u2022]|\d+[.)])\s*", "", line).strip()
+        if line:
+            lines.append(line)
+    return lines
 
-    payer = find_user(parsed_data['payer_name'])
+async def aparse_batch_with_ai(lines, group_id, current_user_name):
+    """Parse many lines: locally where possible, the rest in a single Gemini call.
+
+    Returns one parsed dict, or ``{"error": ...}``, per line.
+    """
+    results = [None] * len(lines)
+    remaining = []
+    context = await sync_to_async(group_context)(group_id)
+    for i, line in enumerate(lines):
+        parsed = try_quick_parse(line, group_id, current_user_name, context.members)
+        if parsed is None:
+            remaining.append(i)
+        else:
+            results[i] = parsed
+    if not remaining:
+        return results
+
+    try:
+        numbered = [(n, lines[i]) for n, i in enumerate(remaining, 1)]
+        items = json.loads(await agenerate(batch_prompt(numbered, current_user_name, context)))
+        if isinstance(items, dict):
+            items = items.get("expenses") or items.get("items") or []
+        if not isinstance(items, list):
+            items = []
+        by_line = {
+            item["line"]: item for item in items
+            if isinstance(item, dict) and isinstance(item.get("line"), int)
+        }
+        for n, i in enumerate(remaining, 1):
+            results[i] = by_line.get(n) or {"error": "The AI did not return this line"}
+    except (AITimeout, AIUnavailable) as e:
+        for i in remaining:
+            results[i] = local_fallback(lines[i], group_id, current_user_name, context.members) or {"error": str(e)}
+    except Exception as e:
+        print(f"Error parsing batch: {e}")
+        for i in remaining:
+            results[i] = {"error": "Failed to parse"}
+    return results
+
+def prepare_expense(group, members, parsed, strict=True):
+    """Validate one parsed item and build its unsaved Expense and ExpenseSplits.
+
+    ``members`` is a ``MemberIndex``. Raises ``ValueError`` describing the
+    first problem found. With ``strict=False`` (single AI expenses, as
+    before) unknown split members are skipped and the split total is not
+    checked.
+    """
+    if not isinstance(parsed, dict):
+        raise ValueError("Expected an expense object")
+    if parsed.get("error"):
+        raise ValueError(str(parsed["error"]))
+    splits = parsed.get("splits")
+    if splits and (not isinstance(splits, list) or not all(isinstance(split, dict) for split in splits)):
+        raise ValueError("Invalid splits, expected a list of objects with user_name and amount")
+    try:
+        amount = ledger.to_money(parsed.get("amount"))
+    except Exception:
+        raise ValueError("Missing or invalid amount")
+    if amount is None or amount <= 0:
+        raise ValueError("Amount must be positive")
+
+    payer = members.find(parsed.get("payer_name"))
     if not payer:
-        raise ValueError(f"Payer '{parsed_data['payer_name']}' not found in group")
+        raise ValueError(f"Payer '{parsed.get('payer_name')}' not found in group")
 
-    expense = Expense.objects.create(
+    owed = {}
+    if splits:
+        for split in splits:
+            user = members.find(split.get("user_name"))
+            if not user:
+                if not strict:
+                    continue
+                raise ValueError(f"Split member '{split.get('user_name')}' not found in group")
+            try:
+                owed[user] = owed.get(user, 0) + ledger.to_money(split.get("amount"))
+            except Exception:
+                raise ValueError(f"Invalid split amount for '{split.get('user_name')}'")
+        total = sum(owed.values())
+        if strict and abs(total - amount) > ledger.CENT * len(owed):
+            raise ValueError(f"Splits add up to {total} but the amount is {amount}")
+    else:
+        # Equal split to the cent; leftover cents go to the first members.
+        share, remainder = divmod(int(amount * 100), len(members))
+        for i, member in enumerate(members):
+            owed[member] = ledger.to_money((share + (1 if i < remainder else 0)) / 100)
+
+    expense = Expense(
         group=group,
         payer=payer,
-        amount=parsed_data['amount'],
-        description=parsed_data['description'],
-        category=parsed_data['category'],
-        status='APPROVED'
+        amount=amount,
+        description=(str(parsed.get("description") or "").strip() or "Expense")[:255],
+        category=CATEGORY_LABELS.get(str(parsed.get("category") or "").strip().lower(), "Miscellaneous"),
+        status='APPROVED',
+        # Only set for imported history; save_expenses() keeps it.
+        created_at=parsed.get("created_at"),
     )
+    splits = [
+        ExpenseSplit(expense=expense, user=user, owed_amount=value, status='ACCEPTED')
+        for user, value in owed.items()
+    ]
+    return expense, splits
 
-    splits_data = parsed_data.get('splits', [])
-    
-    if not splits_data:
-        # Default to equal splits if no splits provided
-        count = members.count()
-        if count > 0:
-            amount_per_person = parsed_data['amount'] / count
-            for member in members:
-                splits_data.append({
-                    'user_name': member.name,
-                    'amount': amount_per_person
-                })
+def save_expenses(group_id, prepared):
+    """Insert prepared ``(expense, splits)`` pairs with two bulk INSERTs in one transaction.
 
-    for split in splits_data:
-        user = find_user(split['user_name'])
-        if user:
-            ExpenseSplit.objects.create(
-                expense=expense,
-                user=user,
-                owed_amount=split['amount'],
-                status='ACCEPTED'
-            )
-    
-    return expense
\ No newline at end of file
+    ``bulk_create`` sends no signals, so the ledger, the spend rollups and the
+    group's cache version are updated here instead.
+    """
+    expenses = [expense for expense, _ in prepared]
+    # auto_now_add overwrites created_at on insert; imported history keeps its dates.
+    history = [(expense, expense.created_at) for expense in expenses if expense.created_at]
+
+    with transaction.atomic():
+        Expense.objects.bulk_create(expenses, batch_size=BULK_BATCH_SIZE)
+        if history:
+            for expense, created_at in history:
+                expense.created_at = created_at
+            Expense.objects.bulk_update([e for e, _ in history], ['created_at'], batch_size=BULK_BATCH_SIZE)
+        ExpenseSplit.objects.bulk_create(
+            [split for _, splits in prepared for split in splits], batch_size=BULK_BATCH_SIZE
+        )
+        ledger.record_expenses(prepared)
+        rollups.record_expenses(expenses)
+        bump_group_version(group_id)
+        if periods.touches_closed(*(created_at for _, created_at in history)):
+            bump_history_version(group_id)
+    return expenses
+
+def create_expenses_from_batch(group_id, lines, parsed_items):
+    """Create every valid line in one transaction; return per-line results."""
+    group = Group.objects.get(id=group_id)
+    members = MemberIndex(group.members.all())
+
+    results = []
+    prepared = []
+    for n, (line, parsed) in enumerate(zip(lines, parsed_items), 1):
+        result = {"line": n, "text": line, "expense": None, "error": None}
+        try:
+            prepared.append(prepare_expense(group, members, parsed))
+            result["expense"] = prepared[-1][0]
+        except (ValueError, TypeError, AttributeError) as e:
+            # Items come from the model; one malformed item must not sink the rest.
+            result["error"] = str(e) if isinstance(e, ValueError) else "Malformed item from the AI"
+        results.append(result)
+
+    if prepared:
+        save_expenses(group_id, prepared)
+    return results
+
+def import_expenses(group_id, rows):
+    """Validate every imported row, then create them all or none.
+
+    ``rows`` comes from ``importer.read_rows``. Returns ``(created, errors)``
+    where ``errors`` lists ``{"row": n, "error": str}``.
+    """
+    group = Group.objects.get(id=group_id)
+    members = MemberIndex(group.members.all())
+
+    prepared = []
+    errors = []
+    for number, row in rows:
+        try:
+            if isinstance(row, Exception):
+                raise row
+            expense, splits = prepare_expense(group, members, row)
+            # Exports carry each expense's status; rejected history must stay uncounted.
+            expense.status = row.get("status") or expense.status
+            prepared.append((expense, splits))
+        except ValueError as e:
+            errors.append({"row": number, "error": str(e)})
+
+    if errors or not prepared:
+        return 0, errors
+    save_expenses(group_id, prepared)
+    return len(prepared), []
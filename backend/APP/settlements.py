@@ -0,0 +1,45 @@
+"""Turn net balances into a short list of settle-up transfers."""
+import heapq
+from decimal import Decimal
+
+CENT = Decimal('0.01')
+
+
+def to_cents(amount):
+    return int((Decimal(str(amount)) / CENT).to_integral_value())
+
+
+def simplify_debts(balances):
+    """Greedy settle-up: the largest debtor pays the largest creditor until done.
+
+    ``balances`` maps any hashable key (a ``User`` or an id) to its net balance,
+    positive meaning the group owes them. Returns ``(from, to, cents)`` tuples.
+    Each step settles at least one side completely, so the result has at most
+    ``len(nonzero balances) - 1`` transfers. If the balances do not sum to
+    zero the unmatched remainder is left unsettled.
+    """
+    creditors = []
+    debtors = []
+    for order, (key, amount) in enumerate(balances.items()):
+        cents = to_cents(amount)
+        # ``order`` breaks ties so keys never need to be comparable.
+        if cents > 0:
+            creditors.append((-cents, order, key))
+        elif cents < 0:
+            debtors.append((cents, order, key))
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        credit, credit_order, creditor = heapq.heappop(creditors)
+        debt, debt_order, debtor = heapq.heappop(debtors)
+        amount = min(-credit, -debt)
+        transfers.append((debtor, creditor, amount))
+
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, credit_order, creditor))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, debt_order, debtor))
+
+    return transfers
@@ -1,7 +1,11 @@
-from django.db.models.signals import pre_save, post_save, post_delete
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
 from django.db import IntegrityError
-from .models import Group, GroupMember, GroupLog
+from django.db.backends.signals import connection_created
+from .models import Group, GroupMember, GroupLog, Expense, ExpenseSplit, User
+from . import ledger, periods, rollups
+from .caching import bump_group_version, bump_history_version
+from .metrics import db_timing_wrapper
 
 @receiver(pre_save, sender=Group)
 def log_group_rename(sender, instance, **kwargs):
@@ -26,3 +30,136 @@ def log_member_join(sender, instance, created, **kwargs):
             details=f"{instance.user.name} joined the group"
         )
 
+
+# ---------------------------------------------------------------------------
+# Monthly balance ledger and spend rollups
+# ---------------------------------------------------------------------------
+@receiver(pre_save, sender=Expense)
+def remember_expense_state(sender, instance, raw=False, **kwargs):
+    instance._ledger_previous = None
+    if instance.pk and not raw:
+        instance._ledger_previous = Expense.objects.filter(pk=instance.pk).values(
+            'group_id', 'payer_id', 'amount', 'status', 'category', 'created_at'
+        ).first()
+
+@receiver(post_save, sender=Expense)
+def update_ledger_for_expense(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_ledger_previous', None)
+    if created or previous is None:
+        ledger.record_expense(instance, splits=[])
+        rollups.record_expense(instance)
+    else:
+        ledger.expense_changed(instance, previous)
+        rollups.expense_changed(instance, previous)
+
+@receiver(pre_delete, sender=Expense)
+def reverse_ledger_for_expense(sender, instance, **kwargs):
+    ledger.record_expense(instance, sign=-1)
+    rollups.record_expense(instance, sign=-1)
+    ledger.deleting_expense_ids().add(instance.pk)
+
+@receiver(post_delete, sender=Expense)
+def forget_deleted_expense(sender, instance, **kwargs):
+    ledger.deleting_expense_ids().discard(instance.pk)
+
+@receiver(pre_save, sender=ExpenseSplit)
+def remember_split_state(sender, instance, raw=False, **kwargs):
+    instance._ledger_previous = None
+    if instance.pk and not raw:
+        instance._ledger_previous = ExpenseSplit.objects.filter(pk=instance.pk).values(
+            'expense_id', 'user_id', 'owed_amount'
+        ).first()
+
+@receiver(post_save, sender=ExpenseSplit)
+def update_ledger_for_split(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_ledger_previous', None)
+    current = (instance.expense_id, instance.user_id, ledger.to_money(instance.owed_amount))
+    expense = instance.expense
+
+    if previous:
+        if current == (previous['expense_id'], previous['user_id'], ledger.to_money(previous['owed_amount'])):
+            return
+        ledger.record_split(previous['expense_id'], previous['user_id'], previous['owed_amount'], sign=-1, expense=expense)
+    ledger.record_split(instance.expense_id, instance.user_id, instance.owed_amount, expense=expense)
+
+@receiver(post_delete, sender=ExpenseSplit)
+def reverse_ledger_for_split(sender, instance, **kwargs):
+    if instance.expense_id in ledger.deleting_expense_ids():
+        return
+    ledger.record_split(instance.expense_id, instance.user_id, instance.owed_amount, sign=-1)
+
+
+# ---------------------------------------------------------------------------
+# Cache invalidation: any write a member could see bumps the group version
+# ---------------------------------------------------------------------------
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def bump_version_for_group(sender, instance, **kwargs):
+    bump_group_version(instance.pk)
+
+@receiver(post_save, sender=GroupMember)
+@receiver(post_delete, sender=GroupMember)
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+def bump_version_for_group_child(sender, instance, **kwargs):
+    bump_group_version(instance.group_id)
+
+@receiver(post_save, sender=ExpenseSplit)
+@receiver(post_delete, sender=ExpenseSplit)
+def bump_version_for_split(sender, instance, **kwargs):
+    if instance.expense_id in ledger.deleting_expense_ids():
+        return
+    if ExpenseSplit.expense.is_cached(instance):
+        expense = (instance.expense.group_id, instance.expense.created_at)
+    else:
+        expense = Expense.objects.filter(pk=instance.expense_id).values_list('group_id', 'created_at').first()
+    if expense is not None:
+        group_id, created_at = expense
+        bump_group_version(group_id)
+        if periods.touches_closed(created_at):
+            bump_history_version(group_id)
+
+@receiver(post_save, sender=User)
+def bump_versions_for_user(sender, instance, created, **kwargs):
+    # Names are part of cached balances and member lists.
+    if not created:
+        for group_id in GroupMember.objects.filter(user=instance).values_list('group_id', flat=True):
+            bump_group_version(group_id)
+            bump_history_version(group_id)
+
+# Closed periods are cached until an edit reaches back into them; adding
+# today's expenses leaves them alone.
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def bump_history_for_group(sender, instance, **kwargs):
+    bump_history_version(instance.pk)
+
+@receiver(post_save, sender=GroupMember)
+@receiver(post_delete, sender=GroupMember)
+def bump_history_for_membership(sender, instance, **kwargs):
+    bump_history_version(instance.group_id)
+
+@receiver(post_save, sender=Expense)
+def bump_history_for_expense(sender, instance, **kwargs):
+    previous = getattr(instance, '_ledger_previous', None) or {}
+    if periods.touches_closed(instance.created_at, previous.get('created_at')):
+        bump_history_version(instance.group_id)
+        if previous.get('group_id', instance.group_id) != instance.group_id:
+            bump_history_version(previous['group_id'])
+
+@receiver(post_delete, sender=Expense)
+def bump_history_for_deleted_expense(sender, instance, **kwargs):
+    if periods.touches_closed(instance.created_at):
+        bump_history_version(instance.group_id)
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    # Connections are per thread, and under ASGI sync code runs in worker
+    # threads, so the timing wrapper goes on every connection rather than
+    # being installed by the middleware. Outside a request it records nothing.
+    if db_timing_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_timing_wrapper)
@@ -8,12 +8,12 @@ class GroupMemberLimitTest(TestCase):
         
         # Add 32 members
         for i in range(32):
-            user = User.objects.create(name=f"User {i}")
+            user = User.objects.create(name=f"User {i}", clerk_user_id=f"user{i}")
             GroupMember.objects.create(group=group, user=user)
             
         self.assertEqual(group.members.count(), 32)
         
         # Try to add the 33rd member
-        user33 = User.objects.create(name="User 33")
+        user33 = User.objects.create(name="User 33", clerk_user_id="user33")
         with self.assertRaises(ValidationError):
             GroupMember.objects.create(group=group, user=user33)
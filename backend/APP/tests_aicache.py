@@ -0,0 +1,97 @@
+import json
+from io import BytesIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from . import aicache, services
+from .ai_providers import GeminiProvider
+from .metrics import render_prometheus
+from .models import Expense, ExpenseSplit, Group, GroupMember, User
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, contents, **kwargs):
+        self.calls += 1
+        return mock.Mock(text=json.dumps({
+            "description": "Chai",
+            "amount": 300,
+            "payer_name": "Me",
+            "splits": [],
+            "category": "FOOD",
+        }))
+
+
+# These exercise the model path, so the local fast path is off.
+@override_settings(QUICKPARSE_ENABLED=False)
+class AIParseCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(name="Me", clerk_user_id="aicache1")
+        self.friend = User.objects.create(name="Friend", clerk_user_id="aicache2")
+        self.group = Group.objects.create(name="Home", type="LONG", owner=self.user)
+        GroupMember.objects.create(group=self.group, user=self.user)
+        GroupMember.objects.create(group=self.group, user=self.friend)
+        aicache.parse_cache.clear()
+        cache.clear()
+        self.model = FakeModel()
+        patcher = mock.patch.object(services, "get_provider", return_value=GeminiProvider(model=self.model))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def parse(self, text, user_name="Me"):
+        return services.parse_expense_with_ai(text, self.group.id, user_name)
+
+    def test_equivalent_text_hits(self):
+        hits = aicache.LOOKUPS.value(kind="text", result="hit")
+        first = self.parse("Paid 300 for chai, split all")
+        second = self.parse("  paid 300 for CHAI,   split all ")
+        self.assertEqual(first, second)
+        self.assertEqual(self.model.calls, 1)
+        self.assertEqual(aicache.LOOKUPS.value(kind="text", result="hit"), hits + 1)
+
+    def test_hits_return_independent_copies(self):
+        self.parse("chai")["splits"].append({"user_name": "Me", "amount": 1})
+        self.assertEqual(self.parse("chai")["splits"], [])
+
+    def test_user_and_balance_changes_miss(self):
+        self.parse("chai")
+        self.parse("chai", user_name="Friend")
+        self.assertEqual(self.model.calls, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            expense = Expense.objects.create(group=self.group, payer=self.friend, amount=50, description="Milk", category="FOOD")
+            ExpenseSplit.objects.create(expense=expense, user=self.user, owed_amount=50)
+        self.parse("chai")
+        self.assertEqual(self.model.calls, 3)
+
+    def test_receipts_keyed_by_image_bytes(self):
+        from PIL import Image
+
+        def receipt(color):
+            buffer = BytesIO()
+            Image.new("RGB", (4, 4), color).save(buffer, format="PNG")
+            buffer.seek(0)
+            return buffer
+
+        services.parse_receipt_with_ai(receipt("white"), self.group.id, "Me")
+        services.parse_receipt_with_ai(receipt("white"), self.group.id, "Me")
+        self.assertEqual(self.model.calls, 1)
+        services.parse_receipt_with_ai(receipt("black"), self.group.id, "Me")
+        self.assertEqual(self.model.calls, 2)
+
+    def test_failures_are_not_cached(self):
+        self.model.generate_content = mock.Mock(side_effect=RuntimeError("quota"))
+        self.assertIsNone(self.parse("chai"))
+        self.assertEqual(len(aicache.parse_cache), 0)
+
+    def test_metrics(self):
+        self.parse("chai")
+        self.parse("chai")
+        body = render_prometheus()
+        self.assertIn('spendsplit_ai_cache_lookups_total{kind="text",result="hit"}', body)
+        self.assertIn("spendsplit_ai_cache_entries 1", body)
+        self.assertIn("# TYPE spendsplit_ai_cache_hit_ratio gauge", body)
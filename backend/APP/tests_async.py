@@ -0,0 +1,98 @@
+import asyncio
+import json
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import AsyncClient, TestCase, override_settings
+from ninja.testing import TestAsyncClient
+
+from . import aicache, services
+from .ai_providers import GeminiProvider
+from .api import api
+from .middleware import ClerkAuthenticationMiddleware
+from .models import Expense, Group, GroupMember, User
+
+
+class FakeModel:
+    """Stands in for the Gemini model; tracks how many calls overlap."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.running = 0
+        self.peak = 0
+
+    async def generate_content_async(self, contents):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.running -= 1
+        return mock.Mock(text=json.dumps({
+            "description": "Chai",
+            "amount": 300,
+            "payer_name": "Me",
+            "splits": [],
+            "category": "FOOD",
+        }))
+
+
+# These exercise the model path, so the local fast path is off.
+@override_settings(QUICKPARSE_ENABLED=False)
+class AsyncAIEndpointTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(name="Me", clerk_user_id="async1")
+        self.friend = User.objects.create(name="Friend", clerk_user_id="async2")
+        self.group = Group.objects.create(name="Home", type="LONG", owner=self.user)
+        GroupMember.objects.create(group=self.group, user=self.user)
+        GroupMember.objects.create(group=self.group, user=self.friend)
+        self.client = TestAsyncClient(api)
+        aicache.parse_cache.clear()
+        cache.clear()
+
+    def post_text(self, model):
+        with mock.patch.object(services, "get_provider", return_value=GeminiProvider(model=model)):
+            return async_to_sync(self.client.post)(
+                f"/groups/{self.group.id}/expenses/ai", json={"text_input": "paid 300 for chai"}, user=self.user
+            )
+
+    def test_creates_expense(self):
+        response = self.post_text(FakeModel())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["payer"], {"name": "Me", "id": self.user.id})
+        expense = Expense.objects.get()
+        self.assertEqual(expense.amount, 300)
+        self.assertEqual(expense.splits.count(), 2)
+
+    @override_settings(AI_TIMEOUT_SECONDS=0.01)
+    def test_slow_model_times_out(self):
+        response = self.post_text(FakeModel(delay=1))
+        self.assertEqual(response.status_code, 504)
+        self.assertFalse(Expense.objects.exists())
+
+    @override_settings(AI_MAX_CONCURRENCY=2)
+    def test_in_flight_calls_are_capped(self):
+        model = FakeModel(delay=0.02)
+
+        async def burst():
+            with mock.patch.object(services, "get_provider", return_value=GeminiProvider(model=model)):
+                await asyncio.gather(*(services.agenerate("prompt") for _ in range(6)))
+
+        async_to_sync(burst)()
+        self.assertEqual(model.peak, 2)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class AsyncMiddlewareTest(TestCase):
+    def test_middleware_runs_in_async_mode(self):
+        user = User.objects.create(name="Me", clerk_user_id="async3")
+        with mock.patch.object(ClerkAuthenticationMiddleware, "authenticate", return_value={"sub": "async3"}), \
+                mock.patch.object(ClerkAuthenticationMiddleware, "sync_user", return_value=user):
+            response = async_to_sync(AsyncClient().get)("/api/groups", headers={"Authorization": "Bearer token"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("auth;dur=", response["Server-Timing"])
+        self.assertIn("db;dur=", response["Server-Timing"])
+
+        response = async_to_sync(AsyncClient().get)("/api/groups")
+        self.assertEqual(response.status_code, 401)
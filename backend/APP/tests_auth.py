@@ -0,0 +1,197 @@
+import json
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.test import RequestFactory, TestCase, SimpleTestCase, override_settings
+
+from .middleware import ClerkAuthenticationMiddleware, JWKSCache, JWKSUnavailable, UnknownSigningKey, verify_session_token
+from .models import User
+
+
+def make_key(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update(kid=kid, alg="RS256", use="sig")
+    return private_key, jwk
+
+
+def make_token(private_key, kid, **claims):
+    now = int(time.time())
+    payload = {"sub": "user_123", "iat": now, "nbf": now, "exp": now + 60, "azp": "http://localhost:3000"}
+    payload.update(claims)
+    return jwt.encode(payload, private_key, algorithm="RS256", headers={"kid": kid})
+
+
+class FakeJWKS:
+    """Stands in for Clerk's JWKS endpoint and counts fetches."""
+
+    def __init__(self, *jwks):
+        self.keys = list(jwks)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return {"keys": self.keys}
+
+
+class LocalVerificationTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.key, cls.jwk = make_key("key-1")
+        cls.other_key, cls.other_jwk = make_key("key-2")
+
+    def test_valid_token(self):
+        fake = FakeJWKS(self.jwk)
+        jwks = JWKSCache("unused", fetch=fake)
+        claims = verify_session_token(make_token(self.key, "key-1"), jwks, authorized_parties=["http://localhost:3000"])
+        self.assertEqual(claims["sub"], "user_123")
+
+        # Cached: the second verification does not refetch.
+        verify_session_token(make_token(self.key, "key-1"), jwks)
+        self.assertEqual(fake.calls, 1)
+
+    def test_rejects_bad_tokens(self):
+        jwks = JWKSCache("unused", fetch=FakeJWKS(self.jwk))
+        past = int(time.time()) - 120
+        with self.assertRaises(jwt.ExpiredSignatureError):
+            verify_session_token(make_token(self.key, "key-1", iat=past, nbf=past, exp=past + 60), jwks)
+        with self.assertRaises(jwt.InvalidSignatureError):
+            verify_session_token(make_token(self.other_key, "key-1"), jwks)
+        with self.assertRaises(jwt.InvalidTokenError):
+            verify_session_token(make_token(self.key, "key-1", azp="https://evil.example"), jwks, authorized_parties=["http://localhost:3000"])
+        with self.assertRaises(jwt.InvalidIssuerError):
+            verify_session_token(make_token(self.key, "key-1", iss="https://other"), jwks, issuer="https://clerk.example")
+
+    def test_unknown_kid_refreshes_once(self):
+        fake = FakeJWKS(self.jwk)
+        jwks = JWKSCache("unused", fetch=fake, min_refresh_interval=0)
+        verify_session_token(make_token(self.key, "key-1"), jwks)
+
+        # The issuer rotates keys: the new kid is picked up by a refetch.
+        fake.keys.append(self.other_jwk)
+        claims = verify_session_token(make_token(self.other_key, "key-2"), jwks)
+        self.assertEqual(claims["sub"], "user_123")
+        self.assertEqual(fake.calls, 2)
+
+        with self.assertRaises(UnknownSigningKey):
+            verify_session_token(make_token(self.key, "key-3"), jwks)
+
+    def test_unknown_kid_refresh_is_rate_limited(self):
+        fake = FakeJWKS(self.jwk)
+        jwks = JWKSCache("unused", fetch=fake, min_refresh_interval=60)
+        jwks.get_key("key-1")
+        for _ in range(5):
+            self.assertIsNone(jwks.get_key("made-up"))
+        self.assertEqual(fake.calls, 1)
+
+    def test_ttl_expiry_refetches(self):
+        fake = FakeJWKS(self.jwk)
+        jwks = JWKSCache("unused", fetch=fake, ttl=0)
+        jwks.get_key("key-1")
+        jwks.get_key("key-1")
+        self.assertEqual(fake.calls, 2)
+
+    def test_fetch_failure(self):
+        def broken():
+            raise ConnectionError("down")
+        jwks = JWKSCache("unused", fetch=broken)
+        with self.assertRaises(JWKSUnavailable):
+            jwks.get_key("key-1")
+        # Still nothing to verify with, but the endpoint is not hit again at once.
+        with self.assertRaises(JWKSUnavailable):
+            jwks.get_key("key-1")
+
+    def test_failed_refresh_keeps_cached_keys(self):
+        fake = FakeJWKS(self.jwk)
+        jwks = JWKSCache("unused", fetch=fake, ttl=0, min_refresh_interval=60)
+        jwks.get_key("key-1")
+
+        def broken():
+            fake.calls += 1
+            raise ConnectionError("down")
+        jwks.fetch = broken
+        # Past the TTL the refresh fails once; the old key keeps working and
+        # later calls do not retry until min_refresh_interval has passed.
+        for _ in range(5):
+            self.assertIsNotNone(jwks.get_key("key-1"))
+        self.assertEqual(fake.calls, 2)
+        claims = verify_session_token(make_token(self.key, "key-1"), jwks)
+        self.assertEqual(claims["sub"], "user_123")
+        self.assertEqual(fake.calls, 2)
+
+
+@override_settings(CLERK_AUTH_MODE="local", CLERK_AUTH_REMOTE_FALLBACK=True, CLERK_AUTHORIZED_PARTIES=[], CLERK_JWT_ISSUER=None)
+class MiddlewareTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.key, cls.jwk = make_key("key-1")
+
+    def setUp(self):
+        self.seen = []
+        self.middleware = ClerkAuthenticationMiddleware(lambda request: self.seen.append(request.user) or "ok")
+        self.middleware.jwks = JWKSCache("unused", fetch=FakeJWKS(self.jwk))
+        clerk_user = SimpleNamespace(
+            first_name="Ada", last_name="Lovelace", profile_image_url=None,
+            email_addresses=[SimpleNamespace(email_address="ada@example.com")],
+        )
+        self.middleware.clerk = mock.Mock()
+        self.middleware.clerk.users.get.return_value = clerk_user
+
+    def call(self, token):
+        request = RequestFactory().get("/api/groups", HTTP_AUTHORIZATION=f"Bearer {token}")
+        return self.middleware(request)
+
+
+class MiddlewareLocalAuthTest(MiddlewareTestCase):
+
+    def test_local_path_skips_clerk_authentication(self):
+        self.assertEqual(self.call(make_token(self.key, "key-1")), "ok")
+        self.assertEqual(self.seen[0], User.objects.get(clerk_user_id="user_123"))
+        self.middleware.clerk.authenticate_request.assert_not_called()
+
+    def test_invalid_token_is_rejected_without_fallback(self):
+        past = int(time.time()) - 120
+        response = self.call(make_token(self.key, "key-1", iat=past, nbf=past, exp=past + 60))
+        self.assertEqual(response.status_code, 401)
+        self.middleware.clerk.authenticate_request.assert_not_called()
+
+    def test_unknown_key_falls_back_to_remote(self):
+        other_key, _ = make_key("key-9")
+        self.middleware.clerk.authenticate_request.return_value = SimpleNamespace(is_signed_in=True, payload={"sub": "user_123"})
+        self.assertEqual(self.call(make_token(other_key, "key-9")), "ok")
+        self.middleware.clerk.authenticate_request.assert_called_once()
+
+    @override_settings(CLERK_AUTH_REMOTE_FALLBACK=False)
+    def test_fallback_can_be_disabled(self):
+        other_key, _ = make_key("key-9")
+        self.assertEqual(self.call(make_token(other_key, "key-9")).status_code, 401)
+        self.middleware.clerk.authenticate_request.assert_not_called()
+
+
+class ProfileCacheTest(MiddlewareTestCase):
+    def test_warm_request_needs_no_clerk_call_or_query(self):
+        self.call(make_token(self.key, "key-1", updated_at=1))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.call(make_token(self.key, "key-1", updated_at=1)), "ok")
+        self.assertEqual(self.middleware.clerk.users.get.call_count, 1)
+        self.assertEqual(self.seen[0], self.seen[1])
+
+    def test_updated_at_change_refetches_profile(self):
+        self.call(make_token(self.key, "key-1", updated_at=1))
+        self.middleware.clerk.users.get.return_value.first_name = "Augusta"
+        self.call(make_token(self.key, "key-1", updated_at=2))
+        self.assertEqual(self.middleware.clerk.users.get.call_count, 2)
+        self.assertEqual(User.objects.get(clerk_user_id="user_123").name, "Augusta Lovelace")
+
+    def test_expired_entry_refetches_without_rewriting_unchanged_profile(self):
+        self.middleware.profiles.ttl = 0
+        self.call(make_token(self.key, "key-1"))
+        # Clerk is asked again; the unchanged profile is read but not rewritten.
+        with self.assertNumQueries(1):
+            self.call(make_token(self.key, "key-1"))
+        self.assertEqual(self.middleware.clerk.users.get.call_count, 2)
@@ -0,0 +1,135 @@
+import asyncio
+import json
+from decimal import Decimal
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from ninja.testing import TestAsyncClient
+
+from . import services
+from .ai_providers import GeminiProvider
+from .api import api
+from .caching import group_version
+from .ledger import get_ledger_financials, verify_ledger
+from .models import Expense, ExpenseSplit, Group, GroupMember, User
+
+
+class BatchModel:
+    """Answers the batch prompt with canned items, keyed by line number."""
+
+    def __init__(self, items, delay=0):
+        self.items = items
+        self.delay = delay
+        self.prompts = []
+
+    async def generate_content_async(self, contents):
+        self.prompts.append(contents)
+        await asyncio.sleep(self.delay)
+        return mock.Mock(text=json.dumps(self.items))
+
+
+@override_settings(QUICKPARSE_ENABLED=True, QUICKPARSE_MIN_CONFIDENCE=0.8)
+class BatchExpenseTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(name="Me", clerk_user_id="batch1")
+        self.bob = User.objects.create(name="Bob", clerk_user_id="batch2")
+        self.group = Group.objects.create(name="Trip", type="SHORT", owner=self.user)
+        GroupMember.objects.create(group=self.group, user=self.user)
+        GroupMember.objects.create(group=self.group, user=self.bob)
+        self.client = TestAsyncClient(api)
+
+    def post(self, text, model):
+        with mock.patch.object(services, "get_provider", return_value=GeminiProvider(model=model)):
+            response = async_to_sync(self.client.post)(
+                f"/groups/{self.group.id}/expenses/ai/batch", json={"text_input": text}, user=self.user
+            )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_batch(self):
+        model = BatchModel([
+            {"line": 1, "description": "Hotel", "amount": 3000, "payer_name": "Bob",
+             "splits": [{"user_name": "Me", "amount": 1500}, {"user_name": "Bob", "amount": 1500}], "category": "Bills"},
+            {"line": 2, "description": "Gifts", "amount": 500, "payer_name": "Carol", "splits": [], "category": "Food"},
+            {"line": 3, "description": "Snacks", "amount": 100, "payer_name": "Me",
+             "splits": [{"user_name": "Bob", "amount": 60}], "category": "Food"},
+        ])
+        text = "- taxi 300 with Bob\n- hotel 3000, Bob got it, we share\n2) I paid 1200 for dinner split all\ngifts 500 by Carol; snacks 100 for Bob mostly"
+        version = group_version(self.group.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            body = self.post(text, model)
+
+        self.assertEqual(body["created"], 3)
+        results = body["results"]
+        self.assertEqual([r["text"] for r in results][:3], ["taxi 300 with Bob", "hotel 3000, Bob got it, we share", "I paid 1200 for dinner split all"])
+        self.assertEqual(results[0]["expense"]["amount"], 300)
+        self.assertEqual(results[1]["expense"]["payer"]["name"], "Bob")
+        self.assertEqual(results[2]["expense"]["category"], "Food")
+        self.assertEqual(results[3]["error"], "Payer 'Carol' not found in group")
+        self.assertEqual(results[4]["error"], "Splits add up to 60.00 but the amount is 100.00")
+
+        # Only the lines the local parser could not handle reached the model, in one call.
+        self.assertEqual(len(model.prompts), 1)
+        self.assertIn("1. hotel 3000", model.prompts[0])
+        self.assertNotIn("taxi", model.prompts[0])
+
+        self.assertEqual(Expense.objects.count(), 3)
+        self.assertEqual(ExpenseSplit.objects.count(), 6)
+        self.assertEqual(verify_ledger(), [])
+        balances = {user.name: net for user, net in get_ledger_financials(self.group.id)["balances"].items()}
+        self.assertEqual(balances, {"Me": Decimal("-750"), "Bob": Decimal("750")})
+        self.assertNotEqual(group_version(self.group.id), version)
+
+    def test_unknown_payer_lines_go_to_the_model(self):
+        model = BatchModel([
+            {"line": 1, "description": "Dinner", "amount": 1200, "payer_name": "Carol", "splits": [], "category": "Food"},
+        ])
+        body = self.post("taxi 300 with Bob\ndinner 1200 Carol paid", model)
+
+        self.assertEqual(len(model.prompts), 1)
+        self.assertIn("1. dinner 1200 Carol paid", model.prompts[0])
+        self.assertEqual(body["created"], 1)
+        self.assertEqual(body["results"][1]["error"], "Payer 'Carol' not found in group")
+        self.assertFalse(Expense.objects.filter(amount=1200).exists())
+
+    def test_malformed_items_do_not_sink_the_batch(self):
+        model = BatchModel([
+            {"line": 1, "description": "Hotel", "amount": 3000, "payer_name": "Bob", "splits": "all"},
+            {"line": 2, "description": "Cab", "amount": 300, "payer_name": "Bob", "splits": [None]},
+            {"line": 3, "description": "Fuel", "amount": 900, "payer_name": "Bob", "splits": []},
+            {"line": [4], "description": "Odd line"},
+            "not an object",
+        ])
+        text = "hotel 3000 bob\ncab 300 bob\nfuel 900 bob\nsomething odd"
+        with self.captureOnCommitCallbacks(execute=True):
+            body = self.post(text, model)
+
+        self.assertEqual(body["created"], 1)
+        errors = [r["error"] for r in body["results"]]
+        self.assertTrue(errors[0].startswith("Invalid splits"))
+        self.assertTrue(errors[1].startswith("Invalid splits"))
+        self.assertIsNone(errors[2])
+        self.assertEqual(errors[3], "The AI did not return this line")
+        self.assertEqual(Expense.objects.get().amount, 900)
+    def test_model_timeout_keeps_local_lines(self):
+        with override_settings(AI_TIMEOUT_SECONDS=0.01):
+            body = self.post("taxi 300 with Bob\nhotel 3000, Bob got it, we share", BatchModel([], delay=1))
+        self.assertEqual(body["created"], 1)
+        self.assertIn("timed out", body["results"][1]["error"])
+
+    def test_limits(self):
+        response = async_to_sync(self.client.post)(
+            f"/groups/{self.group.id}/expenses/ai/batch",
+            json={"text_input": "\n".join(f"taxi {i} with Bob" for i in range(1, services.MAX_BATCH_LINES + 2))},
+            user=self.user,
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_split_batch_lines(self):
+        self.assertEqual(
+            services.split_batch_lines("1. taxi 300\n\n• dinner 1200; * chai 40\r\n  "),
+            ["taxi 300", "dinner 1200", "chai 40"],
+        )
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+from django.test import SimpleTestCase
+from .cache_backends import MAGIC, COMPRESSED, SharedCache
+
+
+class SharedCacheTest(SimpleTestCase):
+    """Two SharedCache instances over one location stand in for two workers."""
+
+    inner_backend = "django.core.cache.backends.locmem.LocMemCache"
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.location = self.dir
+
+    def worker(self, **options):
+        return SharedCache("", {
+            "KEY_PREFIX": "test",
+            "OPTIONS": {"BACKEND": self.inner_backend, "LOCATION": self.location, **options},
+        })
+
+    def test_workers_share_entries_and_invalidation(self):
+        first, second = self.worker(), self.worker()
+        first.set("analysis", {"balances": {"Alice": 10.0}})
+        self.assertEqual(second.get("analysis"), {"balances": {"Alice": 10.0}})
+
+        second.add("group-version:1", 5, timeout=None)
+        self.assertEqual(first.incr("group-version:1"), 6)
+        self.assertEqual(second.get("group-version:1"), 6)
+
+        first.delete("analysis")
+        self.assertIsNone(second.get("analysis"))
+        self.assertEqual(second.get_many(["group-version:1", "missing"]), {"group-version:1": 6})
+
+    def test_large_values_are_compressed(self):
+        cache = self.worker(COMPRESS_MIN_BYTES=256)
+        payload = {"member_details": [{"name": f"Member {i}", "balance": 0.0} for i in range(200)]}
+        cache.set("big", payload)
+        self.assertEqual(cache.get("big"), payload)
+
+        stored = cache.inner.get("big")
+        self.assertTrue(stored.startswith(MAGIC + COMPRESSED))
+        stats = cache.stats()
+        self.assertEqual(stats["compressed"], 1)
+        self.assertLess(stats["bytes_stored"], stats["bytes_in"])
+
+    def test_namespacing(self):
+        cache = self.worker()
+        other = SharedCache("", {"KEY_PREFIX": "other", "OPTIONS": {"BACKEND": self.inner_backend, "LOCATION": self.location}})
+        cache.set("key", "mine")
+        self.assertIsNone(other.get("key"))
+
+    def test_hit_miss_counters(self):
+        cache = self.worker()
+        cache.get("nothing")
+        cache.set("thing", [1, 2, 3])
+        cache.get("thing")
+        cache.get("thing")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 1))
+        self.assertAlmostEqual(stats["hit_rate"], 2 / 3)
+
+
+class SQLiteSharedCacheTest(SharedCacheTest):
+    inner_backend = "APP.cache_backends.SQLiteCache"
+
+    def setUp(self):
+        super().setUp()
+        self.location = os.path.join(self.dir, "cache.sqlite3")
+
+    def test_expiry(self):
+        cache = self.worker()
+        cache.set("short", "lived", timeout=-1)
+        self.assertIsNone(cache.get("short"))
+        self.assertTrue(cache.add("short", "again"))
+        self.assertFalse(cache.add("short", "ignored"))
+        self.assertEqual(cache.get("short"), "again")
+
+    def test_writes_cull_expired_and_excess_rows(self):
+        cache = self.worker(OPTIONS={"MAX_ENTRIES": 10, "CULL_FREQUENCY": 2, "CULL_EVERY": 1})
+        cache.set("version", 1, timeout=None)
+        for n in range(5):
+            cache.set(f"stale-{n}", n, timeout=-1)
+        cache.set("fresh", "value")
+        rows = cache.inner.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        self.assertEqual(rows, 2)
+
+        for n in range(12):
+            cache.set(f"analysis-{n}", n, timeout=60 + n)
+        rows = cache.inner.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        self.assertLessEqual(rows, 11)
+        # The soonest to expire went first; counters that never expire stay.
+        self.assertEqual(cache.get("version"), 1)
+        self.assertEqual(cache.get("analysis-11"), 11)
+        self.assertIsNone(cache.get("analysis-0"))
@@ -0,0 +1,63 @@
+from django.core.cache import cache
+from django.test import TestCase
+from ninja.testing import TestClient
+from .api import api
+from .caching import group_version
+from .models import User, Group, Expense, ExpenseSplit, GroupMember
+
+
+class GroupVersionCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create(name="Alice", clerk_user_id="cache1")
+        self.bob = User.objects.create(name="Bob", clerk_user_id="cache2")
+        self.group = Group.objects.create(name="Trip", type="SHORT", owner=self.alice)
+        GroupMember.objects.create(group=self.group, user=self.alice)
+        GroupMember.objects.create(group=self.group, user=self.bob)
+        self.client = TestClient(api)
+
+    def analysis(self, user):
+        response = self.client.get(f"/groups/{self.group.id}/analysis", user=user)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def add_expense(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            expense = Expense.objects.create(group=self.group, payer=self.alice, amount=100, description="Fuel", category="TRANSPORTATION")
+            ExpenseSplit.objects.create(expense=expense, user=self.alice, owed_amount=50)
+            ExpenseSplit.objects.create(expense=expense, user=self.bob, owed_amount=50)
+        return expense
+
+    def test_hit_skips_database(self):
+        self.analysis(self.alice)
+        with self.assertNumQueries(0):
+            self.analysis(self.alice)
+
+    def test_writes_invalidate_immediately(self):
+        self.assertEqual(self.analysis(self.alice)["balances"]["Bob"], 0.0)
+        expense = self.add_expense()
+        self.assertEqual(self.analysis(self.alice)["balances"]["Bob"], -50.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/expenses/{expense.id}/respond", json={"action": "REJECT"}, user=self.bob)
+        self.assertEqual(self.analysis(self.alice)["balances"]["Bob"], 0.0)
+
+    def test_entries_are_per_user(self):
+        self.add_expense()
+        before = group_version(self.group.id)
+        self.analysis(self.alice)
+        bob_view = self.client.get("/groups", user=self.bob).json()
+        self.assertFalse(bob_view[0]["is_owner"])
+        self.assertTrue(self.client.get("/groups", user=self.alice).json()[0]["is_owner"])
+        self.assertEqual(group_version(self.group.id), before)
+
+    def test_membership_and_group_updates_bump_version(self):
+        before = group_version(self.group.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(f"/groups/{self.group.id}", json={"name": "Road trip"}, user=self.alice)
+        self.assertGreater(group_version(self.group.id), before)
+
+        self.assertEqual(len(self.client.get("/groups", user=self.bob).json()), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/groups/{self.group.id}/leave", user=self.bob)
+        self.assertEqual(self.client.get("/groups", user=self.bob).json(), [])
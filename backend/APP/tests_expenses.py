@@ -0,0 +1,95 @@
+from django.db import connection
+from django.db.models import Q
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from ninja.testing import TestClient
+from .api import api
+from .models import User, Group, Expense, ExpenseSplit, GroupMember
+
+
+class ExpenseListingTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(name="Me", clerk_user_id="expenses1")
+        self.friend = User.objects.create(name="Friend", clerk_user_id="expenses2")
+        self.group = Group.objects.create(name="Home", type="LONG", owner=self.user)
+        GroupMember.objects.create(group=self.group, user=self.user)
+        GroupMember.objects.create(group=self.group, user=self.friend)
+        self.client = TestClient(api)
+
+    def add_expenses(self, count):
+        for i in range(count):
+            expense = Expense.objects.create(group=self.group, payer=self.friend, amount=10, description=f"Item {i}", category="FOOD")
+            ExpenseSplit.objects.create(expense=expense, user=self.friend, owed_amount=10)
+            if i % 2 == 0:
+                ExpenseSplit.objects.create(expense=expense, user=self.user, owed_amount=0, status="DISPUTED")
+
+    def list_expenses(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/groups/{self.group.id}/expenses", user=self.user)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()["items"]
+
+    def test_user_approval_status(self):
+        self.add_expenses(2)
+        _, expenses = self.list_expenses()
+        statuses = {e["description"]: e["user_approval_status"] for e in expenses}
+        self.assertEqual(statuses, {"Item 0": "DISPUTED", "Item 1": "NOT_INVOLVED"})
+        self.assertEqual(expenses[0]["payer"], {"name": "Friend", "id": self.friend.id})
+
+    def test_query_count_independent_of_expense_count(self):
+        self.add_expenses(1)
+        few, _ = self.list_expenses()
+        self.add_expenses(40)
+        many, expenses = self.list_expenses()
+        self.assertEqual(len(expenses), 41)
+        self.assertEqual(few, many)
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(name="Me", clerk_user_id="pages1")
+        self.group = Group.objects.create(name="Home", type="LONG", owner=self.user)
+        GroupMember.objects.create(group=self.group, user=self.user)
+        self.client = TestClient(api)
+        self.expenses = [
+            Expense.objects.create(group=self.group, payer=self.user, amount=i, description=f"Item {i}", category="FOOD")
+            for i in range(5)
+        ]
+        # Two expenses sharing a timestamp must still be paged deterministically.
+        Expense.objects.filter(pk=self.expenses[2].pk).update(created_at=self.expenses[3].created_at)
+
+    def test_walks_every_page_once(self):
+        seen = []
+        cursor = None
+        while True:
+            url = f"/groups/{self.group.id}/expenses?limit=2" + (f"&cursor={cursor}" if cursor else "")
+            page = self.client.get(url, user=self.user).json()
+            self.assertLessEqual(len(page["items"]), 2)
+            seen.extend(e["id"] for e in page["items"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(sorted(seen), sorted(e.id for e in self.expenses))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_logs_are_paged(self):
+        page = self.client.get(f"/groups/{self.group.id}/logs?limit=1", user=self.user).json()
+        self.assertEqual(len(page["items"]), 1)
+        self.assertIsNone(page["next_cursor"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(f"/groups/{self.group.id}/expenses?cursor=garbage", user=self.user)
+        self.assertEqual(response.status_code, 400)
+
+    def test_deep_page_seeks_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("EXPLAIN output is checked against SQLite's query planner")
+        created_at, pk = self.expenses[1].created_at, self.expenses[1].pk
+        plan = (
+            Expense.objects.filter(group=self.group)
+            .filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+            .order_by('-created_at', '-id')[:50]
+            .explain()
+        )
+        self.assertIn("expense_group_created_id", plan, plan)
+        self.assertNotIn("TEMP B-TREE", plan, plan)
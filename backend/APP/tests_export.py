@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, TestCase, override_settings
+from django.utils import timezone
+from ninja.testing import TestClient
+
+from . import exporter
+from .api import api
+from .importer import read_rows
+from .middleware import ClerkAuthenticationMiddleware
+from .models import Expense, ExpenseSplit, Group, GroupMember, User
+from .services import import_expenses
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.me = User.objects.create(name="Me", clerk_user_id="exp1")
+        self.bob = User.objects.create(name="Bob, Jr.", clerk_user_id="exp2")
+        self.group = Group.objects.create(name="Goa Trip", type="SHORT", owner=self.me)
+        GroupMember.objects.create(group=self.group, user=self.me)
+        GroupMember.objects.create(group=self.group, user=self.bob)
+        for day, amount in ((1, "300.00"), (15, "120.50"), (28, "99.99")):
+            expense = Expense.objects.create(
+                group=self.group, payer=self.me, amount=Decimal(amount), description=f"Day {day}", category="FOOD"
+            )
+            Expense.objects.filter(pk=expense.pk).update(
+                created_at=timezone.make_aware(datetime(2024, 3, day, 12))
+            )
+            ExpenseSplit.objects.create(expense=expense, user=self.me, owed_amount=Decimal(amount) / 2)
+            ExpenseSplit.objects.create(expense=expense, user=self.bob, owed_amount=Decimal(amount) / 2)
+        self.client = TestClient(api)
+
+    def get(self, query=""):
+        return self.client.get(f"/groups/{self.group.id}/export{query}", user=self.me)
+
+    def test_csv_round_trips_through_import(self):
+        response = self.get()
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="goa-trip-expenses.csv"')
+        body = response.content.decode()
+
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual([row["description"] for row in rows], ["Day 1", "Day 15", "Day 28"])
+        self.assertEqual(rows[1]["splits"], "Me:60.25;Bob, Jr.:60.25")
+        self.assertEqual(rows[0]["category"], "Food")
+
+        parsed = read_rows(body)
+        self.assertEqual(parsed[0][1]["created_at"], timezone.make_aware(datetime(2024, 3, 1, 12)))
+        self.assertEqual(parsed[1][1]["splits"][1], {"user_name": "Bob, Jr.", "amount": "60.25"})
+
+    def test_formula_cells_are_escaped_and_statuses_survive_import(self):
+        Expense.objects.filter(description="Day 15").update(description='=HYPERLINK("http://x","y")', status="REJECTED")
+        body = self.get().content.decode()
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(rows[1]["description"], '\'=HYPERLINK("http://x","y")')
+
+        copy = Group.objects.create(name="Copy", type="SHORT", owner=self.me)
+        GroupMember.objects.create(group=copy, user=self.me)
+        GroupMember.objects.create(group=copy, user=self.bob)
+        self.assertEqual(import_expenses(copy.id, read_rows(body)), (3, []))
+        imported = Expense.objects.get(group=copy, amount=Decimal("120.50"))
+        self.assertEqual((imported.description, imported.status), ('=HYPERLINK("http://x","y")', "REJECTED"))
+        self.assertEqual(Expense.objects.filter(group=copy, status="APPROVED").count(), 2)
+
+    def test_ndjson_with_date_range(self):
+        response = self.get("?format=ndjson&start=2024-03-10&end=2024-03-28")
+        lines = response.content.decode().splitlines()
+        self.assertEqual([json.loads(line)["description"] for line in lines], ["Day 15", "Day 28"])
+        self.assertEqual(json.loads(lines[0])["splits"][0], {"user_name": "Me", "amount": "60.25"})
+        self.assertEqual(self.get("?format=xml").status_code, 400)
+
+    def test_queries_per_chunk(self):
+        with self.assertNumQueries(3):  # expenses, then splits for each chunk of 2
+            rows = list(exporter.expense_rows(self.group.id, chunk_size=2))
+        self.assertEqual(len(rows), 3)
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_streams_asynchronously_under_asgi(self):
+        async def fetch():
+            response = await AsyncClient().get(
+                f"/api/groups/{self.group.id}/export?format=ndjson", headers={"Authorization": "Bearer token"}
+            )
+            self.assertTrue(response.is_async)
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        with mock.patch.object(ClerkAuthenticationMiddleware, "authenticate", return_value={"sub": "exp1"}), \
+                mock.patch.object(ClerkAuthenticationMiddleware, "sync_user", return_value=self.me):
+            body = async_to_sync(fetch)()
+        self.assertEqual(len(body.decode().splitlines()), 3)
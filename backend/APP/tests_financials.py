@@ -0,0 +1,56 @@
+from datetime import datetime, timezone as dt_timezone
+from django.test import TestCase
+from .models import User, Group, Expense, ExpenseSplit, GroupMember
+from .services import get_monthly_financials, month_range
+
+
+class MonthlyFinancialsTest(TestCase):
+    def make_group(self, size):
+        users = [User.objects.create(name=f"User {i}", clerk_user_id=f"fin{size}_{i}") for i in range(size)]
+        group = Group.objects.create(name=f"Group {size}", type="LONG", owner=users[0])
+        for user in users:
+            GroupMember.objects.create(group=group, user=user)
+
+        # Every member pays once and everyone shares every expense equally.
+        for payer in users:
+            expense = Expense.objects.create(
+                group=group, payer=payer, amount=size * 10, description="Chai", category="FOOD"
+            )
+            for user in users:
+                ExpenseSplit.objects.create(expense=expense, user=user, owed_amount=10)
+        return group, users
+
+    def test_balances(self):
+        group, users = self.make_group(3)
+        Expense.objects.create(group=group, payer=users[0], amount=999, description="Rejected", category="FOOD", status="REJECTED")
+        extra = Expense.objects.create(group=group, payer=users[1], amount=60, description="Cab", category="TRANSPORTATION")
+        ExpenseSplit.objects.create(expense=extra, user=users[0], owed_amount=30)
+        ExpenseSplit.objects.create(expense=extra, user=users[2], owed_amount=30)
+
+        financials = get_monthly_financials(group.id)
+        self.assertEqual(financials['total_spend'], 150.0)
+        self.assertEqual(financials['member_count'], 3)
+        self.assertEqual(financials['balances'][users[0]], -30)
+        self.assertEqual(financials['balances'][users[1]], 60)
+        self.assertEqual(financials['balances'][users[2]], -30)
+        self.assertEqual(financials['paid'][users[1]], 90)
+        self.assertEqual(financials['consumed'][users[1]], 30)
+
+    def test_query_count_is_constant(self):
+        small, _ = self.make_group(2)
+        large, _ = self.make_group(32)
+
+        with self.assertNumQueries(4):
+            get_monthly_financials(small.id)
+        with self.assertNumQueries(4):
+            get_monthly_financials(large.id)
+
+    def test_missing_group(self):
+        self.assertEqual(get_monthly_financials(0), {"total_spend": 0, "balances": {}})
+
+
+class MonthRangeTest(TestCase):
+    def test_half_open_bounds(self):
+        start, end = month_range(datetime(2025, 12, 31, 23, 59, tzinfo=dt_timezone.utc))
+        self.assertEqual(start, datetime(2025, 12, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(end, datetime(2026, 1, 1, tzinfo=dt_timezone.utc))
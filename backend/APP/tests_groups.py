@@ -0,0 +1,62 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from ninja.testing import TestClient
+from .api import api
+from .models import User, Group, Expense, GroupMember
+
+
+class GroupListingTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(name="Owner", clerk_user_id="groups1")
+        self.friend = User.objects.create(name="Friend", clerk_user_id="groups2")
+        self.client = TestClient(api)
+        cache.clear()
+
+    def make_groups(self, count):
+        for i in range(count):
+            group = Group.objects.create(name=f"Group {i}", type="LONG", owner=self.user)
+            GroupMember.objects.create(group=group, user=self.user)
+            GroupMember.objects.create(group=group, user=self.friend)
+            Expense.objects.create(group=group, payer=self.user, amount=100, description="Rent", category="BILLS")
+            Expense.objects.create(group=group, payer=self.friend, amount=50, description="Milk", category="FOOD", status="PENDING")
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/groups", user=self.user)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_fields(self):
+        self.make_groups(1)
+        _, groups = self.count_list_queries()
+        self.assertEqual(len(groups), 1)
+        group = groups[0]
+        self.assertEqual(group["totalTransactions"], 2)
+        self.assertEqual(group["approvedTransactions"], 1)
+        self.assertEqual(group["pendingTransactions"], 1)
+        self.assertEqual(group["netAmount"], 100.0)
+        self.assertEqual(group["memberCount"], 2)
+        self.assertTrue(group["is_owner"])
+        self.assertIsNotNone(group["lastActivity"])
+
+        response = self.client.get(f"/groups/{group['id']}", user=self.friend)
+        self.assertFalse(response.json()["is_owner"])
+        self.assertEqual(response.json()["memberCount"], 2)
+
+    def test_query_count_independent_of_group_count(self):
+        self.make_groups(1)
+        one, _ = self.count_list_queries()
+        self.make_groups(99)
+        hundred, groups = self.count_list_queries()
+        self.assertEqual(len(groups), 100)
+        self.assertEqual(one, hundred)
+        # Membership lookup for the cache key, then the annotated listing.
+        self.assertEqual(hundred, 2)
+
+    def test_create_returns_annotated_group(self):
+        response = self.client.post("/groups", json={"name": "New", "type": "SHORT"}, user=self.user)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["memberCount"], 1)
+        self.assertEqual(response.json()["totalTransactions"], 0)
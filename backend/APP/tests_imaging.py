@@ -0,0 +1,110 @@
+import io
+import json
+from unittest import mock
+
+import PIL.Image
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from ninja.testing import TestAsyncClient
+
+from . import aicache, services
+from .ai_providers import GeminiProvider
+from .api import api
+from .imaging import ImageTooLarge, preprocess_receipt
+from .models import Group, GroupMember, User
+
+
+def photo(width, height, orientation=None, fmt="JPEG"):
+    image = PIL.Image.new("RGB", (width, height), (200, 180, 160))
+    image.paste((20, 20, 20), (0, 0, width // 4, height // 4))
+    exif = PIL.Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    out = io.BytesIO()
+    image.save(out, format=fmt, exif=exif.tobytes())
+    out.seek(0)
+    return out
+
+
+@override_settings(RECEIPT_MAX_EDGE=800, RECEIPT_FORMAT="JPEG", RECEIPT_QUALITY=80, RECEIPT_MAX_PIXELS=20_000_000)
+class PreprocessReceiptTest(TestCase):
+    def test_downscales_grayscales_and_reencodes(self):
+        source = photo(3000, 4000)
+        prepared = preprocess_receipt(source)
+        self.assertEqual((prepared.width, prepared.height), (600, 800))
+        self.assertEqual(prepared.mime_type, "image/jpeg")
+        self.assertLess(len(prepared.data), len(source.getvalue()))
+
+        decoded = PIL.Image.open(io.BytesIO(prepared.data))
+        self.assertEqual((decoded.format, decoded.mode), ("JPEG", "L"))
+
+    def test_applies_exif_orientation(self):
+        # Orientation 6: stored landscape, displayed portrait.
+        prepared = preprocess_receipt(photo(1600, 1200, orientation=6))
+        self.assertEqual((prepared.width, prepared.height), (600, 800))
+
+    def test_stretches_contrast(self):
+        source = io.BytesIO()
+        flat = PIL.Image.new("L", (100, 100), 120)
+        flat.paste(140, (0, 0, 50, 100))
+        flat.save(source, format="PNG")
+        decoded = PIL.Image.open(io.BytesIO(preprocess_receipt(source).data))
+        low, high = decoded.getextrema()
+        self.assertLess(low, 20)
+        self.assertGreater(high, 235)
+
+    def test_webp(self):
+        prepared = preprocess_receipt(photo(1000, 1000), image_format="webp")
+        self.assertEqual(prepared.mime_type, "image/webp")
+        self.assertEqual(PIL.Image.open(io.BytesIO(prepared.data)).format, "WEBP")
+
+    def test_pixel_cap_is_checked_before_decoding(self):
+        source = photo(2000, 2000)
+        with mock.patch.object(PIL.Image.Image, "load") as load:
+            with self.assertRaises(ImageTooLarge):
+                preprocess_receipt(source, max_pixels=1_000_000)
+        load.assert_not_called()
+
+
+class ReceiptEndpointTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(name="Me", clerk_user_id="imaging1")
+        self.group = Group.objects.create(name="Home", type="LONG", owner=self.user)
+        GroupMember.objects.create(group=self.group, user=self.user)
+        aicache.parse_cache.clear()
+        cache.clear()
+        self.client = TestAsyncClient(api)
+
+    def upload(self, source):
+        return async_to_sync(self.client.post)(
+            f"/groups/{self.group.id}/expenses/ocr",
+            FILES={"file": SimpleUploadedFile("receipt.jpg", source.getvalue(), content_type="image/jpeg")},
+            user=self.user,
+        )
+
+    @override_settings(RECEIPT_MAX_EDGE=500)
+    def test_model_receives_preprocessed_image(self):
+        sent = []
+
+        async def generate_content_async(contents):
+            sent.append(contents[1])
+            return mock.Mock(text=json.dumps({
+                "description": "Groceries", "amount": 12, "payer_name": "Me", "splits": [], "category": "SUPPLIES",
+            }))
+
+        model = mock.Mock(generate_content_async=generate_content_async)
+        with mock.patch.object(services, "get_provider", return_value=GeminiProvider(model=model)):
+            response = self.upload(photo(2000, 3000))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sent[0]["mime_type"], "image/jpeg")
+        self.assertEqual(PIL.Image.open(io.BytesIO(sent[0]["data"])).size, (333, 500))
+
+    @override_settings(RECEIPT_MAX_PIXELS=1_000_000)
+    def test_oversized_image_is_rejected(self):
+        with mock.patch.object(services, "get_provider") as get_provider:
+            response = self.upload(photo(2000, 2000))
+        self.assertEqual(response.status_code, 413)
+        get_provider.assert_not_called()
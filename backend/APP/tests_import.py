@@ -0,0 +1,155 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from ninja.testing import TestClient
+
+from . import services
+from .api import api
+from .importer import ImportFormatError, read_rows
+from .ledger import get_ledger_financials, verify_ledger
+from .members import MemberIndex
+from .models import Expense, ExpenseSplit, Group, GroupMember, User
+
+
+class MemberIndexTest(TestCase):
+    def setUp(self):
+        self.rahul = User(name="Rahul Mehta", clerk_user_id="m1")
+        self.amit = User(name="Amit", clerk_user_id="m2")
+        self.amita = User(name="Amita Rao", clerk_user_id="m3")
+
+    def test_levels(self):
+        members = MemberIndex([self.rahul, self.amit, self.amita])
+        self.assertEqual(members.find("Rahul Mehta"), self.rahul)
+        self.assertEqual(members.find("  rahul   MEHTA "), self.rahul)
+        self.assertEqual(members.find("mehta"), self.rahul)
+        self.assertEqual(members.find("rah"), self.rahul)
+        self.assertEqual(members.find("hul"), self.rahul)
+        # "amit" is Amit's whole name, even though it prefixes "Amita"
+        self.assertEqual(members.find("amit"), self.amit)
+        self.assertEqual(members.find("rao"), self.amita)
+        self.assertIsNone(members.find("Zoe"))
+        self.assertIsNone(members.find(""))
+        self.assertIsNone(members.find(None))
+
+    def test_ambiguous_names_match_nobody(self):
+        other = User(name="Rahul Shah", clerk_user_id="m4")
+        members = MemberIndex([self.rahul, other])
+        self.assertIsNone(members.find("rahul"))
+        self.assertEqual(members.find("shah"), other)
+        self.assertEqual(len(members), 2)
+
+
+class ImportExpensesTest(TestCase):
+    def setUp(self):
+        self.me = User.objects.create(name="Me", clerk_user_id="imp1")
+        self.rahul = User.objects.create(name="Rahul Mehta", clerk_user_id="imp2")
+        self.amit = User.objects.create(name="Amit", clerk_user_id="imp3")
+        self.group = Group.objects.create(name="Flat", type="LONG", owner=self.me)
+        for user in (self.me, self.rahul, self.amit):
+            GroupMember.objects.create(group=self.group, user=user)
+        self.client = TestClient(api)
+
+    def upload(self, content, name="history.csv"):
+        return self.client.post(
+            f"/groups/{self.group.id}/expenses/import",
+            FILES={"file": SimpleUploadedFile(name, content.encode())},
+            user=self.me,
+        )
+
+    def test_read_rows(self):
+        rows = read_rows(
+            "\ufeffDate,Description,Amount,Payer,Category,Splits\n"
+            "2024-03-02,Groceries,1200,Rahul,Food,Rahul:600;Amit:600\n"
+            "yesterday,Cab,300,Amit,,\n"
+        )
+        (line, first), (bad_line, bad) = rows
+        self.assertEqual(line, 2)
+        self.assertEqual(first["payer_name"], "Rahul")
+        self.assertEqual(first["splits"], [{"user_name": "Rahul", "amount": "600"}, {"user_name": "Amit", "amount": "600"}])
+        self.assertEqual(first["created_at"].date().isoformat(), "2024-03-02")
+        self.assertTrue(timezone.is_aware(first["created_at"]))
+        self.assertEqual(bad_line, 3)
+        self.assertIsInstance(bad, ValueError)
+
+        with self.assertRaises(ImportFormatError):
+            read_rows("name,notes\nx,y\n")
+
+    def test_csv_import_keeps_history(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.upload(
+                "date,description,amount,payer,category,splits\n"
+                "2024-01-15,Rent,3000,Me,Bills,\n"
+                "2024-02-10,Groceries,1200,rahul,food,Rahul:600;Amit:600\n"
+            )
+        self.assertEqual(response.status_code, 200, response.json())
+        self.assertEqual(response.json(), {"created": 2, "errors": []})
+
+        rent = Expense.objects.get(description="Rent")
+        self.assertEqual(rent.created_at, timezone.make_aware(datetime(2024, 1, 15, 12)))
+        self.assertEqual(rent.splits.count(), 3)
+        groceries = Expense.objects.get(description="Groceries")
+        self.assertEqual((groceries.payer, groceries.category), (self.rahul, "Food"))
+        self.assertEqual(verify_ledger([self.group.id]), [])
+
+        # Each expense lands in its own historical month, not the current one.
+        january = get_ledger_financials(self.group.id, month=date(2024, 1, 1))["balances"]
+        self.assertEqual((january[self.me], january[self.amit]), (Decimal("2000"), Decimal("-1000")))
+        february = get_ledger_financials(self.group.id, month=date(2024, 2, 1))["balances"]
+        self.assertEqual((february[self.rahul], february[self.amit]), (Decimal("600"), Decimal("-600")))
+
+    def test_any_bad_row_rejects_the_file(self):
+        response = self.upload(json.dumps([
+            {"date": "2024-01-01", "description": "Ok", "amount": 100, "payer": "Me"},
+            {"description": "Who", "amount": 100, "payer": "Zoe"},
+            {"description": "Sum", "amount": 100, "payer": "Me", "splits": [{"user_name": "Amit", "amount": 30}]},
+            {"description": "Neg", "amount": -5, "payer": "Me"},
+        ]), name="history.json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([e["row"] for e in response.json()["errors"]], [2, 3, 4])
+        self.assertFalse(Expense.objects.exists())
+
+    @override_settings(IMPORT_MAX_UPLOAD_BYTES=40)
+    def test_oversized_uploads_are_refused(self):
+        response = self.upload("date,description,amount,payer\n2024-01-05,Groceries,900,Me\n")
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("limited to 40 bytes", response.json()["errors"][0]["error"])
+        self.assertFalse(Expense.objects.exists())
+        self.assertEqual(self.upload("amount,payer\n900,Me\n").status_code, 200)
+
+    def test_malformed_json_fields_are_row_errors(self):
+        response = self.upload(json.dumps([
+            {"description": "Ok", "amount": 100, "payer": "Me"},
+            {"description": "List of strings", "amount": 100, "payer": "Me", "splits": ["x"]},
+            {"description": "Number", "amount": 100, "payer": "Me", "splits": 5},
+            {"description": "Numeric date", "amount": 100, "payer": "Me", "date": 20240101},
+            {"description": "Nulls", "amount": 100, "payer": "Me", "splits": [None]},
+            {"description": "Status", "amount": 100, "payer": "Me", "status": "SETTLED"},
+        ]), name="history.json")
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()["errors"]
+        self.assertEqual([e["row"] for e in errors], [2, 3, 4, 5, 6])
+        self.assertIn("Invalid status", errors[4]["error"])
+        self.assertIn("Invalid splits", errors[0]["error"])
+        self.assertIn("Invalid date", errors[2]["error"])
+        self.assertFalse(Expense.objects.exists())
+
+    def test_large_import_uses_bulk_queries(self):
+        lines = ["date,description,amount,payer,splits"]
+        for i in range(1000):
+            lines.append(f"2023-{i % 12 + 1:02d}-{i % 28 + 1:02d},Item {i},{i + 3},{['Me', 'Rahul', 'Amit'][i % 3]},")
+        rows = read_rows("\n".join(lines))
+        with CaptureQueriesContext(connection) as queries:
+            created, errors = services.import_expenses(self.group.id, rows)
+        self.assertEqual((created, errors), (1000, []))
+        # Bounded by the 36 ledger cells (3 members x 12 months) and the 12
+        # spend rollup rows (each month has one payer), not the 1000 rows.
+        self.assertLess(len(queries), (36 + 12) * 4 + 40)
+        self.assertEqual(ExpenseSplit.objects.filter(expense__group=self.group).count(), 3000)
+        self.assertEqual(Expense.objects.filter(created_at__year=2023).count(), 1000)
+        self.assertEqual(verify_ledger([self.group.id]), [])
@@ -0,0 +1,41 @@
+from django.db import connection
+from django.test import TestCase
+from .models import User, Group, Expense, ExpenseSplit, GroupLog
+from .services import month_range
+
+
+class IndexUsageTest(TestCase):
+    """EXPLAIN the hot queries and check they search the composite indexes."""
+
+    def setUp(self):
+        self.user = User.objects.create(name="User", clerk_user_id="index1")
+        self.group = Group.objects.create(name="Group", type="LONG", owner=self.user)
+
+    def assertUsesIndex(self, queryset, index_name):
+        if connection.vendor != 'sqlite':
+            self.skipTest("EXPLAIN output is checked against SQLite's query planner")
+        plan = queryset.explain()
+        self.assertIn(f"USING INDEX {index_name}", plan, plan)
+
+    def test_monthly_expenses(self):
+        start, end = month_range()
+        queryset = Expense.objects.filter(
+            group=self.group,
+            status__in=Expense.COUNTED_STATUSES,
+            created_at__gte=start,
+            created_at__lt=end,
+        )
+        self.assertUsesIndex(queryset, "expense_group_status_created")
+
+    def test_user_splits(self):
+        queryset = ExpenseSplit.objects.filter(user=self.user, expense_id__in=[1, 2, 3])
+        self.assertUsesIndex(queryset, "split_user_expense")
+
+    def test_group_logs(self):
+        queryset = GroupLog.objects.filter(group=self.group).order_by('-created_at')
+        self.assertUsesIndex(queryset, "grouplog_group_created")
+
+    def test_period_transaction_counts(self):
+        start, end = month_range()
+        queryset = Expense.objects.filter(group=self.group, created_at__gte=start, created_at__lt=end)
+        self.assertUsesIndex(queryset.values('payer').order_by(), "expense_group_created_id")
@@ -0,0 +1,165 @@
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from asgiref.sync import async_to_sync
+from ninja.testing import TestAsyncClient, TestClient
+
+from . import jobs
+from .api import api
+from .imaging import ImageTooLarge
+from .models import AIParseJob, Expense, Group, GroupMember, User
+
+
+def stub_parse_text(text_input, group_id, current_user_name):
+    if text_input == "gibberish":
+        return None
+    return {
+        "description": text_input,
+        "amount": 30,
+        "payer_name": current_user_name,
+        "splits": [{"user_name": "Me", "amount": 15}, {"user_name": "Friend", "amount": 15}],
+        "category": "FOOD",
+    }
+
+
+def stub_parse_receipt(image_file, group_id, current_user_name, text_context=None):
+    return {
+        "description": f"Receipt ({len(image_file.read())} bytes): {text_context}",
+        "amount": 12,
+        "payer_name": current_user_name,
+        "splits": [],
+        "category": "SUPPLIES",
+    }
+
+
+class AIJobQueueTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(name="Me", clerk_user_id="jobs1")
+        self.friend = User.objects.create(name="Friend", clerk_user_id="jobs2")
+        self.group = Group.objects.create(name="Home", type="LONG", owner=self.user)
+        GroupMember.objects.create(group=self.group, user=self.user)
+        GroupMember.objects.create(group=self.group, user=self.friend)
+        self.client = TestClient(api)
+        # The AI endpoints are async views
+        self.async_client = TestAsyncClient(api)
+
+    def drain(self):
+        return jobs.drain(parse_text=stub_parse_text, parse_receipt=stub_parse_receipt)
+
+    def job_status(self, job_id):
+        response = self.client.get(f"/groups/{self.group.id}/expenses/jobs/{job_id}", user=self.user)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_text_job_round_trip(self):
+        response = async_to_sync(self.async_client.post)(
+            f"/groups/{self.group.id}/expenses/ai?async=true", json={"text_input": "Pizza"}, user=self.user
+        )
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["id"]
+        self.assertEqual(response.json()["status"], "PENDING")
+        self.assertFalse(Expense.objects.exists())
+
+        self.assertEqual(len(self.drain()), 1)
+
+        job = self.job_status(job_id)
+        self.assertEqual(job["status"], "DONE")
+        self.assertEqual(job["expense"]["description"], "Pizza")
+        self.assertEqual(job["expense"]["payer"]["id"], self.user.id)
+        self.assertEqual(Expense.objects.get().splits.count(), 2)
+
+    def test_receipt_job_stores_upload_until_done(self):
+        upload = SimpleUploadedFile("receipt.png", b"12345", content_type="image/png")
+        response = async_to_sync(self.async_client.post)(
+            f"/groups/{self.group.id}/expenses/ocr?async=true",
+            FILES={"file": upload}, POST={"text_input": "Groceries"}, user=self.user,
+        )
+        self.assertEqual(response.status_code, 202)
+        job = AIParseJob.objects.get(id=response.json()["id"])
+        self.assertEqual(bytes(job.image), b"12345")
+
+        self.drain()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "DONE")
+        self.assertIsNone(job.image)
+        self.assertEqual(job.expense.description, "Receipt (5 bytes): Groceries")
+
+    @override_settings(RECEIPT_MAX_UPLOAD_BYTES=4)
+    def test_oversized_receipts_are_refused(self):
+        upload = SimpleUploadedFile("receipt.png", b"12345", content_type="image/png")
+        response = async_to_sync(self.async_client.post)(
+            f"/groups/{self.group.id}/expenses/ocr?async=true", FILES={"file": upload}, user=self.user,
+        )
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(AIParseJob.objects.exists())
+
+        # Files that under-report their size are still cut off.
+        upload = SimpleUploadedFile("receipt.png", b"12345", content_type="image/png")
+        upload.size = 1
+        with self.assertRaises(ImageTooLarge):
+            jobs.enqueue_receipt(self.group, self.user, upload)
+
+    def test_failed_parse_is_reported(self):
+        job = jobs.enqueue_text(self.group, self.user, "gibberish")
+        self.drain()
+        status = self.job_status(job.id)
+        self.assertEqual(status["status"], "FAILED")
+        self.assertEqual(status["error"], "Failed to parse")
+        self.assertIsNone(status["expense"])
+
+    def test_job_is_claimed_once(self):
+        job = jobs.enqueue_text(self.group, self.user, "Pizza")
+        self.assertEqual(jobs.claim_next().id, job.id)
+        self.assertIsNone(jobs.claim_next())
+        self.assertEqual(self.drain(), [])
+
+    def test_stale_jobs_are_requeued_then_failed(self):
+        job = jobs.enqueue_text(self.group, self.user, "Pizza")
+        long_ago = timezone.now() - timedelta(hours=1)
+        for attempt in range(1, jobs.MAX_ATTEMPTS + 1):
+            jobs.claim_next()
+            AIParseJob.objects.filter(id=job.id).update(started_at=long_ago)
+            requeued, failed = jobs.requeue_stale()
+            self.assertEqual((requeued, failed), (0, 1) if attempt == jobs.MAX_ATTEMPTS else (1, 0))
+        job.refresh_from_db()
+        self.assertEqual(job.status, "FAILED")
+
+    def test_jobs_are_private_to_the_group(self):
+        stranger = User.objects.create(name="Stranger", clerk_user_id="jobs3")
+        job = jobs.enqueue_text(self.group, self.user, "Pizza")
+        response = self.client.get(f"/groups/{self.group.id}/expenses/jobs/{job.id}", user=stranger)
+        self.assertEqual(response.status_code, 404)
+
+
+class AIJobPoolTest(TestCase):
+    def test_pool_bounds_concurrency(self):
+        user = User.objects.create(name="Me", clerk_user_id="pool1")
+        group = Group.objects.create(name="Home", type="LONG", owner=user)
+        for i in range(6):
+            jobs.enqueue_text(group, user, f"Item {i}")
+
+        lock = threading.Lock()
+        running, peak = [0], [0]
+
+        def slow_job(job, parse_text, parse_receipt):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+            return job
+
+        with mock.patch.object(jobs, "process_job", slow_job):
+            processed = jobs.drain(concurrency=3)
+
+        self.assertEqual(len(processed), 6)
+        self.assertEqual(peak[0], 3)
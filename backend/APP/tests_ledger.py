@@ -0,0 +1,100 @@
+from importlib import import_module
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase
+from ninja.testing import TestClient
+from .api import api
+from .ledger import get_ledger_financials, verify_ledger
+from .models import User, Group, Expense, ExpenseSplit, GroupMember, MemberMonthlyBalance
+from .services import get_monthly_financials, get_unified_fairness_analysis
+
+
+class LedgerTest(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(name="User 1", clerk_user_id="ledger1")
+        self.user2 = User.objects.create(name="User 2", clerk_user_id="ledger2")
+        self.user3 = User.objects.create(name="User 3", clerk_user_id="ledger3")
+        self.group = Group.objects.create(name="Flat", type="LONG", owner=self.user1)
+        for user in (self.user1, self.user2, self.user3):
+            GroupMember.objects.create(group=self.group, user=user)
+        self.client = TestClient(api)
+
+    def add_expense(self, payer, amount, shares, status="APPROVED"):
+        expense = Expense.objects.create(
+            group=self.group, payer=payer, amount=amount, description="Groceries", category="FOOD", status=status
+        )
+        for user, owed in shares:
+            ExpenseSplit.objects.create(expense=expense, user=user, owed_amount=owed)
+        return expense
+
+    def assertLedgerMatchesRaw(self):
+        self.assertEqual(verify_ledger(), [])
+        raw = get_monthly_financials(self.group.id)
+        stored = get_ledger_financials(self.group.id)
+        self.assertEqual(stored['total_spend'], raw['total_spend'])
+        self.assertEqual(stored['balances'], raw['balances'])
+
+    def test_tracks_creates_status_changes_and_deletes(self):
+        dinner = self.add_expense(self.user1, 90, [(self.user1, 30), (self.user2, 30), (self.user3, 30)])
+        cab = self.add_expense(self.user2, 40, [(self.user1, 20), (self.user2, 20)])
+        self.add_expense(self.user3, 500, [(self.user1, 500)], status="PENDING")
+        self.assertLedgerMatchesRaw()
+        self.assertEqual(get_ledger_financials(self.group.id)['balances'][self.user1], 40)
+
+        # Disputes keep counting, rejections drop out.
+        response = self.client.post(f"/expenses/{dinner.id}/dispute", json={"reason": "?"}, user=self.user2)
+        self.assertEqual(response.status_code, 200)
+        self.assertLedgerMatchesRaw()
+
+        response = self.client.post(f"/expenses/{cab.id}/respond", json={"action": "REJECT"}, user=self.user1)
+        self.assertEqual(response.status_code, 200)
+        self.assertLedgerMatchesRaw()
+        self.assertEqual(get_ledger_financials(self.group.id)['balances'][self.user2], -30)
+
+        split = dinner.splits.get(user=self.user3)
+        split.owed_amount = 10
+        split.save()
+        self.assertLedgerMatchesRaw()
+
+        response = self.client.delete(f"/expenses/{dinner.id}", user=self.user1)
+        self.assertEqual(response.status_code, 200)
+        self.assertLedgerMatchesRaw()
+        self.assertFalse(MemberMonthlyBalance.objects.exclude(paid=0, consumed=0).exists())
+
+    def test_analysis_reads_constant_rows(self):
+        self.add_expense(self.user1, 90, [(self.user1, 30), (self.user2, 30), (self.user3, 30)])
+        with self.assertNumQueries(3):
+            analysis = get_unified_fairness_analysis(self.group.id)
+        self.assertEqual(analysis['balances'], {"User 1": 60.0, "User 2": -30.0, "User 3": -30.0})
+        self.assertEqual(analysis['stats']['total_spend'], 90.0)
+
+    def test_rebuild_and_verify_command(self):
+        self.add_expense(self.user1, 90, [(self.user1, 30), (self.user2, 30), (self.user3, 30)])
+        MemberMonthlyBalance.objects.update(paid=0)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_ledger', '--verify', stdout=StringIO())
+
+        call_command('rebuild_ledger', '--group', str(self.group.id), stdout=StringIO())
+        self.assertLedgerMatchesRaw()
+        call_command('rebuild_ledger', '--verify', stdout=StringIO())
+
+    def test_migration_backfills_existing_expenses(self):
+        self.add_expense(self.user1, 90, [(self.user1, 30), (self.user2, 30), (self.user3, 30)])
+        MemberMonthlyBalance.objects.all().delete()
+
+        migration = import_module("APP.migrations.0013_membermonthlybalance")
+        state = MigrationExecutor(connection).loader.project_state(("APP", "0013_membermonthlybalance"))
+        migration.backfill_ledger(state.apps, None)
+        self.assertLedgerMatchesRaw()
+
+    def test_missing_row_is_reported(self):
+        expense = self.add_expense(self.user1, 90, [(self.user1, 30), (self.user2, 30), (self.user3, 30)])
+        MemberMonthlyBalance.objects.filter(user=self.user2).delete()
+        with self.assertLogs("APP.ledger", level="WARNING") as logs:
+            expense.delete()
+        self.assertIn(f"user={self.user2.id}", logs.output[0])
+        self.assertIn("rebuild_ledger", logs.output[0])
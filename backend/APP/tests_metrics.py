@@ -0,0 +1,54 @@
+from unittest import mock
+
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from .metrics import STAGE_SECONDS, timed
+from .middleware import ClerkAuthenticationMiddleware, ServerTimingMiddleware
+from .models import User
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, METRICS_TOKEN=None, METRICS_PUBLIC=True)
+class ServerTimingTest(TestCase):
+    def test_header_reports_stages(self):
+        def view(request):
+            User.objects.count()
+            with timed("ai"):
+                pass
+            return HttpResponse("ok")
+
+        before = STAGE_SECONDS.count(route="unresolved", stage="ai")
+        response = ServerTimingMiddleware(view)(RequestFactory().get("/somewhere"))
+
+        header = response["Server-Timing"]
+        self.assertIn('db;dur=', header)
+        self.assertIn('desc="1 queries"', header)
+        self.assertIn('ai;dur=', header)
+        self.assertIn('total;dur=', header)
+        self.assertEqual(STAGE_SECONDS.count(route="unresolved", stage="ai"), before + 1)
+
+    def test_api_request_is_labelled_by_route(self):
+        user = User.objects.create(name="Me", clerk_user_id="metrics1")
+        with mock.patch.object(ClerkAuthenticationMiddleware, "authenticate", return_value={"sub": "metrics1"}), \
+                mock.patch.object(ClerkAuthenticationMiddleware, "sync_user", return_value=user):
+            response = self.client.get("/api/groups", HTTP_AUTHORIZATION="Bearer token")
+        self.assertEqual(response.status_code, 200)
+        for stage in ("auth", "render", "total"):
+            self.assertIn(f"{stage};dur=", response["Server-Timing"])
+
+        scrape = self.client.get("/metrics")
+        self.assertEqual(scrape.status_code, 200)
+        body = scrape.content.decode()
+        self.assertIn("# TYPE spendsplit_request_stage_seconds histogram", body)
+        self.assertIn('spendsplit_request_stage_seconds_count{route="/api/groups",stage="render"}', body)
+        self.assertIn('spendsplit_request_db_queries_bucket{le="+Inf",route="/api/groups"}', body)
+        self.assertIn("spendsplit_cache_operations_total", body)
+
+    @override_settings(METRICS_PUBLIC=False)
+    def test_metrics_closed_by_default(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
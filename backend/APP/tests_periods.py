@@ -0,0 +1,170 @@
+import zoneinfo
+from unittest import mock
+from datetime import date, datetime, timezone as dt_timezone
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from ninja.testing import TestClient
+from .api import api
+from .models import User, Group, Expense, ExpenseSplit, GroupMember
+from .periods import (
+    calendar_month, date_range, iso_week, lifetime, parse_period, period_financials, range_totals,
+)
+from .services import get_unified_fairness_analysis
+
+KOLKATA = zoneinfo.ZoneInfo("Asia/Kolkata")
+UTC = zoneinfo.ZoneInfo("UTC")
+
+
+class PeriodTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(name="User", clerk_user_id="period0")
+        self.trip = Group.objects.create(name="Goa", type="SHORT", owner=self.user)
+        self.flat = Group.objects.create(name="Flat", type="LONG", owner=self.user)
+
+    def test_month_bounds_are_local_midnights(self):
+        period = calendar_month(date(2024, 12, 9), KOLKATA)
+        self.assertEqual(period.start, datetime(2024, 11, 30, 18, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(period.end, datetime(2024, 12, 31, 18, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(period.label, "December 2024")
+
+    def test_iso_week_crosses_years(self):
+        period = iso_week(date(2025, 1, 2), UTC)
+        self.assertEqual((period.start.date(), period.end.date()), (date(2024, 12, 30), date(2025, 1, 6)))
+        self.assertEqual(period.label, "Week 1, 2025")
+
+    def test_range_includes_last_day(self):
+        period = date_range(date(2024, 1, 30), date(2024, 2, 2), UTC)
+        self.assertEqual(period.end, datetime(2024, 2, 3, tzinfo=dt_timezone.utc))
+        with self.assertRaises(ValueError):
+            date_range(date(2024, 2, 2), date(2024, 1, 30), UTC)
+
+    def test_parse_defaults_and_errors(self):
+        self.assertEqual(parse_period(self.trip).kind, "lifetime")
+        self.assertEqual(parse_period(self.flat).kind, "month")
+        self.assertEqual(parse_period(self.flat, start=date(2024, 1, 1)).kind, "range")
+        self.assertEqual(parse_period(self.flat, "week", tz="Asia/Kolkata").tz, KOLKATA)
+        for kwargs in ({"kind": "fortnight"}, {"tz": "Mars/Olympus"}, {"kind": "range"}):
+            with self.assertRaises(ValueError):
+                parse_period(self.flat, **kwargs)
+
+    def test_closed(self):
+        self.assertTrue(calendar_month(date(2024, 1, 1), UTC).is_closed())
+        self.assertFalse(calendar_month(timezone.now().date(), UTC).is_closed())
+        self.assertFalse(lifetime(UTC).is_closed())
+
+
+class PeriodAnalysisTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create(name="Alice", clerk_user_id="period1")
+        self.bob = User.objects.create(name="Bob", clerk_user_id="period2")
+        self.group = Group.objects.create(name="Goa", type="SHORT", owner=self.alice)
+        GroupMember.objects.create(group=self.group, user=self.alice)
+        GroupMember.objects.create(group=self.group, user=self.bob)
+        self.client = TestClient(api)
+
+    def add_expense(self, payer, amount, when, other):
+        with self.captureOnCommitCallbacks(execute=True):
+            expense = Expense.objects.create(
+                group=self.group, payer=payer, amount=amount, description="Trip", category="FOOD"
+            )
+            if when is not None:
+                expense.created_at = when
+                expense.save()
+            ExpenseSplit.objects.create(expense=expense, user=payer, owed_amount=amount / 2)
+            ExpenseSplit.objects.create(expense=expense, user=other, owed_amount=amount / 2)
+        return expense
+
+    def add_trip(self):
+        # 31 Jan 20:00 UTC is already 1 Feb in India.
+        self.add_expense(self.alice, 1000, datetime(2024, 1, 31, 20, 0, tzinfo=dt_timezone.utc), self.bob)
+        self.add_expense(self.bob, 400, datetime(2024, 2, 1, 12, 0, tzinfo=dt_timezone.utc), self.alice)
+
+    def analysis(self, query=""):
+        response = self.client.get(f"/groups/{self.group.id}/analysis{query}", user=self.alice)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_trip_across_month_boundary(self):
+        self.add_trip()
+        whole = self.analysis()
+        self.assertEqual(whole["period"]["kind"], "lifetime")
+        self.assertEqual(whole["balances"], {"Alice": 300.0, "Bob": -300.0})
+        self.assertEqual({m["name"]: m["transaction_count"] for m in whole["member_details"]}, {"Alice": 1, "Bob": 1})
+
+        january_utc = self.analysis("?period=month&at=2024-01-15")
+        self.assertEqual(january_utc["balances"], {"Alice": 500.0, "Bob": -500.0})
+        january_india = self.analysis("?period=month&at=2024-01-15&tz=Asia/Kolkata")
+        self.assertEqual(january_india["balances"], {"Alice": 0.0, "Bob": 0.0})
+        february_india = self.analysis("?period=month&at=2024-02-15&tz=Asia/Kolkata")
+        self.assertEqual(february_india["balances"], whole["balances"])
+        self.assertEqual(february_india["stats"]["month"], "February 2024")
+
+        trip = self.analysis("?start=2024-01-31&end=2024-02-01")
+        self.assertEqual((trip["period"]["kind"], trip["stats"]["total_spend"]), ("range", 1400.0))
+
+    def test_ledger_and_raw_totals_agree(self):
+        self.add_trip()
+        month = calendar_month(date(2024, 2, 1), UTC)
+        raw = period_financials(self.group.id, date_range(date(2024, 2, 1), date(2024, 2, 29), KOLKATA))
+        # Month starts in the server's zone are read from the ledger.
+        with self.assertNumQueries(3):
+            stored = period_financials(self.group.id, month)
+        self.assertEqual(stored["balances"], {self.alice: -200, self.bob: 200})
+        paid, consumed = range_totals(self.group.id, month.start, month.end)
+        self.assertEqual((paid[self.bob.id], consumed[self.alice.id]), (400, 200))
+        self.assertEqual(raw["total_spend"], 1400.0)
+
+    def test_week_alerts_use_period_wording(self):
+        self.group.min_floor = 100
+        self.group.save()
+        self.add_expense(self.alice, 1000, datetime(2024, 3, 5, 12, 0, tzinfo=dt_timezone.utc), self.bob)
+        analysis = get_unified_fairness_analysis(self.group.id, iso_week(date(2024, 3, 6), UTC))
+        self.assertEqual(analysis["stats"]["month"], "Week 10, 2024")
+        self.assertIn("Bob", analysis["alerts"][0]["message"])
+        self.assertIn("hit the weekly limit", analysis["alerts"][0]["message"])
+
+    def test_closed_periods_survive_new_expenses(self):
+        self.add_trip()
+        query = "?period=month&at=2024-02-01&tz=Asia/Kolkata"
+        first = self.analysis(query)
+
+        # Today's expense bumps the group version but not the closed period.
+        self.add_expense(self.bob, 50, None, self.alice)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.analysis(query), first)
+
+    def test_editing_old_expenses_invalidates_closed_periods(self):
+        self.add_trip()
+        query = "?period=month&at=2024-02-01&tz=Asia/Kolkata"
+        self.assertEqual(self.analysis(query)["balances"]["Alice"], 300.0)
+
+        old = Expense.objects.get(amount=400)
+        with self.captureOnCommitCallbacks(execute=True):
+            old.status = "REJECTED"
+            old.save()
+        self.assertEqual(self.analysis(query)["balances"]["Alice"], 500.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bob.name = "Robert"
+            self.bob.save()
+        self.assertIn("Robert", self.analysis(query)["balances"])
+
+    def test_bad_parameters(self):
+        for query in ("?period=fortnight", "?tz=Nowhere/Special", "?start=2024-02-01&end=2024-01-01"):
+            response = self.client.get(f"/groups/{self.group.id}/analysis{query}", user=self.alice)
+            self.assertEqual(response.status_code, 400, query)
+
+    def test_response_cache_follows_the_local_date(self):
+        self.add_expense(self.alice, 100, datetime(2024, 3, 5, 12, 0, tzinfo=dt_timezone.utc), self.bob)
+        with mock.patch("django.utils.timezone.now", return_value=datetime(2024, 3, 6, 12, tzinfo=dt_timezone.utc)):
+            self.assertEqual(self.analysis("?period=week")["stats"]["month"], "Week 10, 2024")
+            self.assertEqual(self.analysis("?period=week&tz=Pacific/Kiritimati")["stats"]["month"], "Week 10, 2024")
+        # Same server month, a week later: not the cached answer for last week.
+        with mock.patch("django.utils.timezone.now", return_value=datetime(2024, 3, 13, 12, tzinfo=dt_timezone.utc)):
+            week = self.analysis("?period=week")
+        self.assertEqual((week["stats"]["month"], week["stats"]["total_spend"]), ("Week 11, 2024", 0.0))
+        # 23:00 UTC on a Sunday is already Monday, the next week, at UTC+14.
+        with mock.patch("django.utils.timezone.now", return_value=datetime(2024, 3, 10, 23, tzinfo=dt_timezone.utc)):
+            self.assertEqual(self.analysis("?period=week&tz=Pacific/Kiritimati")["stats"]["month"], "Week 11, 2024")
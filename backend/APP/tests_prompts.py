@@ -0,0 +1,82 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from . import prompts
+from .models import Expense, ExpenseSplit, Group, GroupMember, User
+
+
+class PromptContextTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.me = User.objects.create(name="Me", clerk_user_id="prompt1")
+        self.bob = User.objects.create(name="Bob", clerk_user_id="prompt2")
+        self.carol = User.objects.create(name="Carol", clerk_user_id="prompt3")
+        self.group = Group.objects.create(name="Flat", type="LONG", owner=self.me)
+        for user in (self.me, self.bob, self.carol):
+            GroupMember.objects.create(group=self.group, user=user)
+
+    def add_expense(self, payer, amount, owed):
+        with self.captureOnCommitCallbacks(execute=True):
+            expense = Expense.objects.create(
+                group=self.group, payer=payer, amount=amount, description="Rent", category="BILLS"
+            )
+            for user, value in owed.items():
+                ExpenseSplit.objects.create(expense=expense, user=user, owed_amount=value)
+
+    def test_context_is_cached_per_group_version(self):
+        self.add_expense(self.bob, 90, {self.me: 60, self.bob: 30})
+        context = prompts.group_context(self.group.id)
+        self.assertEqual(context.members, ("Me", "Bob", "Carol"))
+        # Largest balances first; Carol is settled and left out.
+        self.assertEqual(context.balances, (("Bob", "+60.00"), ("Me", "-60.00")))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(prompts.group_context(self.group.id), context)
+
+        self.add_expense(self.carol, 30, {self.carol: 30})
+        self.add_expense(self.me, 40, {self.carol: 40})
+        self.assertEqual(
+            prompts.group_context(self.group.id).balances, (("Bob", "+60.00"), ("Carol", "-40.00"), ("Me", "-20.00"))
+        )
+
+    def test_prompts_share_a_stable_prefix(self):
+        context = prompts.group_context(self.group.id)
+        first = prompts.expense_prompt("pizza 300", "Me", context)
+        second = prompts.expense_prompt("cab 120 with Bob", "Bob", context)
+        self.assertTrue(first.startswith(prompts.EXPENSE_INSTRUCTIONS + "\n\nMembers: Me, Bob, Carol"))
+        self.assertEqual(first.split("Current user")[0], second.split("Current user")[0])
+        self.assertTrue(first.endswith('Input: "pizza 300"'))
+        self.assertIn("Balances: all settled", first)
+
+    def test_metrics_recorded(self):
+        context = prompts.group_context(self.group.id)
+        before = prompts.PROMPT_TOKENS.count(kind="batch"), prompts.PROMPT_BUILD.count(kind="batch")
+        prompts.batch_prompt([(1, "taxi 300"), (2, "hotel 3000")], "Me", context)
+        after = prompts.PROMPT_TOKENS.count(kind="batch"), prompts.PROMPT_BUILD.count(kind="batch")
+        self.assertEqual(after, (before[0] + 1, before[1] + 1))
+
+
+class PromptBudgetTest(TestCase):
+    def test_large_context_is_trimmed_to_budget(self):
+        names = tuple(f"Member Number {i}" for i in range(400))
+        context = prompts.GroupContext(
+            members=names,
+            balances=tuple((name, f"{400 - i:+.2f}") for i, name in enumerate(names)),
+        )
+        with override_settings(AI_PROMPT_TOKEN_BUDGET=1000):
+            prompt = prompts.expense_prompt("x" * 10000, "Member Number 399", context)
+        self.assertLessEqual(prompts.estimate_tokens(prompt), 1000)
+        members_line = next(line for line in prompt.splitlines() if line.startswith("Members:"))
+        balances_line = next(line for line in prompt.splitlines() if line.startswith("Balances: Member"))
+        self.assertIn("Member Number 399", members_line)
+        self.assertRegex(members_line, r"\(\+\d+ more\)$")
+        # The current user's balance is kept, then the largest ones.
+        self.assertTrue(balances_line.startswith("Balances: Member Number 399 +1.00, Member Number 0 +400.00"))
+        self.assertRegex(balances_line, r"\(\+\d+ smaller\)$")
+        self.assertIn("…", prompt)
+
+    def test_small_context_is_untouched(self):
+        context = prompts.GroupContext(members=("Me", "Bob"), balances=(("Bob", "+5.00"), ("Me", "-5.00")))
+        prompt = prompts.receipt_prompt("Me", context, "dinner")
+        self.assertIn("Members: Me, Bob\nBalances: Bob +5.00, Me -5.00\nCurrent user: Me", prompt)
+        self.assertTrue(prompt.endswith("Additional context: dinner"))
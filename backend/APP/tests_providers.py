@@ -0,0 +1,80 @@
+import json
+import subprocess
+import sys
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from ninja.testing import TestAsyncClient
+
+from . import aicache, ai_providers
+from .api import api
+from .models import Expense, Group, GroupMember, User
+from .prompts import GroupContext, batch_prompt, expense_prompt, receipt_prompt
+
+
+class LazyImportTest(SimpleTestCase):
+    def test_loading_the_app_skips_gemini_and_pillow(self):
+        code = (
+            "import os, sys\n"
+            f"os.environ.setdefault('DJANGO_SETTINGS_MODULE', {settings.SETTINGS_MODULE!r})\n"
+            "import django; django.setup()\n"
+            "import APP.api, APP.services\n"
+            "print(','.join(sorted(m for m in ('google.generativeai', 'PIL') if m in sys.modules)))\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        )
+        self.assertEqual(result.stdout.strip(), "")
+
+
+class StubProviderTest(SimpleTestCase):
+    context = GroupContext(members=("Me", "Bob"), balances=())
+
+    def test_answers_are_deterministic(self):
+        stub = ai_providers.StubProvider(latency=0)
+        prompt = expense_prompt("I paid 300 for pizza split with Bob", "Me", self.context)
+        first = json.loads(stub.parse_text(prompt))
+        self.assertEqual(first, json.loads(stub.parse_text(prompt)))
+        self.assertEqual((first["amount"], first["payer_name"], first["category"]), (300, "Me", "Food"))
+
+        guess = json.loads(stub.parse_text(expense_prompt("random thing 42", "Bob", self.context)))
+        self.assertEqual((guess["amount"], guess["payer_name"]), (42, "Bob"))
+
+    def test_batch_and_receipt(self):
+        stub = ai_providers.StubProvider(latency=0)
+        items = json.loads(stub.parse_text(batch_prompt([(1, "taxi 300"), (2, "hotel 3000")], "Me", self.context)))
+        self.assertEqual([(item["line"], item["amount"]) for item in items], [(1, 300), (2, 3000)])
+
+        image = {"mime_type": "image/jpeg", "data": b"\xff\xd8receipt"}
+        receipt = json.loads(stub.parse_image(receipt_prompt("Me", self.context), image))
+        self.assertEqual(receipt, json.loads(stub.parse_image(receipt_prompt("Me", self.context), image)))
+        self.assertEqual(receipt["payer_name"], "Me")
+
+    def test_provider_lookup(self):
+        self.assertIsInstance(ai_providers.get_provider("stub"), ai_providers.StubProvider)
+        self.assertIs(ai_providers.get_provider("stub"), ai_providers.get_provider("stub"))
+        self.assertIsInstance(
+            ai_providers.get_provider("APP.ai_providers.GeminiProvider"), ai_providers.GeminiProvider
+        )
+
+
+@override_settings(AI_PROVIDER="stub", AI_STUB_LATENCY=0, QUICKPARSE_ENABLED=False)
+class StubEndpointTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        aicache.parse_cache.clear()
+        self.user = User.objects.create(name="Me", clerk_user_id="stub1")
+        self.bob = User.objects.create(name="Bob", clerk_user_id="stub2")
+        self.group = Group.objects.create(name="Trip", type="SHORT", owner=self.user)
+        GroupMember.objects.create(group=self.group, user=self.user)
+        GroupMember.objects.create(group=self.group, user=self.bob)
+
+    def test_text_endpoint_uses_stub(self):
+        response = async_to_sync(TestAsyncClient(api).post)(
+            f"/groups/{self.group.id}/expenses/ai", json={"text_input": "Bob paid 600 for dinner"}, user=self.user
+        )
+        self.assertEqual(response.status_code, 200, response.json())
+        expense = Expense.objects.get()
+        self.assertEqual((expense.payer, expense.amount, expense.category), (self.bob, 600, "Food"))
@@ -0,0 +1,90 @@
+import json
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from . import aicache, services
+from .ai_providers import GeminiProvider
+from .models import Group, GroupMember, User
+from .quickparse import evaluate, load_corpus, quick_parse
+
+MEMBERS = ["Tanishq Chavan", "Rahul Mehta", "Amit Shah", "Priya"]
+
+
+class QuickParseTest(SimpleTestCase):
+    def parse(self, text, members=MEMBERS):
+        return quick_parse(text, members, "Tanishq Chavan")
+
+    def test_corpus(self):
+        report = evaluate(load_corpus(), min_confidence=0.8)
+        self.assertEqual(report["wrong"], [])
+        self.assertGreaterEqual(report["recall"], 0.9)
+
+    def test_same_shape_as_model(self):
+        result = self.parse("I paid 450 for pizza split with Rahul and Amit")
+        self.assertEqual(result.parsed, {
+            "description": "Pizza",
+            "amount": 450.0,
+            "payer_name": "Tanishq Chavan",
+            "splits": [
+                {"user_name": "Tanishq Chavan", "amount": 150.0},
+                {"user_name": "Rahul Mehta", "amount": 150.0},
+                {"user_name": "Amit Shah", "amount": 150.0},
+            ],
+            "category": "Food",
+        })
+        self.assertEqual(result.confidence, 1.0)
+
+    def test_splits_add_up_to_amount(self):
+        splits = self.parse("Paid 100 for chai split all").parsed["splits"]
+        self.assertEqual(sum(Decimal(str(s["amount"])) for s in splits), Decimal("100"))
+        self.assertEqual(splits[0], {"user_name": "Tanishq Chavan", "amount": 25.0})
+
+        splits = self.parse("Paid 100 for chai split with Rahul and Amit").parsed["splits"]
+        self.assertEqual([s["amount"] for s in splits], [33.34, 33.33, 33.33])
+
+    def test_shared_first_name_needs_full_name(self):
+        members = MEMBERS + ["Rahul Verma"]
+        self.assertIsNone(self.parse("Uber 250 with Rahul", members).parsed)
+        result = self.parse("Uber 250 with Rahul Verma", members)
+        self.assertEqual([s["user_name"] for s in result.parsed["splits"]], ["Tanishq Chavan", "Rahul Verma"])
+
+    def test_payer_outside_the_group_is_left_to_the_model(self):
+        for text in ("Bob paid 500 for dinner", "dinner 1200 paid by Karan", "Neha bought pizza for 600",
+                     "dinner 1200 Bob paid"):
+            self.assertEqual(self.parse(text), (None, 0.0, "unknown payer"), text)
+        self.assertEqual(self.parse("Rahul paid 500 for dinner").parsed["payer_name"], "Rahul Mehta")
+        self.assertEqual(self.parse("paid by card 300 for cab").parsed["payer_name"], "Tanishq Chavan")
+
+    def test_defaults_lower_confidence(self):
+        self.assertLess(self.parse("450 pizza").confidence, 1.0)
+        self.assertLess(self.parse("paid 500").confidence, 0.8)
+
+
+@override_settings(QUICKPARSE_ENABLED=True, QUICKPARSE_MIN_CONFIDENCE=0.8)
+class QuickParseFallbackTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(name="Me", clerk_user_id="quick1")
+        self.friend = User.objects.create(name="Rahul", clerk_user_id="quick2")
+        self.group = Group.objects.create(name="Home", type="LONG", owner=self.user)
+        GroupMember.objects.create(group=self.group, user=self.user)
+        GroupMember.objects.create(group=self.group, user=self.friend)
+        aicache.parse_cache.clear()
+        cache.clear()
+
+    def test_simple_text_skips_the_model(self):
+        with mock.patch.object(services, "get_provider") as get_provider:
+            parsed = services.parse_expense_with_ai("I paid 300 for chai with Rahul", self.group.id, "Me")
+        get_provider.assert_not_called()
+        self.assertEqual(parsed["payer_name"], "Me")
+        self.assertEqual(len(parsed["splits"]), 2)
+
+    def test_unclear_text_goes_to_the_model(self):
+        model = mock.Mock()
+        model.generate_content.return_value = mock.Mock(text=json.dumps({"amount": 1}))
+        with mock.patch.object(services, "get_provider", return_value=GeminiProvider(model=model)):
+            parsed = services.parse_expense_with_ai("I paid back all my debts", self.group.id, "Me")
+        model.generate_content.assert_called_once()
+        self.assertEqual(parsed, {"amount": 1})
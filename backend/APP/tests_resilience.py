@@ -0,0 +1,177 @@
+import asyncio
+import time
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from ninja.testing import TestAsyncClient
+
+from . import aicache, resilience, services
+from .ai_providers import AIProvider
+from .api import api
+from .metrics import render_prometheus
+from .models import Expense, Group, GroupMember, User
+from .resilience import AITimeout, AIUnavailable, CircuitBreaker
+
+
+class ScriptedProvider(AIProvider):
+    """Plays back a script of outcomes: seconds to wait, or an exception to raise."""
+
+    name = "scripted"
+
+    def __init__(self, *script, answer='{"amount": 1}'):
+        self.script = list(script)
+        self.answer = answer
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        return self.script.pop(0) if self.script else 0
+
+    def parse_text(self, prompt, timeout=None):
+        step = self._next()
+        if isinstance(step, Exception):
+            raise step
+        if timeout is not None and step > timeout:
+            raise TimeoutError("slow")
+        time.sleep(step)
+        return self.answer
+
+    async def aparse_text(self, prompt):
+        step = self._next()
+        if isinstance(step, Exception):
+            raise step
+        await asyncio.sleep(step)
+        return self.answer
+
+
+class ServiceUnavailable(Exception):
+    """Named like google.api_core's 503 error."""
+
+
+@override_settings(AI_RETRIES=2, AI_RETRY_BACKOFF=0, AI_TIMEOUT_SECONDS=1, AI_BREAKER_MIN_CALLS=100)
+class RetryTest(SimpleTestCase):
+    def generate(self, provider):
+        with mock.patch.object(services, "get_provider", return_value=provider):
+            return services.generate("prompt")
+
+    def agenerate(self, provider):
+        with mock.patch.object(services, "get_provider", return_value=provider):
+            return async_to_sync(services.agenerate)("prompt")
+
+    def test_transient_errors_are_retried(self):
+        provider = ScriptedProvider(ConnectionError("reset"), ServiceUnavailable("503"))
+        self.assertEqual(self.generate(provider), '{"amount": 1}')
+        self.assertEqual(provider.calls, 3)
+
+        provider = ScriptedProvider(ConnectionError("reset"))
+        self.assertEqual(self.agenerate(provider), '{"amount": 1}')
+        self.assertEqual(provider.calls, 2)
+
+    def test_other_errors_and_exhausted_retries_raise(self):
+        provider = ScriptedProvider(ValueError("bad request"))
+        with self.assertRaises(ValueError):
+            self.generate(provider)
+        self.assertEqual(provider.calls, 1)
+
+        provider = ScriptedProvider(*[ConnectionError("reset")] * 3)
+        with self.assertRaises(AIUnavailable):
+            self.agenerate(provider)
+        self.assertEqual(provider.calls, 3)
+
+    @override_settings(AI_TIMEOUT_SECONDS=0.1)
+    def test_deadline_covers_all_attempts(self):
+        for call in (self.generate, self.agenerate):
+            provider = ScriptedProvider(5, 5, 5)
+            start = time.monotonic()
+            with self.assertRaises(AITimeout):
+                call(provider)
+            self.assertLess(time.monotonic() - start, 1)
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    def setUp(self):
+        self.now = 0
+        self.breaker = CircuitBreaker(
+            "test", threshold=0.5, min_calls=4, window=10, reset_after=30, clock=lambda: self.now
+        )
+
+    def test_opens_on_error_rate_and_recovers(self):
+        for ok in (True, False, True):
+            self.breaker.before_call()
+            self.breaker.record(ok)
+        self.assertEqual(self.breaker.state, resilience.CLOSED)
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, resilience.OPEN)
+        with self.assertRaises(AIUnavailable):
+            self.breaker.before_call()
+
+        self.now = 30
+        self.assertEqual(self.breaker.state, resilience.HALF_OPEN)
+        probe = self.breaker.before_call()
+        self.assertTrue(probe)
+        with self.assertRaises(AIUnavailable):
+            self.breaker.before_call()  # only one trial call at a time
+        self.breaker.record(False, probe)
+        self.assertEqual(self.breaker.state, resilience.OPEN)
+
+        self.now = 60
+        probe = self.breaker.before_call()
+        self.breaker.record(True, probe)
+        self.assertEqual(self.breaker.state, resilience.CLOSED)
+
+
+@override_settings(
+    AI_RETRIES=0, AI_BREAKER_MIN_CALLS=2, AI_BREAKER_THRESHOLD=0.5, AI_BREAKER_RESET_SECONDS=60,
+    QUICKPARSE_ENABLED=True, QUICKPARSE_MIN_CONFIDENCE=0.8,
+)
+class FallbackTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        aicache.parse_cache.clear()
+        self.user = User.objects.create(name="Me", clerk_user_id="res1")
+        self.bob = User.objects.create(name="Bob", clerk_user_id="res2")
+        self.group = Group.objects.create(name="Trip", type="SHORT", owner=self.user)
+        GroupMember.objects.create(group=self.group, user=self.user)
+        GroupMember.objects.create(group=self.group, user=self.bob)
+        self.provider = ScriptedProvider(*[ServiceUnavailable("503")] * 2)
+
+    def post(self, text):
+        with mock.patch.object(services, "get_provider", return_value=self.provider):
+            return async_to_sync(TestAsyncClient(api).post)(
+                f"/groups/{self.group.id}/expenses/ai", json={"text_input": text}, user=self.user
+            )
+
+    def test_open_breaker_fails_fast_and_falls_back(self):
+        # Too vague to fall back on: the outage is reported, nothing is created.
+        for text in ("received 400", "Bob paid me 500"):
+            response = self.post(text)
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response["Retry-After"], "60")
+        self.assertEqual(self.provider.calls, 2)
+        self.assertEqual(resilience.breaker_for(self.provider).state, resilience.OPEN)
+        self.assertIn('spendsplit_ai_breaker_state{breaker="scripted"} 2', render_prometheus())
+        self.assertEqual(Expense.objects.count(), 0)
+
+        # The local parser still answers what it is sure of.
+        self.assertEqual(self.post("I paid 300 for pizza split with Bob").status_code, 200)
+        # Nothing local to fall back on: 503 without calling the provider.
+        response = self.post("settle what I owe Bob")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.provider.calls, 2)
+        self.assertEqual(Expense.objects.count(), 1)
+
+    def test_fallback_needs_the_fast_path_confidence(self):
+        confident = services.local_fallback("Bob paid 120 for a cab", self.group.id, "Me")
+        self.assertEqual(confident["amount"], 120)
+        self.assertIsNone(services.local_fallback("received 400", self.group.id, "Me"))
+        with override_settings(QUICKPARSE_MIN_CONFIDENCE=0.5):
+            self.assertEqual(services.local_fallback("received 400", self.group.id, "Me")["amount"], 400)
+
+    def test_non_member_payer_is_not_saved_as_the_requester(self):
+        for text in ("Carol paid 500 for dinner", "Bob paid me 500"):
+            response = self.post(text)
+            self.assertEqual(response.status_code, 503, text)
+        self.assertIsNone(services.local_fallback("Carol paid 500 for dinner", self.group.id, "Me"))
+        self.assertFalse(Expense.objects.exists())
@@ -0,0 +1,71 @@
+import random
+from datetime import datetime, timezone as dt_timezone
+from django.test import TestCase
+from ninja.testing import TestClient
+from .api import api
+from .models import User, Group, Expense, ExpenseSplit, GroupMember
+from .settlements import simplify_debts
+
+
+class SimplifyDebtsTest(TestCase):
+    def test_settles_everyone(self):
+        rng = random.Random(7)
+        for _ in range(50):
+            balances = {i: rng.randint(-50000, 50000) / 100 for i in range(31)}
+            balances[31] = -round(sum(balances.values()), 2)
+
+            transfers = simplify_debts(balances)
+            remaining = {k: round(v * 100) for k, v in balances.items()}
+            for debtor, creditor, cents in transfers:
+                self.assertGreater(cents, 0)
+                remaining[debtor] += cents
+                remaining[creditor] -= cents
+
+            self.assertTrue(all(v == 0 for v in remaining.values()))
+            self.assertLessEqual(len(transfers), sum(1 for v in balances.values() if v) - 1)
+
+    def test_single_debtor_pays_each_creditor_once(self):
+        transfers = simplify_debts({"a": 30, "b": 20, "c": -50, "d": 0})
+        self.assertEqual(transfers, [("c", "a", 3000), ("c", "b", 2000)])
+
+
+class SettlementsEndpointTest(TestCase):
+    def test_endpoint(self):
+        alice = User.objects.create(name="Alice", clerk_user_id="settle1")
+        bob = User.objects.create(name="Bob", clerk_user_id="settle2")
+        group = Group.objects.create(name="Trip", type="SHORT", owner=alice)
+        GroupMember.objects.create(group=group, user=alice)
+        GroupMember.objects.create(group=group, user=bob)
+        expense = Expense.objects.create(group=group, payer=alice, amount=100, description="Fuel", category="TRANSPORTATION")
+        ExpenseSplit.objects.create(expense=expense, user=alice, owed_amount=50)
+        ExpenseSplit.objects.create(expense=expense, user=bob, owed_amount=50)
+
+        response = TestClient(api).get(f"/groups/{group.id}/settlements", user=bob)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{
+            "from_user": {"name": "Bob", "id": bob.id},
+            "to_user": {"name": "Alice", "id": alice.id},
+            "amount": 50.0,
+        }])
+
+    def test_follows_the_analysis_period(self):
+        alice = User.objects.create(name="Alice", clerk_user_id="settle3")
+        bob = User.objects.create(name="Bob", clerk_user_id="settle4")
+        group = Group.objects.create(name="Trip", type="SHORT", owner=alice)
+        GroupMember.objects.create(group=group, user=alice)
+        GroupMember.objects.create(group=group, user=bob)
+        for payer, other, amount, day in ((alice, bob, 100, 31), (bob, alice, 40, 1)):
+            expense = Expense.objects.create(group=group, payer=payer, amount=amount, description="Trip", category="FOOD")
+            expense.created_at = datetime(2024, 1 if day == 31 else 2, day, 12, tzinfo=dt_timezone.utc)
+            expense.save()
+            ExpenseSplit.objects.create(expense=expense, user=payer, owed_amount=amount / 2)
+            ExpenseSplit.objects.create(expense=expense, user=other, owed_amount=amount / 2)
+
+        client = TestClient(api)
+        # A trip is settled as a whole by default, like its analysis.
+        whole = client.get(f"/groups/{group.id}/settlements", user=bob).json()
+        self.assertEqual([(t["from_user"]["name"], t["amount"]) for t in whole], [("Bob", 30.0)])
+        february = client.get(f"/groups/{group.id}/settlements?period=month&at=2024-02-10", user=bob).json()
+        self.assertEqual([(t["from_user"]["name"], t["amount"]) for t in february], [("Alice", 20.0)])
+        response = client.get(f"/groups/{group.id}/settlements?tz=Nowhere/Special", user=bob)
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,151 @@
+from datetime import date, datetime
+from importlib import import_module
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase
+from django.utils import timezone
+from ninja.testing import TestClient
+from .api import api
+from .models import User, Group, Expense, GroupMember, MonthlyCategorySpend
+from .importer import read_rows
+from .rollups import verify_rollups
+from .services import import_expenses
+
+
+def at(year, month, day=15):
+    return timezone.make_aware(datetime(year, month, day, 12))
+
+
+class SpendRollupTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create(name="Alice", clerk_user_id="stats1")
+        self.bob = User.objects.create(name="Bob", clerk_user_id="stats2")
+        self.group = Group.objects.create(name="Flat", type="LONG", owner=self.alice)
+        GroupMember.objects.create(group=self.group, user=self.alice)
+        GroupMember.objects.create(group=self.group, user=self.bob)
+        self.client = TestClient(api)
+
+    def add_expense(self, payer, amount, category="FOOD", when=None, status="APPROVED"):
+        expense = Expense.objects.create(
+            group=self.group, payer=payer, amount=amount, description="Thing", category=category, status=status
+        )
+        if when is not None:
+            expense.created_at = when
+            expense.save()
+        return expense
+
+    def stats(self, query=""):
+        response = self.client.get(f"/groups/{self.group.id}/stats{query}", user=self.alice)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_tracks_creates_edits_and_deletes(self):
+        groceries = self.add_expense(self.alice, 100, when=at(2024, 1))
+        self.add_expense(self.bob, 40, category="BILLS", when=at(2024, 1))
+        self.add_expense(self.bob, 500, status="PENDING", when=at(2024, 2))
+        self.assertEqual(verify_rollups(), [])
+
+        groceries.category = "ENTERTAINMENT"
+        groceries.amount = 120
+        groceries.save()
+        self.assertEqual(verify_rollups(), [])
+
+        groceries.status = "REJECTED"
+        groceries.created_at = at(2024, 3)
+        groceries.save()
+        self.assertEqual(verify_rollups(), [])
+
+        groceries.delete()
+        self.assertEqual(verify_rollups(), [])
+        self.assertFalse(MonthlyCategorySpend.objects.filter(category="ENTERTAINMENT", count__gt=0).exists())
+
+    def test_bulk_import_updates_rollups(self):
+        csv = "date,description,amount,payer,category\n" + "".join(
+            f"2024-0{n % 3 + 1}-10,Row {n},30,Bob,Food\n" for n in range(9)
+        )
+        created, errors = import_expenses(self.group.id, read_rows(csv, "history.csv"))
+        self.assertEqual((created, errors), (9, []))
+        self.assertEqual(verify_rollups(), [])
+        self.assertEqual(MonthlyCategorySpend.objects.filter(group=self.group).count(), 3)
+
+    def test_stats_break_down_months_categories_and_members(self):
+        self.add_expense(self.alice, 100, when=at(2024, 1))
+        self.add_expense(self.bob, 60, category="Food", when=at(2024, 1))
+        self.add_expense(self.bob, 40, category="BILLS", when=at(2024, 3))
+        self.add_expense(self.bob, 999, status="REJECTED", when=at(2024, 3))
+        self.add_expense(self.alice, 70, when=at(2024, 5))
+
+        stats = self.stats("?from=2024-01&to=2024-04")
+        self.assertEqual((stats["from"], stats["to"], stats["total"]), ("2024-01", "2024-04", 200.0))
+        self.assertEqual([m["month"] for m in stats["months"]], ["2024-01", "2024-02", "2024-03", "2024-04"])
+        january, february, march, _ = stats["months"]
+        # Code and label spellings of a category are merged.
+        self.assertEqual(january["categories"], {"Food": {"count": 2, "total": 160.0}})
+        self.assertEqual((february["total"], february["change"]), (0.0, -160.0))
+        self.assertEqual((march["count"], march["total"], march["change"]), (1, 40.0, 40.0))
+        self.assertIsNone(january["change"])
+        self.assertEqual(stats["categories"], [
+            {"category": "Food", "count": 2, "total": 160.0, "share": 0.8},
+            {"category": "Bills", "count": 1, "total": 40.0, "share": 0.2},
+        ])
+        self.assertEqual(stats["members"], [
+            {"id": self.alice.id, "name": "Alice", "count": 1, "total": 100.0, "share": 0.5},
+            {"id": self.bob.id, "name": "Bob", "count": 2, "total": 100.0, "share": 0.5},
+        ])
+
+    def test_stats_reads_do_not_grow_with_expenses(self):
+        for n in range(30):
+            self.add_expense(self.alice if n % 2 else self.bob, 10, when=at(2024, n % 12 + 1))
+        # Membership check, two rollup aggregates and the member list.
+        with self.assertNumQueries(4):
+            stats = self.stats("?from=2024-01&to=2024-12")
+        self.assertEqual(stats["total"], 300.0)
+
+    def test_defaults_to_last_six_months(self):
+        self.add_expense(self.alice, 25)
+        stats = self.stats()
+        self.assertEqual(len(stats["months"]), 6)
+        self.assertEqual(stats["to"], f"{timezone.localtime():%Y-%m}")
+        self.assertEqual(stats["months"][-1]["total"], 25.0)
+
+    def test_rejects_bad_ranges(self):
+        for query in ("?from=2024-13", "?from=2024-05&to=2024-01", "?from=2000-01&to=2024-01", "?to=soon"):
+            response = self.client.get(f"/groups/{self.group.id}/stats{query}", user=self.alice)
+            self.assertEqual(response.status_code, 400, query)
+
+    def test_analysis_counts_transactions_from_rollups(self):
+        self.add_expense(self.alice, 10)
+        self.add_expense(self.alice, 20, status="PENDING")
+        self.add_expense(self.bob, 30, when=at(2020, 1))
+        response = self.client.get(f"/groups/{self.group.id}/analysis", user=self.alice)
+        counts = {m["name"]: m["transaction_count"] for m in response.json()["member_details"]}
+        self.assertEqual(counts, {"Alice": 2, "Bob": 0})
+
+    def test_rebuild_command(self):
+        self.add_expense(self.alice, 100, when=at(2024, 1))
+        MonthlyCategorySpend.objects.update(total=1)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_rollups", "--verify", stdout=StringIO())
+
+        out = StringIO()
+        call_command("rebuild_rollups", "--group", str(self.group.id), stdout=out)
+        self.assertIn("rebuilt 1 rollup rows", out.getvalue())
+        row = MonthlyCategorySpend.objects.get()
+        self.assertEqual((row.month, row.count, row.total), (date(2024, 1, 1), 1, 100))
+        call_command("rebuild_rollups", "--verify", stdout=StringIO())
+
+    def test_migration_backfills_existing_expenses(self):
+        self.add_expense(self.alice, 100, when=at(2024, 1))
+        self.add_expense(self.bob, 40, category="BILLS", when=at(2024, 2))
+        MonthlyCategorySpend.objects.all().delete()
+
+        migration = import_module("APP.migrations.0017_monthlycategoryspend")
+        state = MigrationExecutor(connection).loader.project_state(("APP", "0017_monthlycategoryspend"))
+        migration.backfill_rollups(state.apps, None)
+        self.assertEqual(verify_rollups(), [])
+        self.assertEqual(self.stats("?from=2024-01&to=2024-02")["total"], 140.0)
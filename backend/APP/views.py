@@ -1,3 +1,22 @@
-from django.shortcuts import render
+import hmac
 
-# Create your views here.
+from django.conf import settings
+from django.http import HttpResponse
+
+from .metrics import render_prometheus
+
+
+def metrics(request):
+    """Prometheus scrape endpoint.
+
+    Requires ``Bearer METRICS_TOKEN``. With no token configured it is hidden
+    (404) unless ``METRICS_PUBLIC`` opens it on purpose.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        supplied = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(supplied, token):
+            return HttpResponse(status=401)
+    elif not settings.METRICS_PUBLIC:
+        return HttpResponse(status=404)
+    return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -72,6 +72,9 @@ INSTALLED_APPS = [
 # Middleware (ORDER IS CRITICAL)
 # -------------------------------------------------------------------
 MIDDLEWARE = [
+    # Outermost so Server-Timing covers every stage below it
+    "APP.middleware.ServerTimingMiddleware",
+
     "django.middleware.security.SecurityMiddleware",
 
     # 👇 MUST be before CommonMiddleware
@@ -107,6 +110,9 @@ CORS_ALLOW_HEADERS = list(default_headers) + [
 
 CORS_ALLOW_CREDENTIALS = True
 
+# The frontend names downloaded exports after the server's filename.
+CORS_EXPOSE_HEADERS = ["Content-Disposition"]
+
 # -------------------------------------------------------------------
 # URLs / WSGI
 # -------------------------------------------------------------------
@@ -213,14 +219,123 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Third-party keys
 # -------------------------------------------------------------------
 CLERK_SECRET_KEY = os.getenv("CLERK_SECRET_KEY")
+
+# Session tokens are verified locally against Clerk's JWKS ("local") or by
+# calling Clerk on every request ("remote"). In local mode the remote call is
+# only used when the JWKS cannot be fetched or lacks the token's key.
+CLERK_AUTH_MODE = os.getenv("CLERK_AUTH_MODE", "local")
+CLERK_AUTH_REMOTE_FALLBACK = _env_bool("CLERK_AUTH_REMOTE_FALLBACK", default=True)
+CLERK_JWKS_URL = os.getenv("CLERK_JWKS_URL", "https://api.clerk.com/v1/jwks")
+CLERK_JWKS_TTL = int(os.getenv("CLERK_JWKS_TTL", "3600"))
+CLERK_JWT_ISSUER = os.getenv("CLERK_JWT_ISSUER") or None
+CLERK_AUTHORIZED_PARTIES = _env_csv("CLERK_AUTHORIZED_PARTIES")
+
+# Synced Clerk profiles are reused for this long before Clerk is asked again
+# (sooner if the token's `updated_at` claim changes).
+CLERK_PROFILE_CACHE_TTL = int(os.getenv("CLERK_PROFILE_CACHE_TTL", "300"))
+CLERK_PROFILE_CACHE_SIZE = int(os.getenv("CLERK_PROFILE_CACHE_SIZE", "2048"))
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+# AI backend (APP/ai_providers.py): "gemini", or "stub" for deterministic
+# local answers in tests and load tests (each after AI_STUB_LATENCY seconds,
+# failing AI_STUB_ERROR_RATE of the time). A dotted path to an AIProvider
+# subclass also works.
+AI_PROVIDER = os.getenv("AI_PROVIDER", "gemini")
+AI_STUB_LATENCY = float(os.getenv("AI_STUB_LATENCY", "0"))
+AI_STUB_ERROR_RATE = float(os.getenv("AI_STUB_ERROR_RATE", "0"))
+
+# Async AI endpoints: at most AI_MAX_CONCURRENCY Gemini calls in flight per
+# event loop (one per ASGI worker). A call that has not finished, including
+# time spent waiting for a slot, after AI_TIMEOUT_SECONDS is abandoned.
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "64"))
+AI_TIMEOUT_SECONDS = float(os.getenv("AI_TIMEOUT_SECONDS", "30"))
+
+# Within that deadline, transient failures (timeouts, 429s, 5xx) are retried
+# AI_RETRIES times with jittered exponential backoff from AI_RETRY_BACKOFF
+# seconds. Once AI_BREAKER_THRESHOLD of the last AI_BREAKER_WINDOW attempts
+# (at least AI_BREAKER_MIN_CALLS) failed, calls fail fast (or fall back to
+# the local parser) for AI_BREAKER_RESET_SECONDS before one is tried again.
+AI_RETRIES = int(os.getenv("AI_RETRIES", "2"))
+AI_RETRY_BACKOFF = float(os.getenv("AI_RETRY_BACKOFF", "0.5"))
+AI_BREAKER_THRESHOLD = float(os.getenv("AI_BREAKER_THRESHOLD", "0.5"))
+AI_BREAKER_WINDOW = int(os.getenv("AI_BREAKER_WINDOW", "20"))
+AI_BREAKER_MIN_CALLS = int(os.getenv("AI_BREAKER_MIN_CALLS", "10"))
+AI_BREAKER_RESET_SECONDS = float(os.getenv("AI_BREAKER_RESET_SECONDS", "30"))
+
+# Parsed AI results are reused for identical input against an unchanged group
+# (same members and balances) for AI_CACHE_TTL seconds, per process.
+AI_CACHE_TTL = int(os.getenv("AI_CACHE_TTL", "3600"))
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "1024"))
+
+# Prompts are kept under this many estimated tokens (APP/prompts.py); long
+# inputs and member/balance lists of very large groups are trimmed to fit.
+AI_PROMPT_TOKEN_BUDGET = int(os.getenv("AI_PROMPT_TOKEN_BUDGET", "4000"))
+
+# Simple texts ("I paid 450 for pizza split with Rahul") are parsed locally
+# (APP/quickparse.py) when the rules are at least this confident; the rest go
+# to Gemini.
+QUICKPARSE_ENABLED = _env_bool("QUICKPARSE_ENABLED", default=True)
+QUICKPARSE_MIN_CONFIDENCE = float(os.getenv("QUICKPARSE_MIN_CONFIDENCE", "0.8"))
+
+# Receipt photos are downscaled, grayscaled and re-encoded before upload
+# (APP/imaging.py). Images declaring more pixels than RECEIPT_MAX_PIXELS are
+# rejected without being decoded.
+RECEIPT_MAX_EDGE = int(os.getenv("RECEIPT_MAX_EDGE", "1600"))
+RECEIPT_FORMAT = os.getenv("RECEIPT_FORMAT", "JPEG")  # JPEG or WEBP
+RECEIPT_QUALITY = int(os.getenv("RECEIPT_QUALITY", "80"))
+RECEIPT_MAX_PIXELS = int(os.getenv("RECEIPT_MAX_PIXELS", "50000000"))
+# Queued receipts are stored in the database until a worker runs them, so
+# uploads over RECEIPT_MAX_UPLOAD_BYTES are refused (413) up front.
+RECEIPT_MAX_UPLOAD_BYTES = int(os.getenv("RECEIPT_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# Imports are parsed in memory; larger history files are refused (413).
+IMPORT_MAX_UPLOAD_BYTES = int(os.getenv("IMPORT_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+
+# Stream uploads straight to a temporary file instead of buffering up to
+# 2.5MB of each one in memory.
+FILE_UPLOAD_HANDLERS = ["django.core.files.uploadhandler.TemporaryFileUploadHandler"]
+
+# -------------------------------------------------------------------
+# Metrics (/metrics needs Bearer METRICS_TOKEN; without a token it is 404
+# unless METRICS_PUBLIC is set, e.g. behind a private network)
+# -------------------------------------------------------------------
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+METRICS_PUBLIC = _env_bool("METRICS_PUBLIC", default=False)
+
 # -------------------------------------------------------------------
-# Cache (backend safety net)
+# Cache (shared between workers when CACHE_URL is set)
 # -------------------------------------------------------------------
+# CACHE_URL examples:
+#   redis://localhost:6379/0          Redis-protocol server (needs `pip install redis`)
+#   sqlite:///var/tmp/spendsplit.db   SQLite file on a single host
+# Unset: per-process memory, fine for development only.
+# Django's file cache is not offered: its incr is a read-then-write, so
+# concurrent group version bumps from two workers can be lost.
+# CACHE_MAX_ENTRIES caps the SQLite cache; writes cull expired rows.
+def _cache_backend(url: str | None) -> dict:
+    if not url:
+        return {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "spendsplit-cache",
+        }
+    parsed = urlparse(url)
+    if parsed.scheme in {"redis", "rediss"}:
+        return {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": url}
+    if parsed.scheme == "sqlite":
+        return {
+            "BACKEND": "APP.cache_backends.SQLiteCache",
+            "LOCATION": parsed.path,
+            "OPTIONS": {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", "50000"))},
+        }
+    raise ValueError(f"Unsupported CACHE_URL scheme: {parsed.scheme}")
+
+
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-        "LOCATION": "spendsplit-cache",
+        "BACKEND": "APP.cache_backends.SharedCache",
+        "KEY_PREFIX": os.getenv("CACHE_KEY_PREFIX", "spendsplit"),
+        "OPTIONS": {
+            **_cache_backend(os.getenv("CACHE_URL")),
+            "COMPRESS_MIN_BYTES": int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "1024")),
+        },
     }
 }
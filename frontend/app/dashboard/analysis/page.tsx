@@ -12,11 +12,14 @@ import {
 } from "@/components/ui/select";
 import DashHeader from "@/components/dashboard/dash-header";
 import { useAuth } from "@clerk/nextjs";
-import { fetchGroupExpenses } from "@/lib/api";
+import { fetchGroupExpensesSince } from "@/lib/api";
 import { getClerkJwt } from "@/lib/clerk-jwt";
 import { Skeleton } from "@/components/ui/skeleton";
 import { useGroupsContext } from "@/components/dashboard/groups-provider";
 
+// The charts cover at most the last 30 days, so no older history is loaded.
+const ANALYSIS_WINDOW_DAYS = 30;
+
 export default function AnalysisPage() {
   const { getToken } = useAuth();
   const { groups, loading: groupsLoading, isLoaded } = useGroupsContext();
@@ -36,11 +39,13 @@ export default function AnalysisPage() {
           return;
         }
 
-        // Fetch expenses from all groups
+        // Fetch recent expenses from all groups
+        const since = new Date();
+        since.setDate(since.getDate() - ANALYSIS_WINDOW_DAYS);
         const allExpenses = await Promise.all(
           groups.map(async (group) => {
             try {
-              const expenses = await fetchGroupExpenses(group.id, token);
+              const expenses = await fetchGroupExpensesSince(group.id, token, since);
               return expenses;
             } catch {
               return [];
@@ -86,7 +91,7 @@ export default function AnalysisPage() {
           <div className="flex flex-col gap-2">
             <h1 className="text-3xl font-bold tracking-tight">Analysis</h1>
             <p className="text-muted-foreground">
-              View your spending and income trends over time
+              View your spending and income trends over the last 30 days
             </p>
           </div>
 
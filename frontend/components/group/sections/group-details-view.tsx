@@ -42,7 +42,12 @@ import { formatIndianRupee } from "@/lib/utils";
 import { Skeleton } from "@/components/ui/skeleton";
 import { PerUserData } from "../per-user-data";
 import { Badge } from "@/components/ui/badge";
-import { API_URL, uploadReceipt, deleteExpense } from "@/lib/api";
+import {
+  API_URL,
+  uploadReceipt,
+  deleteExpense,
+  fetchGroupExpensesPage,
+} from "@/lib/api";
 import { useQuery } from "@tanstack/react-query";
 
 interface GroupDetailsViewProps {
@@ -70,6 +75,8 @@ export function GroupDetailsView({
   const [isLoading, setIsLoading] = React.useState(false);
   const [membersLoading, setMembersLoading] = React.useState(true);
   const [expensesLoading, setExpensesLoading] = React.useState(true);
+  const [nextCursor, setNextCursor] = React.useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = React.useState(false);
   const [selectedFile, setSelectedFile] = React.useState<File | null>(null);
   const fileInputRef = React.useRef<HTMLInputElement>(null);
   const [isDisputeDialogOpen, setIsDisputeDialogOpen] = React.useState(false);
@@ -111,19 +118,14 @@ export function GroupDetailsView({
       expensesInFlightRef.current = true;
       if (showLoading) setExpensesLoading(true);
       try {
-        const res = await fetch(`${API_URL}/groups/${id}/expenses`, {
-          headers: { Authorization: `Bearer ${token}` },
-        });
-        const data = await res.json();
-        if (Array.isArray(data)) {
-          setExpenses(data);
-        } else {
-          console.error("Expected array for expenses, got:", data);
-          setExpenses([]);
-        }
+        // Newest page only; older ones load on demand (loadMoreExpenses).
+        const page = await fetchGroupExpensesPage(parseInt(id), token);
+        setExpenses(page.items);
+        setNextCursor(page.next_cursor);
       } catch (err) {
         console.error(err);
         setExpenses([]);
+        setNextCursor(null);
       } finally {
         expensesInFlightRef.current = false;
         if (showLoading) setExpensesLoading(false);
@@ -138,6 +140,23 @@ export function GroupDetailsView({
     fetchExpenses({ showLoading: true });
   }, [fetchExpenses, token]);
 
+  const loadMoreExpenses = async () => {
+    if (!token || !nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const page = await fetchGroupExpensesPage(parseInt(id), token, nextCursor);
+      setExpenses((prev) => {
+        const seen = new Set(prev.map((ex) => ex.id));
+        return [...prev, ...page.items.filter((ex) => !seen.has(ex.id))];
+      });
+      setNextCursor(page.next_cursor);
+    } catch (err) {
+      console.error(err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const refreshDetails = async () => {
     if (!token) return;
     try {
@@ -537,6 +556,21 @@ export function GroupDetailsView({
                     </div>
                   ))
                 )}
+                {!expensesLoading && nextCursor && (
+                  <Button
+                    variant="ghost"
+                    size="sm"
+                    className="w-full text-muted-foreground"
+                    onClick={loadMoreExpenses}
+                    disabled={loadingMore}
+                  >
+                    {loadingMore ? (
+                      <IconLoader2 className="w-4 h-4 animate-spin" />
+                    ) : (
+                      "Load older transactions"
+                    )}
+                  </Button>
+                )}
               </div>
             ) : (
               <div className="space-y-2">
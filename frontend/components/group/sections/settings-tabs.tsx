@@ -16,8 +16,8 @@ import {
 } from "@tabler/icons-react";
 import {
   updateGroup,
-  fetchGroupExpenses,
-  fetchGroupLogs,
+  downloadGroupExport,
+  fetchGroupLogsPage,
   Expense,
   GroupLog,
   generateInviteLink,
@@ -205,16 +205,37 @@ export function ActivitySettings({ id }: ActivitySettingsProps) {
   const { getToken } = useAuth();
   const [logs, setLogs] = useState<GroupLog[]>([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     if (!id) return;
+    // Newest page only; older activity loads on demand (loadMore).
     getClerkJwt(getToken)
-      .then((token) => fetchGroupLogs(parseInt(id), token))
-      .then(setLogs)
+      .then((token) => fetchGroupLogsPage(parseInt(id), token))
+      .then((page) => {
+        setLogs(page.items);
+        setNextCursor(page.next_cursor);
+      })
       .catch(console.error)
       .finally(() => setLoading(false));
   }, [id, getToken]);
 
+  const loadMore = async () => {
+    if (!id || !nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const token = await getClerkJwt(getToken);
+      const page = await fetchGroupLogsPage(parseInt(id), token, nextCursor);
+      setLogs((prev) => [...prev, ...page.items]);
+      setNextCursor(page.next_cursor);
+    } catch (error) {
+      console.error(error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   return (
     <div className="space-y-6">
       <div>
@@ -253,6 +274,20 @@ export function ActivitySettings({ id }: ActivitySettingsProps) {
             </div>
           ))
         )}
+        {!loading && nextCursor && (
+          <Button
+            variant="outline"
+            className="w-full"
+            onClick={loadMore}
+            disabled={loadingMore}
+          >
+            {loadingMore ? (
+              <IconLoader2 className="w-4 h-4 animate-spin" />
+            ) : (
+              "Load older activity"
+            )}
+          </Button>
+        )}
       </div>
     </div>
   );
@@ -268,28 +303,17 @@ export function ExportSettings({ id }: ExportSettingsProps) {
     if (!id) return;
     try {
       const token = await getClerkJwt(getToken);
-      const expenses = await fetchGroupExpenses(parseInt(id), token);
-      const csvContent =
-        "Date,Description,Amount,Payer,Category\n" +
-        expenses
-          .map(
-            (e) =>
-              `${new Date(e.created_at).toLocaleDateString()},"${
-                e.description
-              }",${e.amount},"${e.payer.name}","${e.category}"`
-          )
-          .join("\n");
-
-      const blob = new Blob([csvContent], { type: "text/csv;charset=utf-8;" });
+      const { blob, filename } = await downloadGroupExport(parseInt(id), token, "csv");
       const link = document.createElement("a");
       if (link.download !== undefined) {
         const url = URL.createObjectURL(blob);
         link.setAttribute("href", url);
-        link.setAttribute("download", `group_${id}_expenses.csv`);
+        link.setAttribute("download", filename);
         link.style.visibility = "hidden";
         document.body.appendChild(link);
         link.click();
         document.body.removeChild(link);
+        URL.revokeObjectURL(url);
       }
     } catch (error) {
       console.error("Failed to export CSV", error);
@@ -176,30 +176,114 @@ export interface GroupLog {
   created_at: string;
 }
 
-export async function fetchGroupExpenses(
-  id: number,
-  token: string | null
-): Promise<Expense[]> {
-  const response = await fetch(`${API_URL}/groups/${id}/expenses`, {
+export interface Page<T> {
+  items: T[];
+  next_cursor: string | null;
+}
+
+/**
+ * Expense and log lists are cursor-paginated, newest first. Pass the
+ * previous page's `next_cursor` to get the one after it.
+ */
+async function fetchPage<T>(
+  url: string,
+  token: string | null,
+  errorMessage: string,
+  cursor?: string | null
+): Promise<Page<T>> {
+  const pageUrl = cursor ? `${url}?cursor=${encodeURIComponent(cursor)}` : url;
+  const response = await fetch(pageUrl, {
     headers: await authHeaders(token),
   });
   if (!response.ok) {
-    throw new Error("Failed to fetch group expenses");
+    throw new Error(errorMessage);
   }
   return response.json();
 }
 
-export async function fetchGroupLogs(
+/**
+ * Pages back until items are older than `since`; returns the newer ones.
+ * Lists are newest first, so this never reads further back than asked.
+ */
+async function fetchPagesSince<T extends { created_at: string }>(
+  url: string,
+  token: string | null,
+  errorMessage: string,
+  since: Date
+): Promise<T[]> {
+  const items: T[] = [];
+  let cursor: string | null = null;
+
+  do {
+    const page: Page<T> = await fetchPage<T>(url, token, errorMessage, cursor);
+    const recent = page.items.filter((item) => new Date(item.created_at) >= since);
+    items.push(...recent);
+    cursor = recent.length === page.items.length ? page.next_cursor : null;
+  } while (cursor);
+
+  return items;
+}
+
+export async function fetchGroupExpensesPage(
   id: number,
-  token: string | null
-): Promise<GroupLog[]> {
-  const response = await fetch(`${API_URL}/groups/${id}/logs`, {
-    headers: await authHeaders(token),
-  });
+  token: string | null,
+  cursor?: string | null
+): Promise<Page<Expense>> {
+  return fetchPage<Expense>(
+    `${API_URL}/groups/${id}/expenses`,
+    token,
+    "Failed to fetch group expenses",
+    cursor
+  );
+}
+
+export async function fetchGroupExpensesSince(
+  id: number,
+  token: string | null,
+  since: Date
+): Promise<Expense[]> {
+  return fetchPagesSince<Expense>(
+    `${API_URL}/groups/${id}/expenses`,
+    token,
+    "Failed to fetch group expenses",
+    since
+  );
+}
+
+export async function fetchGroupLogsPage(
+  id: number,
+  token: string | null,
+  cursor?: string | null
+): Promise<Page<GroupLog>> {
+  return fetchPage<GroupLog>(
+    `${API_URL}/groups/${id}/logs`,
+    token,
+    "Failed to fetch group logs",
+    cursor
+  );
+}
+
+/**
+ * Download a group's expenses from the streaming export endpoint. The
+ * server builds the file (formula-safe CSV, or NDJSON); the browser only
+ * saves it.
+ */
+export async function downloadGroupExport(
+  id: number,
+  token: string | null,
+  format: "csv" | "ndjson" = "csv"
+): Promise<{ blob: Blob; filename: string }> {
+  const response = await fetch(
+    `${API_URL}/groups/${id}/export?format=${format}`,
+    { headers: token ? { Authorization: `Bearer ${token}` } : {} }
+  );
   if (!response.ok) {
-    throw new Error("Failed to fetch group logs");
+    throw new Error("Failed to export group expenses");
   }
-  return response.json();
+  const disposition = response.headers.get("Content-Disposition") || "";
+  const filename =
+    /filename="([^"]+)"/.exec(disposition)?.[1] ?? `group_${id}_expenses.${format}`;
+  return { blob: await response.blob(), filename };
 }
 
 export async function deleteGroup(